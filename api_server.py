@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""
+HTTP API for Product Manager
+JSON API over users.db and the product databases (per-user files or the shared database), so the
+web frontend and other machines on the shop network can use the same data
+as the desktop app
+Usage: python api_server.py [--host 0.0.0.0] [--port 8765]
+
+Endpoints (GET or HEAD):
+  /api/users
+  /api/users/<username>/products?after=<id>&limit=<n>&q=<search text>
+  /api/users/<username>/products/<id>
+  /api/users/<username>/credits?before_date=<date>&before_id=<id>&limit=<n>
+  /api/users/<username>/statistics
+  /api/users/<username>/sync?cursor=<seq>&limit=<n>   (no cursor for a first sync)
+The only write is POST /api/users/<username>/sync with {"cursor": <seq>, "changes": [...]},
+which applies a client's changes and answers like a GET of the same cursor (see sync_engine.py)
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import queue
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from db_connection import connect
+from repository import (PRODUCT_COLUMNS, PRODUCT_LIST_COLUMNS, ChangeLogRepository, CreditRepository,
+                        ProductRepository, open_product_database)
+from shared_storage import (SharedChangeLogRepository, SharedCreditRepository, SharedProductRepository,
+                            open_shared_database, shared_storage_enabled, user_database)
+from sync_engine import SyncEngine
+
+API_PORT = 8765
+
+# Read connections kept open per user database
+POOL_SIZE = 4
+
+# Threads running SQLite queries for the event loop
+DB_WORKERS = 8
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Responses larger than this are gzipped for clients that accept it
+GZIP_MIN_BYTES = 1024
+
+# Longest request line or header accepted
+MAX_LINE_BYTES = 8192
+
+# Largest request body accepted (a sync push)
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+USERNAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+PRODUCT_LIST_FIELDS = [column.strip() for column in PRODUCT_LIST_COLUMNS.split(',')]
+PRODUCT_FIELDS = [column.strip() for column in PRODUCT_COLUMNS.split(',')]
+CREDIT_FIELDS = ['id', 'product_name', 'customer_name', 'total_amount', 'amount_paid',
+                 'amount_remaining', 'transaction_date']
+
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ConnectionPool:
+    """A fixed number of connections to one database, shared by the worker threads"""
+
+    def __init__(self, open_connection, size=POOL_SIZE):
+        self.open_connection = open_connection
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, opening one if the pool is not full yet"""
+        conn = None
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            if create:
+                try:
+                    conn = self.open_connection()
+                except Exception:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            else:
+                conn = self.idle.get()
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+    def close(self):
+        """Close the idle connections"""
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def open_reader(open_database, filename):
+    """Open a read-only connection usable from any worker thread"""
+    conn = open_database(filename, check_same_thread=False)
+    conn.execute('PRAGMA query_only=ON')
+    return conn
+
+
+def file_version(filename):
+    """Return a token that changes whenever a database (or its write-ahead log) is written"""
+    parts = []
+    for path in (filename, f'{filename}-wal'):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            parts.append('0-0')
+            continue
+        parts.append(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    return '-'.join(parts)
+
+
+def page_size(params):
+    """Return the limit query parameter, clamped to MAX_PAGE_SIZE"""
+    try:
+        limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, "limit must be a number")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def int_param(params, name, default=None):
+    """Return an integer query parameter"""
+    if name not in params:
+        return default
+    try:
+        return int(params[name])
+    except ValueError:
+        raise ApiError(400, f"{name} must be a number")
+
+
+class ApiServer:
+    def __init__(self, users_db='users.db', pool_size=POOL_SIZE, workers=DB_WORKERS):
+        self.users_db = users_db
+        self.pool_size = pool_size
+        self.pools = {}
+        self.pools_lock = threading.Lock()
+        self.users_pool = None
+        self.user_id_cache = None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-db")
+
+    # Databases
+
+    def user_pool(self, username, write=False):
+        """Return (connection pool, user_id filter) for a user's data
+
+        Per-user databases get a pool each; in shared storage mode every user
+        shares the pool of the shared database and rows are filtered by user_id.
+        With write, the pool holds the single connection that sync pushes write through.
+        """
+        if not USERNAME_PATTERN.match(username):
+            raise ApiError(404, f"Unknown user: {username}")
+
+        user_id = None
+        if shared_storage_enabled():
+            user_id = self.user_ids().get(username)
+            if user_id is None:
+                raise ApiError(404, f"Unknown user: {username}")
+
+        filename, user_id = user_database(username, user_id)
+        with self.pools_lock:
+            pool = self.pools.get((filename, write))
+            if pool is None:
+                # Only serve databases that exist; never create one for a typo
+                if not os.path.exists(filename):
+                    raise ApiError(404, f"Unknown user: {username}")
+                open_database = open_shared_database if user_id is not None else open_product_database
+                if write:
+                    # SQLite runs one write at a time anyway; pushes wait for the connection instead
+                    pool = ConnectionPool(lambda: open_database(filename, check_same_thread=False), 1)
+                else:
+                    pool = ConnectionPool(lambda: open_reader(open_database, filename), self.pool_size)
+                self.pools[(filename, write)] = pool
+        return pool, user_id
+
+    @contextmanager
+    def user_storage(self, username):
+        """Borrow a connection and return (products, credits) repositories for a user's data"""
+        pool, user_id = self.user_pool(username)
+        with pool.connection() as conn:
+            if user_id is None:
+                yield ProductRepository(conn), CreditRepository(conn)
+            else:
+                yield SharedProductRepository(conn, user_id), SharedCreditRepository(conn, user_id)
+
+    @contextmanager
+    def user_sync(self, username, write=False):
+        """Borrow a connection and return a SyncEngine over a user's data"""
+        pool, user_id = self.user_pool(username, write)
+        with pool.connection() as conn:
+            if user_id is None:
+                yield SyncEngine(ProductRepository(conn), CreditRepository(conn), ChangeLogRepository(conn))
+            else:
+                yield SyncEngine(SharedProductRepository(conn, user_id), SharedCreditRepository(conn, user_id),
+                                 SharedChangeLogRepository(conn, user_id))
+
+    def user_ids(self):
+        """Return {username: id}, re-read whenever users.db changes"""
+        version = file_version(self.users_db)
+        if self.user_id_cache is None or self.user_id_cache[0] != version:
+            with self.users_connection() as conn:
+                self.user_id_cache = (version, dict(conn.execute('SELECT username, id FROM users')))
+        return self.user_id_cache[1]
+
+    def users_connection(self):
+        """Borrow a connection to users.db"""
+        with self.pools_lock:
+            if self.users_pool is None:
+                if not os.path.exists(self.users_db):
+                    raise ApiError(404, "No users have been created yet")
+                self.users_pool = ConnectionPool(lambda: open_reader(connect, self.users_db), self.pool_size)
+        return self.users_pool.connection()
+
+    # Endpoints (run on the worker threads)
+
+    def list_users(self, params):
+        with self.users_connection() as conn:
+            rows = conn.execute('''
+                SELECT username, full_name, location, business_name, usd_to_dzd_rate
+                FROM users ORDER BY username
+            ''').fetchall()
+        return {'items': [dict(zip(('username', 'full_name', 'location', 'business_name', 'usd_to_dzd_rate'),
+                                   row)) for row in rows]}
+
+    def list_products(self, username, params):
+        limit = page_size(params)
+        with self.user_storage(username) as (products, credits):
+            text = params.get('q', '').strip()
+            if text:
+                rows = products.search(text, limit)
+                return {'items': [dict(zip(PRODUCT_LIST_FIELDS, row)) for row in rows], 'next': None}
+            rows = products.page(int_param(params, 'after', 0), limit)
+
+        next_url = None
+        if len(rows) == limit:
+            next_url = f"/api/users/{username}/products?" + urlencode({'after': rows[-1][0], 'limit': limit})
+        return {'items': [dict(zip(PRODUCT_LIST_FIELDS, row)) for row in rows], 'next': next_url}
+
+    def get_product(self, username, product_id, params):
+        with self.user_storage(username) as (products, credits):
+            row = products.get(int(product_id))
+        if row is None:
+            raise ApiError(404, f"Product {product_id} not found")
+        return dict(zip(PRODUCT_FIELDS, row))
+
+    def list_credits(self, username, params):
+        limit = page_size(params)
+        before = None
+        if 'before_date' in params or 'before_id' in params:
+            before = (params.get('before_date', ''), int_param(params, 'before_id', 0))
+        with self.user_storage(username) as (products, credits):
+            rows = credits.page(before, limit)
+
+        next_url = None
+        if len(rows) == limit:
+            next_url = f"/api/users/{username}/credits?" + urlencode(
+                {'before_date': rows[-1][6], 'before_id': rows[-1][0], 'limit': limit})
+        return {'items': [dict(zip(CREDIT_FIELDS, row)) for row in rows], 'next': next_url}
+
+    def statistics(self, username, params):
+        """Same figures as the web store's getAnalytics, computed in SQL"""
+        with self.user_storage(username) as (products, credits):
+            total, in_stock, sold, reserved, revenue, cost = products.statistics()
+            total_credits, total_paid, total_outstanding = credits.summary()
+        profit = revenue - cost
+        return {
+            'products': {'totalProducts': total, 'inStock': in_stock, 'sold': sold, 'reserved': reserved},
+            'financial': {'totalRevenue': revenue, 'totalCost': cost, 'totalProfit': profit},
+            'credits': {'totalCredits': total_credits, 'totalPaid': total_paid,
+                        'totalOutstanding': total_outstanding},
+            'lowStock': [],
+            'profitMargin': (profit / revenue) * 100 if revenue > 0 else 0,
+        }
+
+    def pull_changes(self, username, params):
+        """A page of the rows changed since the cursor parameter"""
+        options = self.pull_options(params)
+        with self.user_sync(username) as sync:
+            return self.pull_result(username, sync, options)
+
+    def push_changes(self, username, params, body):
+        """Apply a client's changes, then answer like pull_changes from the same cursor"""
+        try:
+            request = json.loads(body)
+        except ValueError:
+            raise ApiError(400, "The request body must be JSON")
+        if not isinstance(request, dict):
+            raise ApiError(400, "The request body must be an object")
+        cursor = request.get('cursor')
+        if cursor is not None and (not isinstance(cursor, int) or cursor < 0):
+            raise ApiError(400, "cursor must be a positive number")
+
+        params = {name: value for name, value in params.items() if name != 'cursor'}
+        if cursor is not None:
+            params['cursor'] = cursor
+        options = self.pull_options(params)
+        with self.user_sync(username, write=True) as sync:
+            try:
+                # A client that never synced has only new rows to push
+                result = sync.push(cursor or 0, request.get('changes', []))
+            except ValueError as e:
+                raise ApiError(400, str(e))
+            result.update(self.pull_result(username, sync, options))
+        return result
+
+    def pull_options(self, params):
+        """Return the SyncEngine.pull() arguments given by query parameters"""
+        options = {'cursor': int_param(params, 'cursor'), 'limit': page_size(params),
+                   'snapshot': int_param(params, 'snapshot')}
+        if options['cursor'] is not None and options['cursor'] < 0:
+            raise ApiError(400, "cursor must be a positive number")
+        if 'after_table' in params:
+            options['after'] = (params['after_table'], int_param(params, 'after_id', 0))
+        return options
+
+    def pull_result(self, username, sync, options):
+        """Run a pull and turn its next page arguments into a URL"""
+        try:
+            result = sync.pull(**options)
+        except ValueError as e:
+            raise ApiError(400, str(e))
+        next_page = result.pop('next')
+        result['next'] = None
+        if next_page is not None:
+            if 'snapshot' in next_page:
+                query = {'snapshot': next_page['snapshot'], 'after_table': next_page['after'][0],
+                         'after_id': next_page['after'][1], 'limit': options['limit']}
+            else:
+                query = {'cursor': next_page['cursor'], 'limit': options['limit']}
+            result['next'] = f"/api/users/{username}/sync?" + urlencode(query)
+        return result
+
+    ROUTES = [
+        (re.compile(r'^/api/users$'), 'list_users'),
+        (re.compile(r'^/api/users/([^/]+)/products$'), 'list_products'),
+        (re.compile(r'^/api/users/([^/]+)/products/(\d+)$'), 'get_product'),
+        (re.compile(r'^/api/users/([^/]+)/credits$'), 'list_credits'),
+        (re.compile(r'^/api/users/([^/]+)/statistics$'), 'statistics'),
+        (re.compile(r'^/api/users/([^/]+)/sync$'), 'pull_changes'),
+    ]
+    # Handlers take the request body as a last argument
+    POST_ROUTES = [
+        (re.compile(r'^/api/users/([^/]+)/sync$'), 'push_changes'),
+    ]
+
+    def route(self, path, routes=ROUTES):
+        """Return (handler, path arguments, database file) for a request path"""
+        for pattern, name in routes:
+            match = pattern.match(path)
+            if match:
+                args = match.groups()
+                filename = user_database(args[0], None)[0] if args else self.users_db
+                return getattr(self, name), args, filename
+        raise ApiError(404, f"No such endpoint: {path}")
+
+    # HTTP
+
+    async def respond(self, method, target, headers, body=b''):
+        """Return (status, extra headers, body) for one request"""
+        if method == 'OPTIONS':
+            return 200, {'Access-Control-Allow-Methods': 'GET, HEAD, POST, OPTIONS',
+                         'Access-Control-Allow-Headers': 'If-None-Match, Content-Type'}, b''
+        if method not in ('GET', 'HEAD', 'POST'):
+            raise ApiError(405, f"{method} is not supported")
+
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        loop = asyncio.get_running_loop()
+        if method == 'POST':
+            try:
+                handler, args, filename = self.route(url.path, self.POST_ROUTES)
+            except ApiError:
+                raise ApiError(405, f"{url.path} is read-only")
+            result = await loop.run_in_executor(self.executor, lambda: handler(*args, params, body))
+            return 200, {}, json.dumps(result, ensure_ascii=False).encode('utf-8')
+
+        handler, args, filename = self.route(url.path)
+
+        # The data can only have changed if the database file or its log did;
+        # answer repeat requests without touching SQLite at all
+        etag = f'"{file_version(filename)}-{zlib.crc32(target.encode()):x}"'
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            return 304, {'ETag': etag}, b''
+
+        result = await loop.run_in_executor(self.executor, lambda: handler(*args, params))
+        body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+
+        extra = {'ETag': etag, 'Vary': 'Accept-Encoding'}
+        if len(body) >= GZIP_MIN_BYTES and 'gzip' in headers.get('accept-encoding', ''):
+            body = await loop.run_in_executor(self.executor, gzip.compress, body, 5)
+            extra['Content-Encoding'] = 'gzip'
+        return 200, extra, body
+
+    async def handle_client(self, reader, writer):
+        """Serve the requests of one (keep-alive) connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                if len(request_line) > MAX_LINE_BYTES:
+                    await self.send(writer, 'GET', 400, {}, self.error_body("Request line too long"), close=True)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.send(writer, 'GET', 400, {}, self.error_body("Malformed request"), close=True)
+                    break
+
+                # Only sync pushes use a body, but it must never be read as the next request;
+                # without a valid length the next request cannot be found, so close
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.send(writer, method, 400, {}, self.error_body("Invalid Content-Length"), close=True)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.send(writer, method, 413, {}, self.error_body("Request body too large"), close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                close = (version == 'HTTP/1.0' or headers.get('connection', '').lower() == 'close')
+                try:
+                    status, extra, body = await self.respond(method, target, headers, body)
+                except ApiError as e:
+                    status, extra, body = e.status, {}, self.error_body(str(e))
+                except Exception as e:
+                    print(f"Error serving {target}: {e}")
+                    status, extra, body = 500, {}, self.error_body("Internal server error")
+
+                await self.send(writer, method, status, extra, body, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def error_body(self, message):
+        return json.dumps({'error': message}).encode('utf-8')
+
+    async def send(self, writer, method, status, extra, body, close):
+        """Write one response"""
+        headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+            'Content-Length': str(len(body)),
+            'Cache-Control': 'no-cache',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag',
+            'Connection': 'close' if close else 'keep-alive',
+        }
+        headers.update(extra)
+        head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        head += ''.join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+        writer.write(head.encode('latin-1'))
+        if method != 'HEAD' and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        """Accept connections until cancelled"""
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Product Manager API listening on http://{host}:{port}/api/users")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """Stop the workers and close every pooled connection"""
+        self.executor.shutdown(wait=True)
+        for pool in self.pools.values():
+            pool.close()
+        if self.users_pool:
+            self.users_pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the product databases over HTTP")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (0.0.0.0 for the whole network)")
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE, help="connections per user database")
+    args = parser.parse_args()
+
+    server = ApiServer(pool_size=args.pool_size)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Product Management System
+Run from the project root, e.g.: python -m benchmarks.query_plans
+"""
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Data Path Benchmark
+Times the product and credit operations of the desktop app headlessly on
+synthetic databases of several sizes and writes the results as JSON
+Usage: python -m benchmarks.data_paths [--sizes 1000 100000 1000000] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sample_data_multiuser import build_product_database, random_product
+from repository import CreditRepository, ProductRepository, open_product_database
+
+# Rows fetched per page by the product list (see PRODUCT_PAGE_SIZE in the GUI)
+PAGE_SIZE = 100
+
+
+def time_operation(operation, runs):
+    """Call operation runs times and return the timings in milliseconds"""
+    timings = []
+    for i in range(runs):
+        started = time.perf_counter()
+        operation(i)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(size, name, timings):
+    """Return the JSON record for one operation at one database size"""
+    ordered = sorted(timings)
+    return {
+        'size': size,
+        'operation': name,
+        'runs': len(timings),
+        'median_ms': round(statistics.median(ordered), 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        'max_ms': round(ordered[-1], 4),
+        'ops_per_sec': round(1000 / statistics.mean(ordered), 1) if statistics.mean(ordered) else None,
+    }
+
+
+def benchmark_size(conn, size, runs):
+    """Run every operation against one database and return their records"""
+    products = ProductRepository(conn)
+    credits = CreditRepository(conn)
+    rng = random.Random(size)
+    start_date = datetime(2024, 1, 1)
+    max_id = conn.execute('SELECT MAX(id) FROM products').fetchone()[0] or 0
+
+    # Products to sell on credit, prepared up front so only the sale is timed
+    in_stock = [row[0] for row in conn.execute(
+        "SELECT id FROM products WHERE status='In Stock' LIMIT ?", (runs,))]
+
+    operations = [
+        # add_product: one insert and one commit, as the GUI does per click
+        ('add_product', lambda i: products.add(random_product(rng, 134.5, start_date))),
+        # load_products: the first page shown when the product tab opens
+        ('load_products_first_page', lambda i: products.page(0, PAGE_SIZE)),
+        # scrolling: a page somewhere in the middle of the catalog
+        ('load_products_page', lambda i: products.page(rng.randrange(max_id), PAGE_SIZE)),
+        # clicking the Sale Price heading, then filtering on a status
+        ('sort_products_by_price', lambda i: products.sorted_page('sale_price', True, limit=PAGE_SIZE)),
+        ('filter_sort_products', lambda i: products.sorted_page(
+            'sale_price', True, rng.choice(['In Stock', 'Sold', 'Reserved']), limit=PAGE_SIZE)),
+        ('get_product', lambda i: products.get(rng.randrange(1, max_id + 1))),
+        ('search_products', lambda i: products.search(rng.choice(['mac', 'galaxy s', 'air', 'legion 5']))),
+        ('update_credit_products', lambda i: products.in_stock()),
+        ('create_credit_sale', lambda i: credits.create_sale(
+            in_stock[i % len(in_stock)], 'Benchmark Customer', 1000.0, 400.0) if in_stock else None),
+        ('load_credit_transactions', lambda i: credits.list_rows()),
+        ('update_credit_summary', lambda i: credits.summary()),
+    ]
+
+    results = []
+    for name, operation in operations:
+        # Full-table reads get fewer runs on big databases to keep the suite quick
+        operation_runs = runs if name not in ('update_credit_products', 'load_credit_transactions') \
+            else max(3, min(runs, 2000000 // max(size, 1)))
+        timings = time_operation(operation, operation_runs)
+        results.append(summarize(size, name, timings))
+        print(f"  {name:28} median {results[-1]['median_ms']:9.3f} ms   p95 {results[-1]['p95_ms']:9.3f} ms",
+              file=sys.stderr)
+    return results
+
+
+def git_revision():
+    """Return the current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results):
+    """Print how each median changed relative to a previous results file"""
+    previous = {(r['size'], r['operation']): r['median_ms'] for r in baseline['results']}
+    print(f"Compared with {baseline.get('git_revision') or 'baseline'}:", file=sys.stderr)
+    for result in results:
+        before = previous.get((result['size'], result['operation']))
+        if not before:
+            continue
+        change = (result['median_ms'] - before) / before * 100
+        print(f"  {result['size']:>8} {result['operation']:28} {before:9.3f} -> "
+              f"{result['median_ms']:9.3f} ms ({change:+.0f}%)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the product and credit data paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000],
+                        help="number of products in each synthetic database")
+    parser.add_argument('--runs', type=int, default=200, help="timed runs per operation")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the synthetic data")
+    parser.add_argument('--fixtures', help="directory to keep generated databases in and reuse them from")
+    parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='product_bench_')
+    fixture_dir = args.fixtures or work_dir
+    os.makedirs(fixture_dir, exist_ok=True)
+
+    results = []
+    try:
+        for size in args.sizes:
+            fixture = os.path.join(fixture_dir, f'products_bench_{size}_{args.seed}.db')
+            if not os.path.exists(fixture):
+                print(f"Generating {size} products...", file=sys.stderr)
+                started = time.perf_counter()
+                build_product_database(fixture, size, seed=args.seed).close()
+                print(f"  generated in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+            # Work on a copy so the timed writes never change the fixture
+            scratch = os.path.join(work_dir, f'run_{size}.db')
+            shutil.copyfile(fixture, scratch)
+            conn = open_product_database(scratch)
+            try:
+                print(f"Benchmarking {size} products", file=sys.stderr)
+                results.extend(benchmark_size(conn, size, args.runs))
+            finally:
+                conn.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Connection Settings Benchmark
+Measures the one-commit-per-click writes of add_product and create_credit_sale
+with SQLite's default settings and with db_connection.connect()
+Usage: python -m benchmarks.pragmas [--products 10000] [--runs 1000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sample_data_multiuser import build_product_database, random_product
+from db_connection import connect
+from db_schema import migrate
+from repository import CreditRepository, ProductRepository
+
+
+def open_default(filename):
+    """Open a database the way the apps did before db_connection: rollback journal, synchronous FULL"""
+    conn = sqlite3.connect(filename)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    migrate(conn)
+    return conn
+
+
+def open_tuned(filename):
+    """Open a database through the shared connection factory"""
+    conn = connect(filename)
+    migrate(conn)
+    return conn
+
+
+def time_writes(conn, runs):
+    """Return (add_product, create_credit_sale) timings in milliseconds, one commit each"""
+    products = ProductRepository(conn)
+    credits = CreditRepository(conn)
+    rng = random.Random(1)
+    start_date = datetime(2024, 1, 1)
+    in_stock = [row[0] for row in conn.execute(
+        "SELECT id FROM products WHERE status='In Stock' LIMIT ?", (runs,))]
+
+    adds = []
+    for _ in range(runs):
+        product = random_product(rng, 134.5, start_date)
+        started = time.perf_counter()
+        products.add(product)
+        adds.append((time.perf_counter() - started) * 1000)
+
+    sales = []
+    for i in range(runs):
+        started = time.perf_counter()
+        credits.create_sale(in_stock[i % len(in_stock)], 'Benchmark Customer', 1000.0, 400.0)
+        sales.append((time.perf_counter() - started) * 1000)
+    return adds, sales
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare default and tuned SQLite connection settings")
+    parser.add_argument('--products', type=int, default=10000, help="products in the test database")
+    parser.add_argument('--runs', type=int, default=1000, help="commits timed per operation")
+    parser.add_argument('--dir', help="directory for the test databases (use the disk the app runs on)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='product_pragmas_', dir=args.dir)
+    try:
+        fixture = os.path.join(work_dir, 'fixture.db')
+        print(f"Generating {args.products} products...")
+        conn = build_product_database(fixture, args.products)
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+
+        results = {}
+        for label, opener in (('default', open_default), ('tuned', open_tuned)):
+            filename = os.path.join(work_dir, f'{label}.db')
+            shutil.copyfile(fixture, filename)
+            conn = opener(filename)
+            try:
+                mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+                synchronous = conn.execute('PRAGMA synchronous').fetchone()[0]
+                results[label] = time_writes(conn, args.runs)
+            finally:
+                conn.close()
+            print(f"{label:8} journal_mode={mode} synchronous={synchronous}")
+
+        print(f"\n{'operation':20} {'default':>16} {'tuned':>16} {'speedup':>8}")
+        for index, name in enumerate(('add_product', 'create_credit_sale')):
+            before = statistics.median(results['default'][index])
+            after = statistics.median(results['tuned'][index])
+            print(f"{name:20} {before:10.3f} ms/op {after:10.3f} ms/op {before / after:7.1f}x")
+            print(f"{'':20} {1000 / before:9.0f} ops/s {1000 / after:9.0f} ops/s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
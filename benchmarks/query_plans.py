@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Query Plan Benchmark
+Builds a product database at schema version 1 (no secondary indexes), times the
+hot queries and prints their plans, then migrates it and runs them again
+Usage: python -m benchmarks.query_plans [--products 100000] [--credits 20000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from db_schema import get_schema_version, migrate
+
+CATEGORIES = ['ordinateur-portable', 'smartphone', 'tablet', 'accessoires', 'other']
+STATUSES = ['In Stock', 'Sold', 'Reserved', 'Damaged']
+
+# The queries the GUI runs on every credit tab refresh
+QUERIES = {
+    'in-stock dropdown': 'SELECT id, name, sale_price FROM products WHERE status="In Stock"',
+    'credits of a product': 'SELECT id FROM credit_transactions WHERE product_id=?',
+    'credit list (newest first)': '''
+        SELECT ct.id, p.name, ct.customer_name,
+               (ct.amount_paid + ct.amount_remaining) as total,
+               ct.amount_paid, ct.amount_remaining, ct.transaction_date
+        FROM credit_transactions ct
+        JOIN products p ON ct.product_id = p.id
+        ORDER BY ct.transaction_date DESC
+        LIMIT 100
+    ''',
+}
+
+
+def build_database(filename, product_count, credit_count):
+    """Create a version 1 database filled with random products and credits"""
+    rng = random.Random(42)
+    conn = sqlite3.connect(filename)
+    migrate(conn, target_version=1)
+
+    start = datetime(2024, 1, 1)
+    products = []
+    for i in range(product_count):
+        cost = round(rng.uniform(20, 1500), 2)
+        products.append((f"Product {i}", rng.choice(CATEGORIES), cost, cost * 134.5,
+                         round(cost * 0.07, 2), round(cost * 1.35, 2), rng.choice(STATUSES)))
+    with conn:
+        conn.executemany('''
+            INSERT INTO products (name, category, cost_price_usd, cost_price_dzd,
+                                  transport_price, sale_price, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', products)
+
+    credits = []
+    for i in range(credit_count):
+        paid = round(rng.uniform(0, 500), 2)
+        date = start + timedelta(minutes=rng.randrange(60 * 24 * 365))
+        credits.append((rng.randint(1, product_count), f"Customer {i % 500}", paid,
+                        round(rng.uniform(0, 800), 2), date.strftime("%Y-%m-%d %H:%M:%S")))
+    with conn:
+        conn.executemany('''
+            INSERT INTO credit_transactions (product_id, customer_name, amount_paid,
+                                             amount_remaining, transaction_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', credits)
+
+    conn.execute('ANALYZE')
+    return conn
+
+
+def report(conn, product_count, repeat):
+    """Print the plan and the best-of-N time for each query"""
+    print(f"\n--- schema version {get_schema_version(conn)} ---")
+    for label, sql in QUERIES.items():
+        params = (product_count // 2,) if '?' in sql else ()
+        plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        print(f"{label}: {best * 1000:.2f} ms")
+        for row in plan:
+            print(f"    {row[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query plans before and after the index migration")
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--credits', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'products_benchmark.db')
+        print(f"Building {args.products} products and {args.credits} credits...")
+        conn = build_database(filename, args.products, args.credits)
+        try:
+            report(conn, args.products, args.repeat)
+            migrate(conn)
+            conn.execute('ANALYZE')
+            report(conn, args.products, args.repeat)
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    main()
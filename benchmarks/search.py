@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Product Search Benchmark
+Builds a catalog of random products and measures full-text prefix search latency
+Usage: python -m benchmarks.search [--products 200000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from db_schema import migrate
+from product_search import search_products
+
+BRANDS = ['Lenovo', 'Dell', 'HP', 'Asus', 'Acer', 'Apple', 'Samsung', 'Xiaomi', 'Huawei',
+          'Microsoft', 'Sony', 'Logitech', 'Anker', 'Oppo', 'Realme', 'Toshiba', 'MSI']
+MODELS = ['ThinkPad', 'Legion', 'IdeaPad', 'XPS', 'Inspiron', 'Latitude', 'Pavilion', 'EliteBook',
+          'ROG', 'Zenbook', 'Vivobook', 'Aspire', 'MacBook', 'iPhone', 'iPad', 'Galaxy', 'Redmi',
+          'MateBook', 'Surface', 'Xperia', 'PowerCore', 'Satellite', 'Katana', 'Predator']
+SUFFIXES = ['Pro', 'Air', 'Max', 'Ultra', 'Lite', 'Plus', 'Mini', 'Gaming', 'Carbon', 'Slim']
+CATEGORIES = ['ordinateur-portable', 'smartphone', 'tablet', 'accessoires', 'other']
+NOTES = ['', '', 'original box', 'refurbished', 'warranty 1 year', 'scratched lid',
+         'french keyboard', 'arabic keyboard', 'dual sim', 'charger missing']
+
+# Prefixes a user might type, one keystroke at a time
+QUERIES = ['t', 'th', 'think', 'thinkpad c', 'gal', 'galaxy ultra', 'mac air', 'ref', 'smart', 'asus rog 1']
+
+
+def build_catalog(filename, product_count):
+    """Create a migrated database with product_count random products"""
+    rng = random.Random(7)
+    conn = sqlite3.connect(filename)
+    migrate(conn)
+    rows = []
+    for _ in range(product_count):
+        name = f"{rng.choice(BRANDS)} {rng.choice(MODELS)} {rng.randint(1, 20)} {rng.choice(SUFFIXES)}"
+        rows.append((name, rng.choice(CATEGORIES),
+                     f"{rng.randint(10, 45)}cm x {rng.randint(5, 30)}cm x {rng.randint(1, 5)}cm",
+                     rng.choice(NOTES)))
+    with conn:
+        conn.executemany('INSERT INTO products (name, category, package_size, notes) VALUES (?, ?, ?, ?)', rows)
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure product search latency")
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Building {args.products} products...")
+        conn = build_catalog(os.path.join(tmp, 'products_benchmark.db'), args.products)
+        cursor = conn.cursor()
+        try:
+            for text in QUERIES:
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    rows = search_products(cursor, text, 'id, name, category, sale_price, status')
+                    timings.append((time.perf_counter() - started) * 1000)
+                print(f"{text!r:16} {len(rows):4} rows  median {statistics.median(timings):6.2f} ms"
+                      f"  max {max(timings):6.2f} ms")
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    main()
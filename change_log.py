@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Change Log for Product Manager
+Reads the append-only log of product, credit and payment changes kept in every
+product database (schema version 9), and rebuilds the data as it was at any time
+Usage: python change_log.py tail USERNAME [--after SEQ | --new] [--follow]
+       python change_log.py history USERNAME TABLE ROW_ID
+       python change_log.py at USERNAME TIMESTAMP
+       python change_log.py snapshot USERNAME
+
+Changes are printed as one JSON object per line, so another program can tail
+them (--follow) and resume from the last seq it read (--after).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from db_schema import LOGGED_TABLES
+from repository import CHANGE_PAGE_SIZE
+from shared_storage import load_users, open_user_storage, user_change_log, user_database
+
+# How often tail --follow checks for new changes (seconds)
+FOLLOW_INTERVAL = 1.0
+
+
+def change_json(change):
+    """Return a change log entry as one line of JSON"""
+    seq, changed_at, table, row_id, operation, data = change
+    return json.dumps({'seq': seq, 'changed_at': changed_at, 'table': table, 'row_id': row_id,
+                       'operation': operation, 'data': None if data is None else json.loads(data)})
+
+
+def tail(change_log, after, follow):
+    """Print the changes after seq after; with follow, keep printing new ones until interrupted"""
+    while True:
+        changes = change_log.changes(after)
+        for change in changes:
+            print(change_json(change), flush=True)
+        if changes:
+            after = changes[-1][0]
+        if len(changes) < CHANGE_PAGE_SIZE:
+            if not follow:
+                return
+            time.sleep(FOLLOW_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read a user's product and credit change log")
+    commands = parser.add_subparsers(dest='command', required=True)
+    tail_parser = commands.add_parser('tail', help="print the changes, oldest first")
+    tail_parser.add_argument('username')
+    start = tail_parser.add_mutually_exclusive_group()
+    start.add_argument('--after', type=int, default=0, metavar='SEQ', help="start after this change")
+    start.add_argument('--new', action='store_true', help="skip the changes made so far")
+    tail_parser.add_argument('--follow', action='store_true', help="keep printing new changes")
+    history_parser = commands.add_parser('history', help="print every change to one row")
+    history_parser.add_argument('username')
+    history_parser.add_argument('table', choices=list(LOGGED_TABLES))
+    history_parser.add_argument('row_id', type=int)
+    at_parser = commands.add_parser('at', help="print every row as it was at a time")
+    at_parser.add_argument('username')
+    at_parser.add_argument('timestamp', help="local time, 'YYYY-MM-DD HH:MM:SS'")
+    snapshot_parser = commands.add_parser('snapshot', help="take a snapshot now")
+    snapshot_parser.add_argument('username')
+    args = parser.parse_args()
+
+    users = load_users()
+    if args.username not in users:
+        parser.error(f"unknown user: {args.username}")
+    filename, _ = user_database(args.username, users[args.username])
+    if not os.path.exists(filename):
+        parser.error(f"{args.username} has no data ({filename} does not exist)")
+
+    conn, _, _ = open_user_storage(args.username, users[args.username])
+    try:
+        change_log = user_change_log(conn, users[args.username])
+        if args.command == 'tail':
+            try:
+                tail(change_log, change_log.last_seq() if args.new else args.after, args.follow)
+            except KeyboardInterrupt:
+                pass
+        elif args.command == 'history':
+            for change in change_log.history(args.table, args.row_id):
+                print(change_json(change))
+        elif args.command == 'at':
+            try:
+                state = change_log.state_at(args.timestamp)
+            except ValueError as e:
+                print(e)
+                sys.exit(1)
+            json.dump(state, sys.stdout, indent=2)
+            print()
+        else:
+            print(f"{args.username}: snapshot of {change_log.snapshot()} rows")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Change Tracker for Product Manager
+Records which product and credit rows a mutation touched so the GUI
+can refresh only those rows instead of reloading whole tables
+"""
+
+
+class ChangeTracker:
+    def __init__(self):
+        self.product_ids = set()
+        self.credit_ids = set()
+
+    def product_changed(self, product_id):
+        """Record that a product row was inserted, updated or deleted"""
+        self.product_ids.add(int(product_id))
+
+    def credit_changed(self, credit_id):
+        """Record that a credit transaction row was inserted, updated or deleted"""
+        self.credit_ids.add(int(credit_id))
+
+    def has_changes(self):
+        """Return True if any row was touched since the last drain"""
+        return bool(self.product_ids or self.credit_ids)
+
+    def drain(self):
+        """Return the touched product and credit ids and reset the tracker"""
+        product_ids, credit_ids = self.product_ids, self.credit_ids
+        self.product_ids, self.credit_ids = set(), set()
+        return product_ids, credit_ids
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Data Export for Product Manager
+Streams products, credit transactions and payments to CSV, NDJSON or Parquet in
+fixed-size chunks, and snapshots whole databases with the SQLite online
+backup API
+Usage: python data_export.py --user USERNAME OUTPUT (.db, .csv, .ndjson or .parquet)
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from db_connection import connect
+from repository import PRODUCT_COLUMNS
+from shared_storage import extract_user_database, load_users, user_database
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+# Rows fetched from the cursor and written at a time
+CHUNK_SIZE = 5000
+
+# Database pages copied per backup step; other connections may write between steps
+BACKUP_PAGES = 1024
+
+# Exported tables: (file suffix, query, [(column, type)]). {where} limits the
+# rows to one user when exporting from the shared database.
+EXPORTS = [
+    ('', f'SELECT {PRODUCT_COLUMNS} FROM products {{where}} ORDER BY id', [
+        ('id', 'integer'), ('name', 'text'), ('category', 'text'),
+        ('cost_price_usd', 'real'), ('cost_price_dzd', 'real'), ('transport_price', 'real'),
+        ('sale_price', 'real'), ('picture_path', 'text'), ('package_size', 'text'),
+        ('package_image_path', 'text'), ('arrival_date', 'text'), ('sale_date', 'text'),
+        ('status', 'text'), ('notes', 'text'),
+    ]),
+    ('_credits', '''SELECT id, product_id, customer_name, amount_paid, amount_remaining, transaction_date
+                    FROM credit_transactions {where} ORDER BY id''', [
+        ('id', 'integer'), ('product_id', 'integer'), ('customer_name', 'text'),
+        ('amount_paid', 'real'), ('amount_remaining', 'real'), ('transaction_date', 'text'),
+    ]),
+    # credit_payments has no user_id of its own; the one in {where} is the credit's
+    ('_payments', '''SELECT p.id, p.credit_id, p.amount, p.payment_date, p.kind
+                     FROM credit_payments p JOIN credit_transactions ct ON ct.id = p.credit_id
+                     {where} ORDER BY p.id''', [
+        ('id', 'integer'), ('credit_id', 'integer'), ('amount', 'real'),
+        ('payment_date', 'text'), ('kind', 'text'),
+    ]),
+]
+
+FORMATS = ('db', 'csv', 'ndjson', 'parquet')
+
+
+def export_format(path):
+    """Return the export format implied by a file name"""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    extension = {'jsonl': 'ndjson', 'json': 'ndjson', 'sqlite': 'db'}.get(extension, extension)
+    if extension not in FORMATS:
+        raise ValueError(f"Unsupported export format: .{extension} (use .db, .csv, .ndjson or .parquet)")
+    if extension == 'parquet' and pyarrow is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    return extension
+
+
+def output_paths(path):
+    """Return the file each exported table is written to: products to path, credits and payments next to it"""
+    base, extension = os.path.splitext(path)
+    return [f"{base}{suffix}{extension}" for suffix, _, _ in EXPORTS]
+
+
+def backup_database(db_filename, path, progress=None):
+    """Copy a live database to path with the online backup API
+
+    The copy is consistent even while the app is writing: SQLite restarts the
+    step sequence if another connection changes the source mid-backup.
+    """
+    source = connect(db_filename)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target, pages=BACKUP_PAGES,
+                      progress=(lambda status, remaining, total: progress(total - remaining, total))
+                      if progress else None)
+        # The copied header says WAL; make the backup a single self-contained file
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+
+
+def iter_chunks(cursor):
+    """Yield the rows of an executed cursor in CHUNK_SIZE lists"""
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            return
+        yield rows
+
+
+def write_csv(chunks, columns, path):
+    """Write rows to a CSV file with a header row"""
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in columns])
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+            yield count
+
+
+def write_ndjson(chunks, columns, path):
+    """Write rows as one JSON object per line"""
+    names = [name for name, _ in columns]
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for rows in chunks:
+            f.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in rows)
+            count += len(rows)
+            yield count
+
+
+def write_parquet(chunks, columns, path):
+    """Write rows to a Parquet file, one row group per chunk"""
+    types = {'integer': pyarrow.int64(), 'real': pyarrow.float64(), 'text': pyarrow.string()}
+    schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            arrays = [pyarrow.array([row[i] for row in rows], type=field.type)
+                      for i, field in enumerate(schema)]
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=schema))
+            count += len(rows)
+            yield count
+
+
+WRITERS = {'csv': write_csv, 'ndjson': write_ndjson, 'parquet': write_parquet}
+
+
+def export_tables(db_filename, path, fmt, progress=None, user_id=None):
+    """Stream products, credits and payments to files next to path, returns the row counts
+
+    All tables are read in one read transaction so they agree with each other.
+    progress, if given, is called with (table file, rows written) after every chunk.
+    user_id limits the export to one user's rows of the shared database.
+    """
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    conn = connect(db_filename)
+    counts = []
+    try:
+        conn.execute('BEGIN')
+        for (suffix, query, columns), table_path in zip(EXPORTS, output_paths(path)):
+            cursor = conn.execute(query.format(where=where), params)
+            count = 0
+            for count in WRITERS[fmt](iter_chunks(cursor), columns, table_path):
+                if progress:
+                    progress(table_path, count)
+            counts.append(count)
+        conn.rollback()
+    finally:
+        conn.close()
+    return counts
+
+
+def export_database(db_filename, path, progress=None, user_id=None):
+    """Export a product database to path in the format its extension names
+
+    With a user_id, db_filename is the shared database and only that user's
+    rows are exported. Returns a short description of what was written.
+    """
+    fmt = export_format(path)
+    if fmt == 'db' and user_id is not None:
+        # A backup of the shared file would hold every user; write a per-user database instead
+        if os.path.exists(path):
+            os.remove(path)
+        extract_user_database(db_filename, user_id, path)
+        return f"Database exported to {path}"
+    if fmt == 'db':
+        backup_database(db_filename, path,
+                        progress=(lambda done, total: progress(path, done, total)) if progress else None)
+        return f"Database backed up to {path}"
+
+    counts = export_tables(db_filename, path, fmt,
+                           progress=(lambda table_path, count: progress(table_path, count, None))
+                           if progress else None, user_id=user_id)
+    return '\n'.join(f"{count} {table} exported to {table_path}"
+                     for count, table, table_path in zip(counts, ('products', 'credits', 'payments'),
+                                                         output_paths(path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a product database")
+    parser.add_argument('output', help="target file: .db (backup), .csv, .ndjson or .parquet")
+    parser.add_argument('--user', help="export this user's data (products_<user>.db or the shared database)")
+    parser.add_argument('--db', help="export this database file instead")
+    args = parser.parse_args()
+
+    if not args.user and not args.db:
+        parser.error("either --user or --db is required")
+    db_filename, user_id = args.db, None
+    if not args.db:
+        users = load_users()
+        if args.user not in users:
+            parser.error(f"unknown user: {args.user}")
+        db_filename, user_id = user_database(args.user, users[args.user])
+    if not os.path.exists(db_filename):
+        parser.error(f"{db_filename} does not exist")
+
+    def report(path, done, total):
+        print(f"  {path}: {done}" + (f" of {total} pages" if total else " rows"), file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        print(export_database(db_filename, args.output, report, user_id))
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+    print(f"Finished in {time.perf_counter() - started:.1f} s")
+
+if __name__ == "__main__":
+    main()
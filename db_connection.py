@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+SQLite Connections for Product Manager
+One place that opens every database the apps and scripts use (users.db and
+the per-user product databases) with the same tuned settings
+"""
+
+import sqlite3
+
+# Page cache per connection in KiB (SQLite's default is about 2 MB)
+CACHE_SIZE_KB = 32 * 1024
+
+# Bytes of the database file read through a memory map instead of read() calls
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Seconds to wait for another connection's write lock before giving up
+BUSY_TIMEOUT = 10.0
+
+
+def connect(filename, cache_size_kb=CACHE_SIZE_KB, mmap_size=MMAP_SIZE, timeout=BUSY_TIMEOUT,
+            check_same_thread=True):
+    """Open a SQLite database with WAL journaling and the app's tuned pragmas
+
+    - WAL lets readers (the GUI, exports, reports) run while a write is in
+      progress, and a commit only appends to the log instead of rewriting pages
+      through a rollback journal.
+    - synchronous=NORMAL syncs at checkpoints rather than on every commit. A
+      power loss can roll back the last commits but never corrupts the file.
+    - foreign_keys=ON makes SQLite enforce credit_transactions.product_id.
+    """
+    conn = sqlite3.connect(filename, timeout=timeout, check_same_thread=check_same_thread)
+    # journal_mode is stored in the file; the others apply to this connection only
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{int(cache_size_kb)}')
+    conn.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+    conn.execute('PRAGMA foreign_keys=ON')
+    return conn
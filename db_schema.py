@@ -0,0 +1,958 @@
+#!/usr/bin/env python3
+"""
+Database Schema for Product Manager
+Versioned migrations for the product databases, tracked with PRAGMA user_version
+Run directly to upgrade existing databases in place: python db_schema.py [products_*.db ...]
+Add --verify-summary or --rebuild-summary to check or recompute the maintained credit totals,
+the per-credit balances cached from the payment ledger and the per-customer totals
+"""
+
+import argparse
+import glob
+import sys
+
+from db_connection import connect
+
+# Tables whose every insert, update and delete is recorded in change_log, with the
+# columns each entry keeps as JSON. The id is the entry's row_id, and in the shared
+# database the owner is the entry's user_id, so entries look the same in both.
+LOGGED_TABLES = {
+    'products': ('name', 'category', 'cost_price_usd', 'cost_price_dzd', 'transport_price', 'sale_price',
+                 'picture_path', 'package_size', 'package_image_path', 'arrival_date', 'sale_date',
+                 'status', 'notes'),
+    'credit_transactions': ('product_id', 'customer_id', 'customer_name', 'amount_paid', 'amount_remaining',
+                            'transaction_date'),
+    'credit_payments': ('credit_id', 'amount', 'payment_date', 'kind'),
+}
+
+# Owner of a logged row in the shared database; {row} is NEW, OLD or the table itself
+SHARED_ROW_OWNER = {
+    'products': '{row}.user_id',
+    'credit_transactions': '{row}.user_id',
+    'credit_payments': '(SELECT user_id FROM credit_transactions WHERE id = {row}.credit_id)',
+}
+
+
+def row_json(table, row):
+    """Return a json_object() of a logged table's columns for row (NEW, OLD or the table itself)"""
+    return f"json_object({', '.join(f'{column!r}, {row}.{column}' for column in LOGGED_TABLES[table])})"
+
+
+def change_log_triggers(shared=False):
+    """Return the statements creating the triggers that append every logged change to change_log
+
+    Each entry holds the whole row after the change (nothing for a delete), so
+    replaying entries in seq order rebuilds the rows without reading older ones.
+    """
+    statements = []
+    for table in LOGGED_TABLES:
+        for operation, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            columns, values = 'table_name, row_id, operation, data', f"'{table}', {row}.id, '{operation}'"
+            if shared:
+                columns = f'user_id, {columns}'
+                values = f"{SHARED_ROW_OWNER[table].format(row=row)}, {values}"
+            data = 'NULL' if operation == 'delete' else row_json(table, row)
+            statements.append(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_log_{operation} AFTER {operation.upper()} ON {table}
+                BEGIN
+                    INSERT INTO change_log ({columns}) VALUES ({values}, {data});
+                END
+            ''')
+    return statements
+
+
+# Migrations are applied in order; each one runs in its own transaction and
+# bumps PRAGMA user_version to its version number when it succeeds.
+MIGRATIONS = [
+    (1, "Create products and credit transactions tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category TEXT,
+            cost_price_usd REAL,
+            cost_price_dzd REAL,
+            transport_price REAL,
+            sale_price REAL,
+            picture_path TEXT,
+            package_size TEXT,
+            package_image_path TEXT,
+            arrival_date TEXT,
+            sale_date TEXT,
+            status TEXT DEFAULT 'In Stock',
+            notes TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS credit_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            customer_name TEXT,
+            amount_paid REAL,
+            amount_remaining REAL,
+            transaction_date TEXT,
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+        ''',
+    ]),
+    (2, "Index product status, credit product and credit date", [
+        # Covers the in-stock product dropdown (id comes from the rowid)
+        'CREATE INDEX IF NOT EXISTS idx_products_status ON products (status, name, sale_price)',
+        # Credit -> product join and per-product credit lookups
+        'CREATE INDEX IF NOT EXISTS idx_credit_product ON credit_transactions (product_id)',
+        # Newest-first credit list without a temporary sort
+        'CREATE INDEX IF NOT EXISTS idx_credit_date ON credit_transactions (transaction_date)',
+    ]),
+    (3, "Maintain credit totals in a single-row summary table", [
+        '''
+        CREATE TABLE IF NOT EXISTS credit_summary (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_credits REAL NOT NULL DEFAULT 0,
+            total_paid REAL NOT NULL DEFAULT 0,
+            total_outstanding REAL NOT NULL DEFAULT 0,
+            credit_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        # Seed the totals from any credits recorded before this migration
+        '''
+        INSERT OR REPLACE INTO credit_summary (id, total_credits, total_paid, total_outstanding, credit_count)
+        SELECT 1,
+               IFNULL(SUM(IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0)), 0),
+               IFNULL(SUM(IFNULL(amount_paid, 0)), 0),
+               IFNULL(SUM(IFNULL(amount_remaining, 0)), 0),
+               COUNT(*)
+        FROM credit_transactions
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_summary_insert AFTER INSERT ON credit_transactions
+        BEGIN
+            UPDATE credit_summary SET
+                total_credits = total_credits + IFNULL(NEW.amount_paid, 0) + IFNULL(NEW.amount_remaining, 0),
+                total_paid = total_paid + IFNULL(NEW.amount_paid, 0),
+                total_outstanding = total_outstanding + IFNULL(NEW.amount_remaining, 0),
+                credit_count = credit_count + 1
+            WHERE id = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_summary_update
+        AFTER UPDATE OF amount_paid, amount_remaining ON credit_transactions
+        BEGIN
+            UPDATE credit_summary SET
+                total_credits = total_credits
+                    + IFNULL(NEW.amount_paid, 0) + IFNULL(NEW.amount_remaining, 0)
+                    - IFNULL(OLD.amount_paid, 0) - IFNULL(OLD.amount_remaining, 0),
+                total_paid = total_paid + IFNULL(NEW.amount_paid, 0) - IFNULL(OLD.amount_paid, 0),
+                total_outstanding = total_outstanding
+                    + IFNULL(NEW.amount_remaining, 0) - IFNULL(OLD.amount_remaining, 0)
+            WHERE id = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_summary_delete AFTER DELETE ON credit_transactions
+        BEGIN
+            UPDATE credit_summary SET
+                total_credits = total_credits - IFNULL(OLD.amount_paid, 0) - IFNULL(OLD.amount_remaining, 0),
+                total_paid = total_paid - IFNULL(OLD.amount_paid, 0),
+                total_outstanding = total_outstanding - IFNULL(OLD.amount_remaining, 0),
+                credit_count = credit_count - 1
+            WHERE id = 1;
+        END
+        ''',
+    ]),
+    (4, "Full-text search over product name, category, package size and notes", [
+        # External-content index: the text lives in products, FTS5 stores only the index.
+        # Prefix indexes keep search-as-you-type queries fast.
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, category, package_size, notes,
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products
+        BEGIN
+            INSERT INTO products_fts (rowid, name, category, package_size, notes)
+            VALUES (NEW.id, NEW.name, NEW.category, NEW.package_size, NEW.notes);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_update
+        AFTER UPDATE OF name, category, package_size, notes ON products
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, category, package_size, notes)
+            VALUES ('delete', OLD.id, OLD.name, OLD.category, OLD.package_size, OLD.notes);
+            INSERT INTO products_fts (rowid, name, category, package_size, notes)
+            VALUES (NEW.id, NEW.name, NEW.category, NEW.package_size, NEW.notes);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, category, package_size, notes)
+            VALUES ('delete', OLD.id, OLD.name, OLD.category, OLD.package_size, OLD.notes);
+        END
+        ''',
+        # Index the products that existed before this migration
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+    ]),
+    (5, "Record credit payments in an append-only ledger", [
+        # amount_paid/amount_remaining on credit_transactions become a cache of
+        # the ledger, kept current by the triggers below
+        '''
+        CREATE TABLE IF NOT EXISTS credit_payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            credit_id INTEGER NOT NULL,
+            amount REAL NOT NULL CHECK (amount > 0),
+            payment_date TEXT NOT NULL,
+            kind TEXT NOT NULL DEFAULT 'Payment',
+            FOREIGN KEY (credit_id) REFERENCES credit_transactions (id)
+        )
+        ''',
+        # A credit's payments in date order, read as one index range
+        'CREATE INDEX IF NOT EXISTS idx_payments_credit ON credit_payments (credit_id, payment_date)',
+        # A customer's credits in date order
+        'CREATE INDEX IF NOT EXISTS idx_credit_customer ON credit_transactions (customer_name, transaction_date)',
+        # Credits recorded before this migration: what was paid so far becomes the down payment
+        '''
+        INSERT INTO credit_payments (credit_id, amount, payment_date, kind)
+        SELECT id, amount_paid, IFNULL(transaction_date, ''), 'Down payment'
+        FROM credit_transactions WHERE amount_paid > 0 ORDER BY id
+        ''',
+        # The amount paid when a credit is created is its down payment
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_payments_down_payment AFTER INSERT ON credit_transactions
+        WHEN NEW.amount_paid > 0
+        BEGIN
+            INSERT INTO credit_payments (credit_id, amount, payment_date, kind)
+            VALUES (NEW.id, NEW.amount_paid, IFNULL(NEW.transaction_date, ''), 'Down payment');
+        END
+        ''',
+        # Later payments move money from remaining to paid (the down payment is already counted)
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_payments_balance AFTER INSERT ON credit_payments
+        WHEN NEW.kind = 'Payment'
+        BEGIN
+            UPDATE credit_transactions SET
+                amount_paid = IFNULL(amount_paid, 0) + NEW.amount,
+                amount_remaining = IFNULL(amount_remaining, 0) - NEW.amount
+            WHERE id = NEW.credit_id;
+        END
+        ''',
+    ]),
+    (6, "Keep customers in their own table with maintained balances", [
+        # name_key is the name trimmed and lower-cased; its unique index also
+        # serves the customer picker's prefix lookups
+        '''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            credit_count INTEGER NOT NULL DEFAULT 0,
+            total_credit REAL NOT NULL DEFAULT 0,
+            outstanding REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_customers_name_key ON customers (name_key)',
+        'ALTER TABLE credit_transactions ADD COLUMN customer_id INTEGER REFERENCES customers (id)',
+        # A customer's credits in date order, now by customer rather than free-text name
+        'DROP INDEX IF EXISTS idx_credit_customer',
+        'CREATE INDEX IF NOT EXISTS idx_credit_customer ON credit_transactions (customer_id, transaction_date)',
+        # Existing credits: the first spelling of each name becomes the customer's name
+        '''
+        INSERT OR IGNORE INTO customers (name, name_key)
+        SELECT trim(customer_name), lower(trim(customer_name))
+        FROM credit_transactions WHERE trim(IFNULL(customer_name, '')) <> '' ORDER BY id
+        ''',
+        '''
+        UPDATE credit_transactions
+        SET customer_id = (SELECT id FROM customers WHERE name_key = lower(trim(customer_name)))
+        ''',
+        '''
+        UPDATE customers SET (credit_count, total_credit, outstanding) = (
+            SELECT COUNT(*),
+                   IFNULL(SUM(IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0)), 0),
+                   IFNULL(SUM(IFNULL(amount_remaining, 0)), 0)
+            FROM credit_transactions WHERE customer_id = customers.id
+        )
+        ''',
+        # Credits inserted with only a name are linked to their customer (created if
+        # needed); setting customer_id then counts the credit in credit_customer_update
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_customer_resolve AFTER INSERT ON credit_transactions
+        WHEN NEW.customer_id IS NULL AND trim(IFNULL(NEW.customer_name, '')) <> ''
+        BEGIN
+            INSERT OR IGNORE INTO customers (name, name_key)
+            VALUES (trim(NEW.customer_name), lower(trim(NEW.customer_name)));
+            UPDATE credit_transactions
+            SET customer_id = (SELECT id FROM customers WHERE name_key = lower(trim(NEW.customer_name)))
+            WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_customer_insert AFTER INSERT ON credit_transactions
+        WHEN NEW.customer_id IS NOT NULL
+        BEGIN
+            UPDATE customers SET
+                credit_count = credit_count + 1,
+                total_credit = total_credit + IFNULL(NEW.amount_paid, 0) + IFNULL(NEW.amount_remaining, 0),
+                outstanding = outstanding + IFNULL(NEW.amount_remaining, 0)
+            WHERE id = NEW.customer_id;
+        END
+        ''',
+        # Payments reach the customer through the amounts they update on the credit
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_customer_update
+        AFTER UPDATE OF amount_paid, amount_remaining, customer_id ON credit_transactions
+        BEGIN
+            UPDATE customers SET
+                credit_count = credit_count - 1,
+                total_credit = total_credit - IFNULL(OLD.amount_paid, 0) - IFNULL(OLD.amount_remaining, 0),
+                outstanding = outstanding - IFNULL(OLD.amount_remaining, 0)
+            WHERE id = OLD.customer_id;
+            UPDATE customers SET
+                credit_count = credit_count + 1,
+                total_credit = total_credit + IFNULL(NEW.amount_paid, 0) + IFNULL(NEW.amount_remaining, 0),
+                outstanding = outstanding + IFNULL(NEW.amount_remaining, 0)
+            WHERE id = NEW.customer_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_customer_delete AFTER DELETE ON credit_transactions
+        BEGIN
+            UPDATE customers SET
+                credit_count = credit_count - 1,
+                total_credit = total_credit - IFNULL(OLD.amount_paid, 0) - IFNULL(OLD.amount_remaining, 0),
+                outstanding = outstanding - IFNULL(OLD.amount_remaining, 0)
+            WHERE id = OLD.customer_id;
+        END
+        ''',
+    ]),
+    (7, "Index in-stock product names case-insensitively", [
+        # The credit sale product picker looks up name prefixes in any case; the
+        # status counts and the in-stock list use the index as before
+        'DROP INDEX IF EXISTS idx_products_status',
+        'CREATE INDEX IF NOT EXISTS idx_products_status ON products (status, name COLLATE NOCASE, sale_price)',
+    ]),
+    (8, "Index the sortable product and credit list columns", [
+        # One index per sort key of repository.PRODUCT_SORT_KEYS and CREDIT_SORT_KEYS,
+        # on the same expression, so a sorted page never sorts the whole table
+        'CREATE INDEX IF NOT EXISTS idx_products_name ON products (name COLLATE NOCASE)',
+        "CREATE INDEX IF NOT EXISTS idx_products_category ON products (IFNULL(category, '') COLLATE NOCASE)",
+        'CREATE INDEX IF NOT EXISTS idx_products_cost_usd ON products (IFNULL(cost_price_usd, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_products_cost_dzd ON products (IFNULL(cost_price_dzd, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_products_sale_price ON products (IFNULL(sale_price, 0))',
+        "CREATE INDEX IF NOT EXISTS idx_products_status_sort ON products (IFNULL(status, ''))",
+        # A filter and the price sort together; prices follow the category, so scanning
+        # the price index for one category can walk most of the table
+        "CREATE INDEX IF NOT EXISTS idx_products_status_price ON products "
+        "(IFNULL(status, ''), IFNULL(sale_price, 0))",
+        "CREATE INDEX IF NOT EXISTS idx_products_category_price ON products "
+        "(IFNULL(category, '') COLLATE NOCASE, IFNULL(sale_price, 0))",
+        "CREATE INDEX IF NOT EXISTS idx_credit_customer_name ON credit_transactions "
+        "(IFNULL(customer_name, '') COLLATE NOCASE)",
+        'CREATE INDEX IF NOT EXISTS idx_credit_total ON credit_transactions '
+        '(IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_credit_paid ON credit_transactions (IFNULL(amount_paid, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_credit_remaining ON credit_transactions (IFNULL(amount_remaining, 0))',
+    ]),
+    (9, "Record every product and credit change in an append-only change log", [
+        # seq orders the changes (AUTOINCREMENT never reuses one, so it is a safe
+        # cursor for tailing); changed_at is local time, like the app's other dates
+        '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            data TEXT
+        )
+        ''',
+        # A row's history, for audits
+        'CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_id)',
+        # Snapshots hold every logged row as of change seq, so rebuilding a past
+        # state replays only the changes after the closest snapshot
+        '''
+        CREATE TABLE IF NOT EXISTS change_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            seq INTEGER NOT NULL,
+            taken_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+            row_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_change_snapshots_taken ON change_snapshots (taken_at)',
+        '''
+        CREATE TABLE IF NOT EXISTS snapshot_rows (
+            snapshot_id INTEGER NOT NULL REFERENCES change_snapshots (id),
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (snapshot_id, table_name, row_id)
+        ) WITHOUT ROWID
+        ''',
+        # The rows that existed before the log: history starts from this snapshot (seq 0)
+        'INSERT INTO change_snapshots (seq) VALUES (0)',
+    ] + [f'''
+        INSERT INTO snapshot_rows (snapshot_id, table_name, row_id, data)
+        SELECT (SELECT MAX(id) FROM change_snapshots), '{table}', id, {row_json(table, table)} FROM {table}
+    ''' for table in LOGGED_TABLES] + [
+        '''
+        UPDATE change_snapshots
+        SET row_count = (SELECT COUNT(*) FROM snapshot_rows WHERE snapshot_id = change_snapshots.id)
+        WHERE id = (SELECT MAX(id) FROM change_snapshots)
+        ''',
+    ] + change_log_triggers()),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Schema of the optional shared database holding every user's products (see
+# shared_storage.py). Same tables as above, plus a user_id on every row, with
+# user_id leading each index so a user's rows are one contiguous range.
+SHARED_MIGRATIONS = [
+    (1, "Create the multi-user products, credits, summary and search tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            category TEXT,
+            cost_price_usd REAL,
+            cost_price_dzd REAL,
+            transport_price REAL,
+            sale_price REAL,
+            picture_path TEXT,
+            package_size TEXT,
+            package_image_path TEXT,
+            arrival_date TEXT,
+            sale_date TEXT,
+            status TEXT DEFAULT 'In Stock',
+            notes TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS credit_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            product_id INTEGER,
+            customer_name TEXT,
+            amount_paid REAL,
+            amount_remaining REAL,
+            transaction_date TEXT,
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+        ''',
+        # A user's product list in id order (keyset pagination)
+        'CREATE INDEX IF NOT EXISTS idx_products_user ON products (user_id, id)',
+        # A user's in-stock dropdown, and shop-wide status counts
+        'CREATE INDEX IF NOT EXISTS idx_products_status ON products (user_id, status, name, sale_price)',
+        'CREATE INDEX IF NOT EXISTS idx_credit_product ON credit_transactions (product_id)',
+        # A user's credit list, newest first
+        'CREATE INDEX IF NOT EXISTS idx_credit_date ON credit_transactions (user_id, transaction_date)',
+        # One row of maintained credit totals per user
+        '''
+        CREATE TABLE IF NOT EXISTS credit_summary (
+            user_id INTEGER PRIMARY KEY,
+            total_credits REAL NOT NULL DEFAULT 0,
+            total_paid REAL NOT NULL DEFAULT 0,
+            total_outstanding REAL NOT NULL DEFAULT 0,
+            credit_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_summary_insert AFTER INSERT ON credit_transactions
+        BEGIN
+            INSERT OR IGNORE INTO credit_summary (user_id) VALUES (NEW.user_id);
+            UPDATE credit_summary SET
+                total_credits = total_credits + IFNULL(NEW.amount_paid, 0) + IFNULL(NEW.amount_remaining, 0),
+                total_paid = total_paid + IFNULL(NEW.amount_paid, 0),
+                total_outstanding = total_outstanding + IFNULL(NEW.amount_remaining, 0),
+                credit_count = credit_count + 1
+            WHERE user_id = NEW.user_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_summary_update
+        AFTER UPDATE OF amount_paid, amount_remaining ON credit_transactions
+        BEGIN
+            UPDATE credit_summary SET
+                total_credits = total_credits
+                    + IFNULL(NEW.amount_paid, 0) + IFNULL(NEW.amount_remaining, 0)
+                    - IFNULL(OLD.amount_paid, 0) - IFNULL(OLD.amount_remaining, 0),
+                total_paid = total_paid + IFNULL(NEW.amount_paid, 0) - IFNULL(OLD.amount_paid, 0),
+                total_outstanding = total_outstanding
+                    + IFNULL(NEW.amount_remaining, 0) - IFNULL(OLD.amount_remaining, 0)
+            WHERE user_id = NEW.user_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_summary_delete AFTER DELETE ON credit_transactions
+        BEGIN
+            UPDATE credit_summary SET
+                total_credits = total_credits - IFNULL(OLD.amount_paid, 0) - IFNULL(OLD.amount_remaining, 0),
+                total_paid = total_paid - IFNULL(OLD.amount_paid, 0),
+                total_outstanding = total_outstanding - IFNULL(OLD.amount_remaining, 0),
+                credit_count = credit_count - 1
+            WHERE user_id = OLD.user_id;
+        END
+        ''',
+        # user_id is indexed as a token so a search can be limited to one user
+        # inside FTS5 instead of filtering the ranked matches afterwards
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, category, package_size, notes, user_id,
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products
+        BEGIN
+            INSERT INTO products_fts (rowid, name, category, package_size, notes, user_id)
+            VALUES (NEW.id, NEW.name, NEW.category, NEW.package_size, NEW.notes, NEW.user_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_update
+        AFTER UPDATE OF name, category, package_size, notes, user_id ON products
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, category, package_size, notes, user_id)
+            VALUES ('delete', OLD.id, OLD.name, OLD.category, OLD.package_size, OLD.notes, OLD.user_id);
+            INSERT INTO products_fts (rowid, name, category, package_size, notes, user_id)
+            VALUES (NEW.id, NEW.name, NEW.category, NEW.package_size, NEW.notes, NEW.user_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, category, package_size, notes, user_id)
+            VALUES ('delete', OLD.id, OLD.name, OLD.category, OLD.package_size, OLD.notes, OLD.user_id);
+        END
+        ''',
+    ]),
+    (2, "Record credit payments in an append-only ledger", [
+        # Same as version 5 of the per-user schema; credit ids are unique across
+        # users, so payments need no user_id of their own
+        '''
+        CREATE TABLE IF NOT EXISTS credit_payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            credit_id INTEGER NOT NULL,
+            amount REAL NOT NULL CHECK (amount > 0),
+            payment_date TEXT NOT NULL,
+            kind TEXT NOT NULL DEFAULT 'Payment',
+            FOREIGN KEY (credit_id) REFERENCES credit_transactions (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_payments_credit ON credit_payments (credit_id, payment_date)',
+        'CREATE INDEX IF NOT EXISTS idx_credit_customer ON credit_transactions (user_id, customer_name, transaction_date)',
+        '''
+        INSERT INTO credit_payments (credit_id, amount, payment_date, kind)
+        SELECT id, amount_paid, IFNULL(transaction_date, ''), 'Down payment'
+        FROM credit_transactions WHERE amount_paid > 0 ORDER BY id
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_payments_down_payment AFTER INSERT ON credit_transactions
+        WHEN NEW.amount_paid > 0
+        BEGIN
+            INSERT INTO credit_payments (credit_id, amount, payment_date, kind)
+            VALUES (NEW.id, NEW.amount_paid, IFNULL(NEW.transaction_date, ''), 'Down payment');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_payments_balance AFTER INSERT ON credit_payments
+        WHEN NEW.kind = 'Payment'
+        BEGIN
+            UPDATE credit_transactions SET
+                amount_paid = IFNULL(amount_paid, 0) + NEW.amount,
+                amount_remaining = IFNULL(amount_remaining, 0) - NEW.amount
+            WHERE id = NEW.credit_id;
+        END
+        ''',
+    ]),
+    (3, "Keep customers in their own table with maintained balances", [
+        # Customer names are unique per user
+        '''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            credit_count INTEGER NOT NULL DEFAULT 0,
+            total_credit REAL NOT NULL DEFAULT 0,
+            outstanding REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_customers_name_key ON customers (user_id, name_key)',
+        'ALTER TABLE credit_transactions ADD COLUMN customer_id INTEGER REFERENCES customers (id)',
+        'DROP INDEX IF EXISTS idx_credit_customer',
+        'CREATE INDEX IF NOT EXISTS idx_credit_customer ON credit_transactions (customer_id, transaction_date)',
+        '''
+        INSERT OR IGNORE INTO customers (user_id, name, name_key)
+        SELECT user_id, trim(customer_name), lower(trim(customer_name))
+        FROM credit_transactions WHERE trim(IFNULL(customer_name, '')) <> '' ORDER BY id
+        ''',
+        '''
+        UPDATE credit_transactions
+        SET customer_id = (SELECT id FROM customers
+                           WHERE customers.user_id = credit_transactions.user_id
+                             AND name_key = lower(trim(customer_name)))
+        ''',
+        '''
+        UPDATE customers SET (credit_count, total_credit, outstanding) = (
+            SELECT COUNT(*),
+                   IFNULL(SUM(IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0)), 0),
+                   IFNULL(SUM(IFNULL(amount_remaining, 0)), 0)
+            FROM credit_transactions WHERE customer_id = customers.id
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_customer_resolve AFTER INSERT ON credit_transactions
+        WHEN NEW.customer_id IS NULL AND trim(IFNULL(NEW.customer_name, '')) <> ''
+        BEGIN
+            INSERT OR IGNORE INTO customers (user_id, name, name_key)
+            VALUES (NEW.user_id, trim(NEW.customer_name), lower(trim(NEW.customer_name)));
+            UPDATE credit_transactions
+            SET customer_id = (SELECT id FROM customers
+                               WHERE user_id = NEW.user_id AND name_key = lower(trim(NEW.customer_name)))
+            WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_customer_insert AFTER INSERT ON credit_transactions
+        WHEN NEW.customer_id IS NOT NULL
+        BEGIN
+            UPDATE customers SET
+                credit_count = credit_count + 1,
+                total_credit = total_credit + IFNULL(NEW.amount_paid, 0) + IFNULL(NEW.amount_remaining, 0),
+                outstanding = outstanding + IFNULL(NEW.amount_remaining, 0)
+            WHERE id = NEW.customer_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_customer_update
+        AFTER UPDATE OF amount_paid, amount_remaining, customer_id ON credit_transactions
+        BEGIN
+            UPDATE customers SET
+                credit_count = credit_count - 1,
+                total_credit = total_credit - IFNULL(OLD.amount_paid, 0) - IFNULL(OLD.amount_remaining, 0),
+                outstanding = outstanding - IFNULL(OLD.amount_remaining, 0)
+            WHERE id = OLD.customer_id;
+            UPDATE customers SET
+                credit_count = credit_count + 1,
+                total_credit = total_credit + IFNULL(NEW.amount_paid, 0) + IFNULL(NEW.amount_remaining, 0),
+                outstanding = outstanding + IFNULL(NEW.amount_remaining, 0)
+            WHERE id = NEW.customer_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS credit_customer_delete AFTER DELETE ON credit_transactions
+        BEGIN
+            UPDATE customers SET
+                credit_count = credit_count - 1,
+                total_credit = total_credit - IFNULL(OLD.amount_paid, 0) - IFNULL(OLD.amount_remaining, 0),
+                outstanding = outstanding - IFNULL(OLD.amount_remaining, 0)
+            WHERE id = OLD.customer_id;
+        END
+        ''',
+    ]),
+    (4, "Index in-stock product names case-insensitively", [
+        'DROP INDEX IF EXISTS idx_products_status',
+        'CREATE INDEX IF NOT EXISTS idx_products_status ON products (user_id, status, name COLLATE NOCASE, sale_price)',
+    ]),
+    (5, "Index the sortable product and credit list columns", [
+        'CREATE INDEX IF NOT EXISTS idx_products_name ON products (user_id, name COLLATE NOCASE)',
+        "CREATE INDEX IF NOT EXISTS idx_products_category ON products "
+        "(user_id, IFNULL(category, '') COLLATE NOCASE)",
+        'CREATE INDEX IF NOT EXISTS idx_products_cost_usd ON products (user_id, IFNULL(cost_price_usd, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_products_cost_dzd ON products (user_id, IFNULL(cost_price_dzd, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_products_sale_price ON products (user_id, IFNULL(sale_price, 0))',
+        "CREATE INDEX IF NOT EXISTS idx_products_status_sort ON products (user_id, IFNULL(status, ''))",
+        "CREATE INDEX IF NOT EXISTS idx_products_status_price ON products "
+        "(user_id, IFNULL(status, ''), IFNULL(sale_price, 0))",
+        "CREATE INDEX IF NOT EXISTS idx_products_category_price ON products "
+        "(user_id, IFNULL(category, '') COLLATE NOCASE, IFNULL(sale_price, 0))",
+        'CREATE INDEX IF NOT EXISTS idx_credit_user ON credit_transactions (user_id, id)',
+        "CREATE INDEX IF NOT EXISTS idx_credit_customer_name ON credit_transactions "
+        "(user_id, IFNULL(customer_name, '') COLLATE NOCASE)",
+        'CREATE INDEX IF NOT EXISTS idx_credit_total ON credit_transactions '
+        '(user_id, IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_credit_paid ON credit_transactions (user_id, IFNULL(amount_paid, 0))',
+        'CREATE INDEX IF NOT EXISTS idx_credit_remaining ON credit_transactions '
+        '(user_id, IFNULL(amount_remaining, 0))',
+    ]),
+    (6, "Record every product and credit change in an append-only change log", [
+        # Same as version 9 of the per-user schema, with the owner on every entry
+        # and snapshot; seq is shared by all users, a user's changes are a range of it
+        '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            data TEXT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_change_log_user ON change_log (user_id, seq)',
+        'CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_id)',
+        '''
+        CREATE TABLE IF NOT EXISTS change_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            taken_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+            row_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_change_snapshots_taken ON change_snapshots (user_id, taken_at)',
+        '''
+        CREATE TABLE IF NOT EXISTS snapshot_rows (
+            snapshot_id INTEGER NOT NULL REFERENCES change_snapshots (id),
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (snapshot_id, table_name, row_id)
+        ) WITHOUT ROWID
+        ''',
+        # One starting snapshot per user with data; users added later start from nothing
+        '''
+        INSERT INTO change_snapshots (user_id, seq)
+        SELECT user_id, 0 FROM products UNION SELECT user_id, 0 FROM credit_transactions
+        ''',
+    ] + [f'''
+        INSERT INTO snapshot_rows (snapshot_id, table_name, row_id, data)
+        SELECT s.id, '{table}', {table}.id, {row_json(table, table)}
+        FROM {table} JOIN change_snapshots s ON s.user_id = {SHARED_ROW_OWNER[table].format(row=table)}
+    ''' for table in LOGGED_TABLES] + [
+        '''
+        UPDATE change_snapshots
+        SET row_count = (SELECT COUNT(*) FROM snapshot_rows WHERE snapshot_id = change_snapshots.id)
+        ''',
+    ] + change_log_triggers(shared=True)),
+]
+
+# Columns of credit_summary compared by verify_credit_summary
+SUMMARY_COLUMNS = ('total_credits', 'total_paid', 'total_outstanding', 'credit_count')
+
+# Money totals are maintained by adding and subtracting floats, so allow for rounding
+SUMMARY_TOLERANCE = 0.005
+
+
+def get_schema_version(conn):
+    """Return the schema version stored in the database"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target_version=None, migrations=MIGRATIONS):
+    """Upgrade a product database to target_version (default: the latest), returns the versions applied"""
+    latest_version = migrations[-1][0]
+    if target_version is None:
+        target_version = latest_version
+
+    current_version = get_schema_version(conn)
+    if current_version > latest_version:
+        raise RuntimeError(f"Database schema version {current_version} is newer than "
+                           f"this program supports ({latest_version})")
+
+    applied = []
+    for version, description, statements in migrations:
+        if version <= current_version or version > target_version:
+            continue
+
+        # DDL is not wrapped in a transaction implicitly, so do it explicitly. IMMEDIATE
+        # takes the write lock up front; another connection opening the same file may
+        # have applied this migration since the version was read.
+        conn.execute('BEGIN IMMEDIATE')
+        if get_schema_version(conn) >= version:
+            conn.rollback()
+            continue
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version}')
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        applied.append(version)
+
+    return applied
+
+
+def compute_credit_summary(conn):
+    """Recompute the credit totals from scratch with a full scan of credit_transactions"""
+    return conn.execute('''
+        SELECT IFNULL(SUM(IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0)), 0),
+               IFNULL(SUM(IFNULL(amount_paid, 0)), 0),
+               IFNULL(SUM(IFNULL(amount_remaining, 0)), 0),
+               COUNT(*)
+        FROM credit_transactions
+    ''').fetchone()
+
+
+def verify_credit_summary(conn):
+    """Compare the maintained credit summary with a full recount
+
+    Returns a list of (column, stored, actual) tuples for every total that drifted.
+    """
+    stored = conn.execute(f'SELECT {", ".join(SUMMARY_COLUMNS)} FROM credit_summary WHERE id = 1').fetchone()
+    if stored is None:
+        stored = (0, 0, 0, 0)
+    actual = compute_credit_summary(conn)
+
+    return [
+        (column, stored_value, actual_value)
+        for column, stored_value, actual_value in zip(SUMMARY_COLUMNS, stored, actual)
+        if abs(stored_value - actual_value) > SUMMARY_TOLERANCE
+    ]
+
+
+def rebuild_credit_summary(conn):
+    """Overwrite the maintained credit summary with a full recount"""
+    with conn:
+        conn.execute(f'''
+            INSERT OR REPLACE INTO credit_summary (id, {", ".join(SUMMARY_COLUMNS)})
+            VALUES (1, ?, ?, ?, ?)
+        ''', compute_credit_summary(conn))
+
+
+# Credits whose cached amount paid disagrees with the sum of their payments
+DRIFTED_BALANCES_SQL = '''
+    SELECT ct.id, IFNULL(ct.amount_paid, 0), IFNULL(ledger.paid, 0)
+    FROM credit_transactions ct
+    LEFT JOIN (SELECT credit_id, SUM(amount) AS paid FROM credit_payments GROUP BY credit_id) ledger
+           ON ledger.credit_id = ct.id
+    WHERE abs(IFNULL(ct.amount_paid, 0) - IFNULL(ledger.paid, 0)) > ?
+'''
+
+
+def verify_credit_balances(conn):
+    """Compare each credit's cached amount paid with its payment ledger
+
+    Returns a list of (credit id, cached, ledger) tuples for every credit that drifted.
+    """
+    return conn.execute(DRIFTED_BALANCES_SQL, (SUMMARY_TOLERANCE,)).fetchall()
+
+
+def rebuild_credit_balances(conn):
+    """Recompute the cached amounts paid and remaining from the payment ledger, returns the credits fixed"""
+    with conn:
+        drifted = conn.execute(DRIFTED_BALANCES_SQL, (SUMMARY_TOLERANCE,)).fetchall()
+        # The credit's total (paid + remaining) stays as it was
+        conn.executemany('''
+            UPDATE credit_transactions SET
+                amount_paid = ?,
+                amount_remaining = IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0) - ?
+            WHERE id = ?
+        ''', [(paid, paid, credit_id) for credit_id, _, paid in drifted])
+    return len(drifted)
+
+
+# Customers whose maintained totals disagree with their credits
+DRIFTED_CUSTOMERS_SQL = '''
+    SELECT id, name, outstanding, actual_outstanding FROM (
+        SELECT c.id, c.name, c.credit_count, c.total_credit, c.outstanding,
+               COUNT(ct.id) AS actual_count,
+               IFNULL(SUM(IFNULL(ct.amount_paid, 0) + IFNULL(ct.amount_remaining, 0)), 0) AS actual_total,
+               IFNULL(SUM(IFNULL(ct.amount_remaining, 0)), 0) AS actual_outstanding
+        FROM customers c
+        LEFT JOIN credit_transactions ct ON ct.customer_id = c.id
+        GROUP BY c.id
+    )
+    WHERE credit_count <> actual_count
+       OR abs(total_credit - actual_total) > ?
+       OR abs(outstanding - actual_outstanding) > ?
+'''
+
+
+def verify_customer_totals(conn):
+    """Compare each customer's maintained totals with their credits
+
+    Returns a list of (customer id, name, stored outstanding, actual outstanding) tuples.
+    """
+    return conn.execute(DRIFTED_CUSTOMERS_SQL, (SUMMARY_TOLERANCE, SUMMARY_TOLERANCE)).fetchall()
+
+
+def rebuild_customer_totals(conn):
+    """Recompute every customer's maintained totals from their credits"""
+    with conn:
+        conn.execute('''
+            UPDATE customers SET (credit_count, total_credit, outstanding) = (
+                SELECT COUNT(*),
+                       IFNULL(SUM(IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0)), 0),
+                       IFNULL(SUM(IFNULL(amount_remaining, 0)), 0)
+                FROM credit_transactions WHERE customer_id = customers.id
+            )
+        ''')
+
+
+def main():
+    """Upgrade, verify or rebuild the given product databases (default: every products_*.db)"""
+    parser = argparse.ArgumentParser(description="Maintain product databases")
+    parser.add_argument('databases', nargs='*', help="database files (default: products_*.db)")
+    parser.add_argument('--verify-summary', action='store_true',
+                        help="check the maintained credit totals and balances against a full recount")
+    parser.add_argument('--rebuild-summary', action='store_true',
+                        help="recompute the maintained credit totals and balances from scratch")
+    args = parser.parse_args()
+
+    filenames = args.databases or sorted(glob.glob('products_*.db'))
+    if not filenames:
+        print("No product databases found.")
+        return
+
+    drifted = False
+    for filename in filenames:
+        conn = connect(filename)
+        try:
+            old_version = get_schema_version(conn)
+            applied = migrate(conn)
+            if applied:
+                print(f"{filename}: upgraded from version {old_version} to {applied[-1]}")
+            else:
+                print(f"{filename}: already at version {old_version}")
+
+            if args.verify_summary:
+                mismatches = verify_credit_summary(conn)
+                for column, stored, actual in mismatches:
+                    print(f"  {column}: stored {stored:.2f}, actual {actual:.2f}")
+                if mismatches:
+                    drifted = True
+                else:
+                    print("  credit summary OK")
+
+                balances = verify_credit_balances(conn)
+                for credit_id, cached, paid in balances[:10]:
+                    print(f"  credit {credit_id}: paid {cached:.2f}, payments total {paid:.2f}")
+                if balances:
+                    print(f"  {len(balances)} credit balances disagree with their payments")
+                    drifted = True
+                else:
+                    print("  credit balances OK")
+
+                customers = verify_customer_totals(conn)
+                for customer_id, name, stored, actual in customers[:10]:
+                    print(f"  customer {name}: owes {stored:.2f}, credits say {actual:.2f}")
+                if customers:
+                    print(f"  {len(customers)} customer totals disagree with their credits")
+                    drifted = True
+                else:
+                    print("  customer totals OK")
+
+            if args.rebuild_summary:
+                # Balances first: fixing them moves the summary through its triggers
+                print(f"  {rebuild_credit_balances(conn)} credit balances rebuilt")
+                rebuild_credit_summary(conn)
+                rebuild_customer_totals(conn)
+                print("  credit summary and customer totals rebuilt")
+        finally:
+            conn.close()
+
+    if drifted and not args.rebuild_summary:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Background Database Writer for Product Manager
+Runs the GUI's inserts, updates and deletes on a dedicated thread that owns
+the write connection, commits bursts of queued writes in one transaction and
+hands the results back to the Tk thread through root.after
+"""
+
+import queue
+import threading
+import time
+
+# How long the first write of a burst waits for more to share its commit (seconds)
+BATCH_WINDOW = 0.02
+
+# Most writes committed in one transaction
+MAX_BATCH = 200
+
+# How often the Tk thread checks for finished writes (ms)
+POLL_INTERVAL_MS = 30
+
+
+class DatabaseWriter:
+    def __init__(self, root, open_storage, after_commit=None):
+        """open_storage() is called on the writer thread and returns (conn, products, credits)
+
+        after_commit(conn), if given, runs on the writer thread after each committed
+        batch, for housekeeping such as change log snapshots.
+        """
+        self.root = root
+        self.after_commit = after_commit
+
+        # (work, on_done, on_error) waiting for the writer thread; None stops it
+        self.requests = queue.Queue()
+        # (callback, result or exception) waiting for the Tk thread
+        self.results = queue.Queue()
+        self.pending = 0
+        self.polling = False
+
+        self.thread = threading.Thread(target=self.run, args=(open_storage,), name="db-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, work, on_done=None, on_error=None):
+        """Queue work(products, credits) for the writer thread (call from the Tk thread)
+
+        on_done(result) or on_error(exception) is then called on the Tk thread
+        once the transaction holding the write has committed or failed.
+        """
+        self.requests.put((work, on_done, on_error))
+        self.pending += 1
+
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_INTERVAL_MS, self.poll)
+
+    def poll(self):
+        """Deliver finished writes to their callbacks (runs on the Tk thread)"""
+        while True:
+            try:
+                callback, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            self.pending -= 1
+            if callback is not None:
+                callback(value)
+
+        if self.pending:
+            self.root.after(POLL_INTERVAL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def close(self):
+        """Finish the queued writes and stop the writer thread"""
+        self.requests.put(None)
+        self.thread.join()
+
+    def run(self, open_storage):
+        """Writer thread: commit queued writes until close() is called"""
+        try:
+            conn, products, credits = open_storage()
+        except Exception as e:
+            # Fail every write instead of leaving the GUI waiting for them
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    return
+                self.results.put((request[2], e))
+
+        try:
+            while True:
+                batch, stop = self.next_batch()
+                if batch and self.write_batch(conn, products, credits, batch) and self.after_commit:
+                    try:
+                        self.after_commit(conn)
+                    except Exception:
+                        # Housekeeping only: the batch is committed, and it is retried after the next one
+                        conn.rollback()
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def next_batch(self):
+        """Wait for a write, then gather the ones queued right behind it; returns (batch, stop)"""
+        request = self.requests.get()
+        if request is None:
+            return [], True
+
+        batch = [request]
+        deadline = time.monotonic() + BATCH_WINDOW
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def write_batch(self, conn, products, credits, batch):
+        """Run a batch of writes in one transaction and queue their results for the Tk thread
+
+        Returns True if the transaction committed.
+        """
+        results = []
+        committed = False
+        conn.execute('BEGIN')
+        try:
+            for work, on_done, on_error in batch:
+                # Each write gets a savepoint so one failing write does not undo the others.
+                # Repository calls join the open transaction instead of committing.
+                conn.execute('SAVEPOINT write')
+                try:
+                    result = work(products, credits)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write')
+                    results.append((on_error, e))
+                else:
+                    results.append((on_done, result))
+                conn.execute('RELEASE write')
+            conn.commit()
+            committed = True
+        except Exception as e:
+            # The transaction itself failed (lock timeout, disk full...): nothing was written
+            conn.rollback()
+            results = [(on_error, e) for _, _, on_error in batch]
+
+        for result in results:
+            self.results.put(result)
+        return committed
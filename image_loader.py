@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Background Image Loader for Product Manager
+Decodes and resizes images on a worker pool and hands the finished
+PhotoImage objects back to the Tk thread through root.after
+"""
+
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of images decoded at the same time
+IMAGE_WORKERS = 4
+
+# How often the Tk thread checks for finished images (ms)
+POLL_INTERVAL_MS = 30
+
+
+class ImageLoader:
+    def __init__(self, root, thumbnails, workers=IMAGE_WORKERS):
+        self.root = root
+        self.thumbnails = thumbnails
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-loader")
+
+        # Finished decodes waiting for the Tk thread. Tk objects may only be
+        # created there, so workers hand back PIL images and the poller wraps them.
+        self.results = queue.Queue()
+        self.pending = 0
+        self.polling = False
+
+    def load(self, path, callback):
+        """Decode the thumbnail for path off-thread, then call callback(photo, error) on the Tk thread"""
+        future = self.executor.submit(self.thumbnails.get, path)
+        future.add_done_callback(lambda f: self.results.put((f, callback)))
+        self.pending += 1
+
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_INTERVAL_MS, self.poll)
+
+    def prefetch(self, path):
+        """Build and cache the thumbnail for path in the background"""
+        def work():
+            try:
+                self.thumbnails.get(path)
+            except Exception as e:
+                print(f"Error caching thumbnail for {path}: {e}")
+
+        self.executor.submit(work)
+
+    def poll(self):
+        """Deliver finished images to their callbacks (runs on the Tk thread)"""
+        # Imported on first use so startup does not pay for PIL
+        from PIL import ImageTk
+
+        while True:
+            try:
+                future, callback = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            self.pending -= 1
+            try:
+                photo = ImageTk.PhotoImage(future.result())
+            except Exception as e:
+                callback(None, e)
+            else:
+                callback(photo, None)
+
+        if self.pending:
+            self.root.after(POLL_INTERVAL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def shutdown(self):
+        """Stop the worker pool, dropping images that have not started decoding"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
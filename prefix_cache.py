@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Prefix Cache for Product Manager
+Remembers the results of recent type-ahead lookups so the pickers do not
+query the database again for a prefix typed moments ago
+"""
+
+import string
+from collections import OrderedDict
+
+# Number of prefixes remembered
+PREFIX_CACHE_SIZE = 32
+
+# SQLite's NOCASE collation folds ASCII letters only; match names the same way
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def fold(text):
+    """Return text the way NOCASE compares it"""
+    return text.translate(ASCII_LOWER)
+
+
+class PrefixCache:
+    def __init__(self, lookup, limit, size=PREFIX_CACHE_SIZE, name_index=1):
+        """lookup(prefix, limit) returns rows ordered by name; row[name_index] is the name"""
+        self.lookup = lookup
+        self.limit = limit
+        self.size = size
+        self.name_index = name_index
+        # fold(prefix) -> (rows, complete), most recently used last. complete
+        # means the lookup returned fewer than limit rows, i.e. every match.
+        self.entries = OrderedDict()
+
+    def get(self, prefix):
+        """Return the first limit rows whose name starts with prefix"""
+        key = fold(prefix)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+        # Every match of a longer prefix is among the complete matches of a shorter one
+        for length in range(len(key) - 1, -1, -1):
+            entry = self.entries.get(key[:length])
+            if entry is not None and entry[1]:
+                rows = [row for row in entry[0] if fold(row[self.name_index]).startswith(key)]
+                self.store(key, rows, True)
+                return rows
+
+        rows = self.lookup(prefix, self.limit)
+        self.store(key, rows, len(rows) < self.limit)
+        return rows
+
+    def store(self, key, rows, complete):
+        self.entries[key] = (rows, complete)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Forget every result (call after the underlying rows change)"""
+        self.entries.clear()
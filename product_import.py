@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Bulk Product Import for Product Manager
+Streams products from a CSV or Excel (.xlsx) file, validates each row and
+inserts them in large batched transactions
+Usage: python product_import.py FILE (--user USERNAME | --db FILE --rate RATE)
+"""
+
+import argparse
+import csv
+import sys
+import time
+from datetime import date, datetime
+
+from db_connection import connect
+from repository import PRODUCT_STATUSES, ProductRepository, open_product_database
+from shared_storage import open_user_storage
+
+try:
+    import openpyxl
+except ImportError:  # Excel import is optional
+    openpyxl = None
+
+# Rows inserted per transaction
+BATCH_SIZE = 20000
+
+# Column headers accepted for each product field (compared case-insensitively,
+# with spaces, dashes and brackets treated as underscores)
+COLUMN_ALIASES = {
+    'name': ('name', 'product', 'product_name'),
+    'category': ('category',),
+    'cost_price_usd': ('cost_price_usd', 'cost_usd', 'cost_price', 'cost'),
+    'transport_price': ('transport_price', 'transport'),
+    'sale_price': ('sale_price', 'price'),
+    'picture_path': ('picture_path', 'picture', 'product_picture'),
+    'package_size': ('package_size',),
+    'package_image_path': ('package_image_path', 'package_image'),
+    'arrival_date': ('arrival_date', 'arrival'),
+    'sale_date': ('sale_date',),
+    'status': ('status',),
+    'notes': ('notes',),
+}
+
+# Lowercase status -> stored status
+STATUS_LOOKUP = {status.lower(): status for status in PRODUCT_STATUSES}
+
+NUMERIC_FIELDS = ('cost_price_usd', 'transport_price', 'sale_price')
+DATE_FIELDS = ('arrival_date', 'sale_date')
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows_read = 0
+        self.imported = 0
+        self.errors = []  # (line number, message)
+
+    def __repr__(self):
+        return f"ImportResult(rows_read={self.rows_read}, imported={self.imported}, errors={len(self.errors)})"
+
+
+def normalize_header(header):
+    """Return a header as a lowercase identifier, e.g. 'Cost Price (USD)' -> 'cost_price_usd'"""
+    text = str(header or '').strip().lower()
+    for char in ' -()[]/.':
+        text = text.replace(char, '_')
+    return '_'.join(part for part in text.split('_') if part)
+
+
+def map_headers(headers):
+    """Return {column index: product field} for the recognized headers"""
+    lookup = {alias: field for field, aliases in COLUMN_ALIASES.items() for alias in aliases}
+    mapping = {}
+    for index, header in enumerate(headers):
+        field = lookup.get(normalize_header(header))
+        if field and field not in mapping.values():
+            mapping[index] = field
+    if 'name' not in mapping.values():
+        raise ValueError("The file has no product name column (expected a 'name' header)")
+    return mapping
+
+
+def read_rows(path):
+    """Yield (line number, {field: value}) for every data row of a CSV or XLSX file"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        if openpyxl is None:
+            raise RuntimeError("Excel import needs openpyxl: pip install openpyxl")
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            mapping = map_headers(next(rows, ()))
+            for line, values in enumerate(rows, start=2):
+                yield line, {field: values[index] for index, field in mapping.items() if index < len(values)}
+        finally:
+            workbook.close()
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            mapping = map_headers(next(reader, []))
+            for values in reader:
+                yield reader.line_num, {field: values[index] for index, field in mapping.items()
+                                        if index < len(values)}
+
+
+def parse_number(value, field):
+    """Parse a price; empty cells count as 0 like the product form"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value.strip().replace(',', '.').replace(' ', ''))
+    except ValueError:
+        raise ValueError(f"{field} is not a number: {value!r}")
+
+
+def parse_date(value, field):
+    """Return a date as YYYY-MM-DD; Excel cells may already be datetimes"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    text = str(value).strip()[:10]
+    try:
+        # fromisoformat is much faster than strptime over a large file
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        raise ValueError(f"{field} must be a YYYY-MM-DD date: {value!r}")
+
+
+def validate_row(row, usd_to_dzd_rate, today):
+    """Return a product dict for the repository, raising ValueError on invalid data"""
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError("Product name is required")
+
+    product = {'name': name}
+    for field in ('category', 'picture_path', 'package_size', 'package_image_path', 'notes'):
+        value = row.get(field)
+        product[field] = str(value).strip() if value is not None else ''
+    for field in NUMERIC_FIELDS:
+        product[field] = parse_number(row.get(field), field)
+        if product[field] < 0:
+            raise ValueError(f"{field} cannot be negative")
+    for field in DATE_FIELDS:
+        product[field] = parse_date(row.get(field), field)
+    product['arrival_date'] = product['arrival_date'] or today
+
+    status = str(row.get('status') or '').strip() or 'In Stock'
+    product['status'] = STATUS_LOOKUP.get(status.lower())
+    if product['status'] is None:
+        raise ValueError(f"status must be one of {', '.join(PRODUCT_STATUSES)}: {status!r}")
+
+    # Same conversion as the form's calculate_dzd (which shows two decimals)
+    product['cost_price_dzd'] = round(product['cost_price_usd'] * usd_to_dzd_rate, 2)
+    return product
+
+
+def import_products(products, path, usd_to_dzd_rate, batch_size=BATCH_SIZE, progress=None):
+    """Import every valid row of a CSV/XLSX file into a ProductRepository, returns an ImportResult
+
+    Invalid rows are skipped and reported in result.errors. progress, if given,
+    is called with the result after every batch.
+    """
+    result = ImportResult()
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    batch = []
+    for line, row in read_rows(path):
+        result.rows_read += 1
+        try:
+            batch.append(validate_row(row, usd_to_dzd_rate, today))
+        except ValueError as e:
+            result.errors.append((line, str(e)))
+
+        if len(batch) >= batch_size:
+            result.imported += products.add_many(batch)
+            batch = []
+            if progress:
+                progress(result)
+
+    if batch:
+        result.imported += products.add_many(batch)
+    if progress:
+        progress(result)
+
+    return result
+
+
+def get_user(username):
+    """Return (id, USD to DZD rate) of a user in users.db"""
+    conn = connect('users.db')
+    try:
+        row = conn.execute('SELECT id, usd_to_dzd_rate FROM users WHERE username=?', (username,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise SystemExit(f"Unknown user: {username}")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import products from a CSV or XLSX file")
+    parser.add_argument('file')
+    parser.add_argument('--user', help="import into this user's products (products_<user>.db or the shared database)")
+    parser.add_argument('--db', help="import into this database file instead")
+    parser.add_argument('--rate', type=float, help="USD to DZD rate (default: the user's rate)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if not args.user and not args.db:
+        parser.error("either --user or --db is required")
+    if args.db:
+        if args.rate is None:
+            parser.error("--rate is required with --db")
+        rate, target = args.rate, args.db
+        conn = open_product_database(args.db)
+        products = ProductRepository(conn)
+    else:
+        user_id, user_rate = get_user(args.user)
+        rate = args.rate if args.rate is not None else user_rate
+        target = f"{args.user}'s products"
+        conn, products, _ = open_user_storage(args.user, user_id)
+
+    started = time.perf_counter()
+    try:
+        result = import_products(products, args.file, rate, args.batch_size,
+                                 progress=lambda r: print(f"  {r.rows_read} rows read, {r.imported} imported",
+                                                          file=sys.stderr))
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Imported {result.imported} of {result.rows_read} rows into {target} in {elapsed:.1f} s")
+    for line, message in result.errors[:20]:
+        print(f"  line {line}: {message}")
+    if len(result.errors) > 20:
+        print(f"  ... and {len(result.errors) - 20} more errors")
+    if result.errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
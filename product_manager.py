@@ -5,12 +5,24 @@ A small program to manage products with cost prices, transport costs, sales trac
 """
 
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
-import sqlite3
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import json
 from datetime import datetime
 import os
+import re
+import sqlite3
+from prefix_cache import PrefixCache
+from repository import (CREDIT_SORT_KEYS, PICKER_LIMIT, PRODUCT_SORT_KEYS, PRODUCT_STATUSES, CreditRepository,
+                        ProductRepository, open_product_database)
+
+# A credit sale product picked from the list: "<id> - <name> ($<price>)"
+PRODUCT_CHOICE = re.compile(r'^(\d+) - ')
+
+# Filter choice that shows every row
+ALL_FILTER = 'All'
+
+# Credit list balance filter choices -> CreditRepository.sorted_page(outstanding=...)
+BALANCE_FILTERS = {ALL_FILTER: None, 'Outstanding': True, 'Paid off': False}
 
 class ProductManager:
     def __init__(self):
@@ -33,43 +45,10 @@ class ProductManager:
     
     def init_database(self):
         """Initialize SQLite database for storing products"""
-        self.conn = sqlite3.connect('products.db')
-        self.cursor = self.conn.cursor()
-        
-        # Create products table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                category TEXT,
-                cost_price_usd REAL,
-                cost_price_dzd REAL,
-                transport_price REAL,
-                sale_price REAL,
-                picture_path TEXT,
-                package_size TEXT,
-                package_image_path TEXT,
-                arrival_date TEXT,
-                sale_date TEXT,
-                status TEXT DEFAULT 'In Stock',
-                notes TEXT
-            )
-        ''')
-        
-        # Create credit transactions table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS credit_transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER,
-                customer_name TEXT,
-                amount_paid REAL,
-                amount_remaining REAL,
-                transaction_date TEXT,
-                FOREIGN KEY (product_id) REFERENCES products (id)
-            )
-        ''')
-        
-        self.conn.commit()
+        # Create tables and indexes, upgrading older databases in place
+        self.conn = open_product_database('products.db')
+        self.products = ProductRepository(self.conn)
+        self.credits = CreditRepository(self.conn)
     
     def create_widgets(self):
         """Create the main GUI widgets"""
@@ -197,6 +176,23 @@ class ProductManager:
         list_frame = ttk.LabelFrame(right_panel, text="Products", padding=10)
         list_frame.pack(fill=tk.BOTH, expand=True)
         
+        # Status and category filters (applied in SQL, like the column sorting)
+        filter_frame = ttk.Frame(list_frame)
+        filter_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="Status:").pack(side=tk.LEFT)
+        self.status_filter_var = tk.StringVar(value=ALL_FILTER)
+        status_filter = ttk.Combobox(filter_frame, textvariable=self.status_filter_var, width=12, state="readonly",
+                                     values=(ALL_FILTER,) + PRODUCT_STATUSES)
+        status_filter.pack(side=tk.LEFT, padx=(5, 10))
+        status_filter.bind('<<ComboboxSelected>>', lambda event: self.load_products())
+        ttk.Label(filter_frame, text="Category:").pack(side=tk.LEFT)
+        self.category_filter_var = tk.StringVar(value=ALL_FILTER)
+        # Categories are read when the list is opened, so new ones show up
+        self.category_filter = ttk.Combobox(filter_frame, textvariable=self.category_filter_var, width=18,
+                                            state="readonly", postcommand=self.update_category_choices)
+        self.category_filter.pack(side=tk.LEFT, padx=(5, 0))
+        self.category_filter.bind('<<ComboboxSelected>>', lambda event: self.load_products())
+        
         # Treeview for products
         columns = ('ID', 'Name', 'Category', 'Cost USD', 'Cost DZD', 'Sale Price', 'Status')
         self.product_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=15)
@@ -205,6 +201,14 @@ class ProductManager:
             self.product_tree.heading(col, text=col)
             self.product_tree.column(col, width=100)
         
+        # Clicking a heading sorts by that column; clicking it again reverses the order
+        self.product_sort = 'id'
+        self.product_descending = False
+        self.product_headings = {sort: columns[position] for sort, (_, position, _) in PRODUCT_SORT_KEYS.items()}
+        for sort, col in self.product_headings.items():
+            self.product_tree.heading(col, command=lambda sort=sort: self.sort_products(sort))
+        self.show_sort_headings(self.product_tree, self.product_headings, self.product_sort, self.product_descending)
+        
         # Scrollbar
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.product_tree.yview)
         self.product_tree.configure(yscrollcommand=scrollbar.set)
@@ -239,40 +243,52 @@ class ProductManager:
         # Product selection for credit
         ttk.Label(credit_form_frame, text="Select Product:").grid(row=0, column=0, sticky=tk.W, pady=5)
         self.credit_product_var = tk.StringVar()
-        self.credit_product_combo = ttk.Combobox(credit_form_frame, textvariable=self.credit_product_var, width=25, state="readonly")
+        self.credit_product_combo = ttk.Combobox(credit_form_frame, textvariable=self.credit_product_var, width=25)
         self.credit_product_combo.grid(row=0, column=1, pady=5)
+        # Typing the start of a name lists the matching in-stock products
+        self.credit_product_combo.bind('<KeyRelease>', self.show_product_choices)
+        self.product_choices = PrefixCache(self.products.in_stock_matching, PICKER_LIMIT)
         self.update_credit_products()
         
         # Customer name
         ttk.Label(credit_form_frame, text="Customer Name:").grid(row=1, column=0, sticky=tk.W, pady=5)
         self.customer_name_var = tk.StringVar()
-        ttk.Entry(credit_form_frame, textvariable=self.customer_name_var, width=25).grid(row=1, column=1, pady=5)
+        self.customer_combo = ttk.Combobox(credit_form_frame, textvariable=self.customer_name_var, width=25)
+        self.customer_combo.grid(row=1, column=1, pady=5)
+        # Suggest existing customers as the name is typed
+        self.customer_combo.bind('<KeyRelease>', self.update_customer_choices)
+        self.customer_combo.bind('<<ComboboxSelected>>', self.update_customer_choices)
+        
+        # What the customer already owes
+        self.customer_balance_var = tk.StringVar()
+        ttk.Label(credit_form_frame, textvariable=self.customer_balance_var, foreground="gray").grid(row=2, column=1, sticky=tk.W)
         
         # Total amount
-        ttk.Label(credit_form_frame, text="Total Amount:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        ttk.Label(credit_form_frame, text="Total Amount:").grid(row=3, column=0, sticky=tk.W, pady=5)
         self.total_amount_var = tk.StringVar()
         total_amount_entry = ttk.Entry(credit_form_frame, textvariable=self.total_amount_var, width=25)
-        total_amount_entry.grid(row=2, column=1, pady=5)
+        total_amount_entry.grid(row=3, column=1, pady=5)
         total_amount_entry.bind('<KeyRelease>', self.calculate_remaining)
         
         # Amount paid
-        ttk.Label(credit_form_frame, text="Amount Paid:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        ttk.Label(credit_form_frame, text="Amount Paid:").grid(row=4, column=0, sticky=tk.W, pady=5)
         self.amount_paid_var = tk.StringVar()
         amount_paid_entry = ttk.Entry(credit_form_frame, textvariable=self.amount_paid_var, width=25)
-        amount_paid_entry.grid(row=3, column=1, pady=5)
+        amount_paid_entry.grid(row=4, column=1, pady=5)
         amount_paid_entry.bind('<KeyRelease>', self.calculate_remaining)
         
         # Amount remaining (calculated)
-        ttk.Label(credit_form_frame, text="Amount Remaining:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        ttk.Label(credit_form_frame, text="Amount Remaining:").grid(row=5, column=0, sticky=tk.W, pady=5)
         self.amount_remaining_var = tk.StringVar()
-        ttk.Entry(credit_form_frame, textvariable=self.amount_remaining_var, width=25, state='readonly').grid(row=4, column=1, pady=5)
+        ttk.Entry(credit_form_frame, textvariable=self.amount_remaining_var, width=25, state='readonly').grid(row=5, column=1, pady=5)
         
         # Credit buttons
         credit_button_frame = ttk.Frame(credit_form_frame)
-        credit_button_frame.grid(row=5, column=0, columnspan=2, pady=10)
+        credit_button_frame.grid(row=6, column=0, columnspan=2, pady=10)
         
         ttk.Button(credit_button_frame, text="Create Credit Sale", command=self.create_credit_sale).pack(side=tk.LEFT, padx=2)
         ttk.Button(credit_button_frame, text="Add Payment", command=self.add_payment).pack(side=tk.LEFT, padx=2)
+        ttk.Button(credit_button_frame, text="Payment History", command=self.view_payment_history).pack(side=tk.LEFT, padx=2)
         ttk.Button(credit_button_frame, text="Clear", command=self.clear_credit_form).pack(side=tk.LEFT, padx=2)
         
         # Credit transactions list
@@ -287,10 +303,28 @@ class ProductManager:
             self.credit_tree.heading(col, text=col)
             self.credit_tree.column(col, width=100)
         
+        # Sortable headings (all but the product name, which comes from a join)
+        self.credit_sort = 'transaction_date'
+        self.credit_descending = True
+        self.credit_headings = {sort: credit_columns[position] for sort, (_, position, _) in CREDIT_SORT_KEYS.items()}
+        for sort, col in self.credit_headings.items():
+            self.credit_tree.heading(col, command=lambda sort=sort: self.sort_credits(sort))
+        self.show_sort_headings(self.credit_tree, self.credit_headings, self.credit_sort, self.credit_descending)
+        
         # Credit scrollbar
         credit_scrollbar = ttk.Scrollbar(credit_list_frame, orient=tk.VERTICAL, command=self.credit_tree.yview)
         self.credit_tree.configure(yscrollcommand=credit_scrollbar.set)
         
+        # Balance filter, under the list
+        balance_filter_frame = ttk.Frame(credit_list_frame)
+        balance_filter_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+        ttk.Label(balance_filter_frame, text="Show:").pack(side=tk.LEFT)
+        self.balance_filter_var = tk.StringVar(value=ALL_FILTER)
+        balance_filter = ttk.Combobox(balance_filter_frame, textvariable=self.balance_filter_var, width=12,
+                                      state="readonly", values=tuple(BALANCE_FILTERS))
+        balance_filter.pack(side=tk.LEFT, padx=(5, 0))
+        balance_filter.bind('<<ComboboxSelected>>', lambda event: self.load_credit_transactions())
+        
         self.credit_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         credit_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
@@ -352,27 +386,8 @@ class ProductManager:
             return
         
         try:
-            self.cursor.execute('''
-                INSERT INTO products (name, category, cost_price_usd, cost_price_dzd, 
-                                    transport_price, sale_price, picture_path, package_size,
-                                    package_image_path, arrival_date, sale_date, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                self.name_var.get(),
-                self.category_var.get(),
-                float(self.cost_usd_var.get()) if self.cost_usd_var.get() else 0,
-                float(self.cost_dzd_var.get()) if self.cost_dzd_var.get() else 0,
-                float(self.transport_var.get()) if self.transport_var.get() else 0,
-                float(self.sale_price_var.get()) if self.sale_price_var.get() else 0,
-                self.picture_path_var.get(),
-                self.package_size_var.get(),
-                self.package_image_path_var.get(),
-                self.arrival_date_var.get(),
-                self.sale_date_var.get(),
-                self.status_var.get()
-            ))
+            self.products.add(self.get_form_product())
             
-            self.conn.commit()
             messagebox.showinfo("Success", "Product added successfully!")
             self.clear_form()
             self.load_products()
@@ -397,28 +412,8 @@ class ProductManager:
             item = self.product_tree.item(selection[0])
             product_id = item['values'][0]
             
-            self.cursor.execute('''
-                UPDATE products SET name=?, category=?, cost_price_usd=?, cost_price_dzd=?, 
-                                  transport_price=?, sale_price=?, picture_path=?, package_size=?,
-                                  package_image_path=?, arrival_date=?, sale_date=?, status=?
-                WHERE id=?
-            ''', (
-                self.name_var.get(),
-                self.category_var.get(),
-                float(self.cost_usd_var.get()) if self.cost_usd_var.get() else 0,
-                float(self.cost_dzd_var.get()) if self.cost_dzd_var.get() else 0,
-                float(self.transport_var.get()) if self.transport_var.get() else 0,
-                float(self.sale_price_var.get()) if self.sale_price_var.get() else 0,
-                self.picture_path_var.get(),
-                self.package_size_var.get(),
-                self.package_image_path_var.get(),
-                self.arrival_date_var.get(),
-                self.sale_date_var.get(),
-                self.status_var.get(),
-                product_id
-            ))
+            self.products.update(product_id, self.get_form_product())
             
-            self.conn.commit()
             messagebox.showinfo("Success", "Product updated successfully!")
             self.clear_form()
             self.load_products()
@@ -440,16 +435,35 @@ class ProductManager:
                 item = self.product_tree.item(selection[0])
                 product_id = item['values'][0]
                 
-                self.cursor.execute('DELETE FROM products WHERE id=?', (product_id,))
-                self.conn.commit()
+                self.products.delete(product_id)
                 
                 messagebox.showinfo("Success", "Product deleted successfully!")
                 self.clear_form()
                 self.load_products()
                 
+            except sqlite3.IntegrityError:
+                messagebox.showerror("Error", "This product has credit transactions and cannot be deleted. "
+                                              "Mark it as Sold or Damaged instead.")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to delete product: {str(e)}")
     
+    def get_form_product(self):
+        """Return the product form as a dict of repository fields (raises ValueError on bad prices)"""
+        return {
+            'name': self.name_var.get(),
+            'category': self.category_var.get(),
+            'cost_price_usd': float(self.cost_usd_var.get()) if self.cost_usd_var.get() else 0,
+            'cost_price_dzd': float(self.cost_dzd_var.get()) if self.cost_dzd_var.get() else 0,
+            'transport_price': float(self.transport_var.get()) if self.transport_var.get() else 0,
+            'sale_price': float(self.sale_price_var.get()) if self.sale_price_var.get() else 0,
+            'picture_path': self.picture_path_var.get(),
+            'package_size': self.package_size_var.get(),
+            'package_image_path': self.package_image_path_var.get(),
+            'arrival_date': self.arrival_date_var.get(),
+            'sale_date': self.sale_date_var.get(),
+            'status': self.status_var.get(),
+        }
+    
     def clear_form(self):
         """Clear all form fields"""
         for var in [self.name_var, self.category_var, self.cost_usd_var, self.cost_dzd_var,
@@ -465,15 +479,39 @@ class ProductManager:
     
     def load_products(self):
         """Load products from database into the treeview"""
+        # Products changed, so the credit sale picker's cached matches may be stale
+        self.product_choices.clear()
+        
         # Clear existing items
         for item in self.product_tree.get_children():
             self.product_tree.delete(item)
         
-        # Load products
-        self.cursor.execute('SELECT id, name, category, cost_price_usd, cost_price_dzd, sale_price, status FROM products')
-        for row in self.cursor.fetchall():
+        # Load products, sorted and filtered by the database
+        status = self.status_filter_var.get()
+        category = self.category_filter_var.get()
+        rows = self.products.sorted_page(self.product_sort, self.product_descending,
+                                         None if status == ALL_FILTER else status,
+                                         None if category == ALL_FILTER else category)
+        for row in rows:
             self.product_tree.insert('', 'end', values=row)
     
+    def update_category_choices(self):
+        """Offer the current product categories in the category filter"""
+        self.category_filter['values'] = (ALL_FILTER,) + tuple(self.products.categories())
+    
+    def sort_products(self, sort):
+        """Sort the product list by a column, reversing the order on a second click"""
+        self.product_descending = not self.product_descending if sort == self.product_sort else False
+        self.product_sort = sort
+        self.show_sort_headings(self.product_tree, self.product_headings, self.product_sort, self.product_descending)
+        self.load_products()
+    
+    def show_sort_headings(self, tree, headings, sort, descending):
+        """Mark the sorted column's heading with the sort direction"""
+        for key, col in headings.items():
+            arrow = (" \u25bc" if descending else " \u25b2") if key == sort else ""
+            tree.heading(col, text=col + arrow)
+    
     def on_product_select(self, event):
         """Handle product selection in treeview"""
         selection = self.product_tree.selection()
@@ -482,8 +520,7 @@ class ProductManager:
             product_id = item['values'][0]
             
             # Load product details from database
-            self.cursor.execute('SELECT * FROM products WHERE id=?', (product_id,))
-            product = self.cursor.fetchone()
+            product = self.products.get(product_id)
             
             if product:
                 # Fill form with product data
@@ -522,10 +559,12 @@ class ProductManager:
         product_id = item['values'][0]
         
         # Load product details from database
-        self.cursor.execute('SELECT * FROM products WHERE id=?', (product_id,))
-        product = self.cursor.fetchone()
+        product = self.products.get(product_id)
         
         if product:
+            # Imported here rather than at startup; only this window shows images
+            from PIL import Image, ImageTk
+            
             # Create details window
             details_window = tk.Toplevel(self.root)
             details_window.title(f"Product Details - {product[1]}")
@@ -631,10 +670,34 @@ class ProductManager:
     
     def update_credit_products(self):
         """Update the product dropdown for credit sales"""
-        self.cursor.execute('SELECT id, name, sale_price FROM products WHERE status="In Stock"')
-        products = self.cursor.fetchall()
-        product_list = [f"{p[0]} - {p[1]} (${p[2]:.2f})" for p in products]
-        self.credit_product_combo['values'] = product_list
+        # Stock changed, so cached matches may be stale
+        self.product_choices.clear()
+        self.show_product_choices()
+    
+    def show_product_choices(self, event=None):
+        """List the first in-stock products whose name starts with the typed text"""
+        text = self.credit_product_var.get()
+        if PRODUCT_CHOICE.match(text):
+            # A product was picked from the list rather than typed
+            return
+        
+        # Only the top matches are fetched, from the status and name index
+        products = self.product_choices.get(text.lstrip())
+        self.credit_product_combo['values'] = [f"{p[0]} - {p[1]} (${p[2] or 0:.2f})" for p in products]
+    
+    def update_customer_choices(self, event=None):
+        """Offer the customers whose name starts with the typed text and show the typed customer's balance"""
+        text = self.customer_name_var.get()
+        # A range of the customer name index, so this stays fast with many customers
+        self.customer_combo['values'] = [customer[1] for customer in self.credits.customers(text)]
+        
+        customer = self.credits.customer(text) if text.strip() else None
+        if customer:
+            self.customer_balance_var.set(f"Owes ${customer[4]:.2f} on {customer[2]} credit(s)")
+        elif text.strip():
+            self.customer_balance_var.set("New customer")
+        else:
+            self.customer_balance_var.set("")
     
     def create_credit_sale(self):
         """Create a new credit sale"""
@@ -642,34 +705,20 @@ class ProductManager:
             messagebox.showerror("Error", "Please select a product and enter customer name!")
             return
         
+        # Extract product ID from selection
+        choice = PRODUCT_CHOICE.match(self.credit_product_var.get())
+        if not choice:
+            messagebox.showerror("Error", "Please choose a product from the list!")
+            return
+        product_id = int(choice.group(1))
+        
         try:
-            # Extract product ID from selection
-            product_id = int(self.credit_product_var.get().split(' - ')[0])
-            
             total_amount = float(self.total_amount_var.get()) if self.total_amount_var.get() else 0
             amount_paid = float(self.amount_paid_var.get()) if self.amount_paid_var.get() else 0
-            amount_remaining = total_amount - amount_paid
-            
-            # Insert credit transaction
-            self.cursor.execute('''
-                INSERT INTO credit_transactions (product_id, customer_name, amount_paid, amount_remaining, transaction_date)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                product_id,
-                self.customer_name_var.get(),
-                amount_paid,
-                amount_remaining,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ))
             
-            # Update product status if fully paid
-            if amount_remaining <= 0:
-                self.cursor.execute('UPDATE products SET status="Sold", sale_date=? WHERE id=?', 
-                                  (datetime.now().strftime("%Y-%m-%d"), product_id))
-            else:
-                self.cursor.execute('UPDATE products SET status="Reserved" WHERE id=?', (product_id,))
+            # Record the credit and mark the product Sold/Reserved in one transaction
+            self.credits.create_sale(product_id, self.customer_name_var.get().strip(), total_amount, amount_paid)
             
-            self.conn.commit()
             messagebox.showinfo("Success", "Credit sale created successfully!")
             
             self.clear_credit_form()
@@ -683,14 +732,96 @@ class ProductManager:
             messagebox.showerror("Error", f"Failed to create credit sale: {str(e)}")
     
     def add_payment(self):
-        """Add a payment to existing credit"""
-        # This would require selecting an existing credit transaction
-        messagebox.showinfo("Info", "Payment addition functionality - select a credit transaction first")
+        """Record a payment against the selected credit transaction"""
+        selection = self.credit_tree.selection()
+        if not selection:
+            messagebox.showerror("Error", "Please select a credit transaction first!")
+            return
+        credit_id = int(self.credit_tree.item(selection[0])['values'][0])
+        
+        row = self.credits.list_row(credit_id)
+        if row is None:
+            messagebox.showerror("Error", "This credit transaction no longer exists!")
+            return
+        
+        remaining = round(row[5] or 0, 2)
+        if remaining <= 0:
+            messagebox.showinfo("Info", "This credit is already paid off.")
+            return
+        
+        amount = simpledialog.askfloat(
+            "Add Payment",
+            f"Payment from {row[2]} for {row[1]}\nRemaining: ${remaining:.2f}\n\nAmount:",
+            parent=self.root, minvalue=0.01, maxvalue=remaining
+        )
+        if amount is None:
+            return
+        
+        try:
+            # One insert into the payment ledger; triggers update the balances and totals
+            self.credits.add_payment(credit_id, amount)
+            messagebox.showinfo("Success", f"Payment of ${amount:.2f} recorded!")
+            
+            self.load_credit_transactions()
+            self.update_credit_summary()
+            self.load_products()  # A paid-off product becomes Sold
+            
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to add payment: {str(e)}")
+    
+    def view_payment_history(self):
+        """Show the selected credit's payments and its customer's balance history"""
+        selection = self.credit_tree.selection()
+        if not selection:
+            messagebox.showerror("Error", "Please select a credit transaction first!")
+            return
+        credit_id = int(self.credit_tree.item(selection[0])['values'][0])
+        
+        row = self.credits.list_row(credit_id)
+        if row is None:
+            messagebox.showerror("Error", "This credit transaction no longer exists!")
+            return
+        customer_name = row[2]
+        
+        history_window = tk.Toplevel(self.root)
+        history_window.title(f"Payment History - {customer_name}")
+        history_window.geometry("700x550")
+        history_window.configure(bg="#f0f0f0")
+        
+        # Running totals are computed by window functions in the queries
+        sections = [
+            (f"Payments on credit #{credit_id} ({row[1]})",
+             ('Date', 'Type', 'Amount', 'Paid to Date', 'Balance'),
+             [(p[1], p[2], f"{p[3]:.2f}", f"{p[4]:.2f}", f"{p[5]:.2f}")
+              for p in self.credits.payments(credit_id)]),
+            (f"Balance history for {customer_name}",
+             ('Date', 'Credit', 'Type', 'Charge', 'Payment', 'Balance'),
+             [(h[0], h[1], h[2], f"{h[3]:.2f}" if h[3] else "", f"{h[4]:.2f}" if h[4] else "", f"{h[5]:.2f}")
+              for h in self.credits.customer_history(customer_name)]),
+        ]
+        
+        for title, columns, rows in sections:
+            frame = ttk.LabelFrame(history_window, text=title, padding=10)
+            frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+            
+            tree = ttk.Treeview(frame, columns=columns, show='headings', height=8)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=110)
+            
+            scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            
+            for values in rows:
+                tree.insert('', 'end', values=values)
     
     def clear_credit_form(self):
         """Clear credit form fields"""
         self.credit_product_var.set("")
         self.customer_name_var.set("")
+        self.customer_balance_var.set("")
         self.total_amount_var.set("")
         self.amount_paid_var.set("")
         self.amount_remaining_var.set("")
@@ -701,39 +832,27 @@ class ProductManager:
         for item in self.credit_tree.get_children():
             self.credit_tree.delete(item)
         
-        # Load transactions with product details
-        self.cursor.execute('''
-            SELECT ct.id, p.name, ct.customer_name, 
-                   (ct.amount_paid + ct.amount_remaining) as total,
-                   ct.amount_paid, ct.amount_remaining, ct.transaction_date
-            FROM credit_transactions ct
-            JOIN products p ON ct.product_id = p.id
-            ORDER BY ct.transaction_date DESC
-        ''')
-        
-        for row in self.cursor.fetchall():
+        # Load transactions with product details, sorted and filtered by the database
+        rows = self.credits.sorted_page(self.credit_sort, self.credit_descending,
+                                        BALANCE_FILTERS[self.balance_filter_var.get()])
+        for row in rows:
             self.credit_tree.insert('', 'end', values=row)
     
+    def sort_credits(self, sort):
+        """Sort the credit list by a column, reversing the order on a second click"""
+        self.credit_descending = not self.credit_descending if sort == self.credit_sort else False
+        self.credit_sort = sort
+        self.show_sort_headings(self.credit_tree, self.credit_headings, self.credit_sort, self.credit_descending)
+        self.load_credit_transactions()
+    
     def update_credit_summary(self):
         """Update credit summary statistics"""
-        # Calculate totals
-        self.cursor.execute('''
-            SELECT 
-                SUM(amount_paid + amount_remaining) as total_credits,
-                SUM(amount_paid) as total_paid,
-                SUM(amount_remaining) as total_outstanding
-            FROM credit_transactions
-        ''')
-        
-        result = self.cursor.fetchone()
-        if result:
-            total_credits = result[0] or 0
-            total_paid = result[1] or 0
-            total_outstanding = result[2] or 0
-            
-            self.total_credits_var.set(f"${total_credits:.2f}")
-            self.total_paid_var.set(f"${total_paid:.2f}")
-            self.total_outstanding_var.set(f"${total_outstanding:.2f}")
+        # Totals are maintained by triggers on credit_transactions
+        total_credits, total_paid, total_outstanding = self.credits.summary()
+        
+        self.total_credits_var.set(f"${total_credits:.2f}")
+        self.total_paid_var.set(f"${total_paid:.2f}")
+        self.total_outstanding_var.set(f"${total_outstanding:.2f}")
     
     def run(self):
         """Start the application"""
@@ -6,16 +6,46 @@ Supports multiple users with separate data
 """
 
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
-import sqlite3
-import json
+from tkinter import ttk, filedialog, messagebox, simpledialog
 from datetime import datetime
 import os
+import re
+import sqlite3
+import queue
+import threading
+from shared_storage import open_user_storage, user_change_log, user_database
+from change_tracker import ChangeTracker
+from thumbnail_cache import ThumbnailCache
+from image_loader import ImageLoader
+from db_writer import DatabaseWriter
+from prefix_cache import PrefixCache
+from repository import CREDIT_SORT_KEYS, PICKER_LIMIT, PRODUCT_SORT_KEYS, PRODUCT_STATUSES
+
+# Number of products fetched per page when scrolling the product list
+PRODUCT_PAGE_SIZE = 100
+
+# Number of credit transactions fetched per page when scrolling the credit list
+CREDIT_PAGE_SIZE = 100
+
+# Filter choice that shows every row
+ALL_FILTER = 'All'
+
+# Credit list balance filter choices -> CreditRepository.sorted_page(outstanding=...)
+BALANCE_FILTERS = {ALL_FILTER: None, 'Outstanding': True, 'Paid off': False}
+
+# Delay after the last keystroke before the product search runs (ms)
+SEARCH_DELAY_MS = 150
+
+# How often a progress window checks on its background thread (ms)
+BACKGROUND_POLL_MS = 100
+
+# A credit sale product picked from the list: "<id> - <name> ($<price>)"
+PRODUCT_CHOICE = re.compile(r'^(\d+) - ')
 
 class ProductManagerMultiUser:
     def __init__(self, user_data):
         self.user_data = user_data
+        self.user_id = user_data[0]  # id
         self.username = user_data[1]  # username
         self.full_name = user_data[2]  # full_name
         self.location = user_data[3]  # location
@@ -27,9 +57,23 @@ class ProductManagerMultiUser:
         self.root.geometry("1200x800")
         self.root.configure(bg="#f0f0f0")
         
+        # Rows touched by the last mutation, refreshed by apply_changes()
+        self.changes = ChangeTracker()
+        
+        # Resized product/package images, shared by all details windows and
+        # decoded on a worker pool so large photos never block the window
+        self.thumbnails = ThumbnailCache()
+        self.image_loader = ImageLoader(self.root, self.thumbnails)
+        
         # Initialize user-specific database
         self.init_database()
         
+        # Inserts, updates and deletes run on their own thread and connection so a
+        # slow disk never freezes the window; self.conn is only used for reading.
+        # The change log gets a fresh snapshot there too once enough has changed.
+        self.writer = DatabaseWriter(self.root, lambda: open_user_storage(self.username, self.user_id),
+                                     lambda conn: user_change_log(conn, self.user_id).snapshot_if_due())
+        
         # Create GUI
         self.create_widgets()
         
@@ -38,44 +82,10 @@ class ProductManagerMultiUser:
     
     def init_database(self):
         """Initialize SQLite database for storing products (user-specific)"""
-        db_filename = f'products_{self.username}.db'
-        self.conn = sqlite3.connect(db_filename)
-        self.cursor = self.conn.cursor()
-        
-        # Create products table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                category TEXT,
-                cost_price_usd REAL,
-                cost_price_dzd REAL,
-                transport_price REAL,
-                sale_price REAL,
-                picture_path TEXT,
-                package_size TEXT,
-                package_image_path TEXT,
-                arrival_date TEXT,
-                sale_date TEXT,
-                status TEXT DEFAULT 'In Stock',
-                notes TEXT
-            )
-        ''')
-        
-        # Create credit transactions table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS credit_transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER,
-                customer_name TEXT,
-                amount_paid REAL,
-                amount_remaining REAL,
-                transaction_date TEXT,
-                FOREIGN KEY (product_id) REFERENCES products (id)
-            )
-        ''')
-        
-        self.conn.commit()
+        # Create tables and indexes, upgrading older databases in place. The
+        # repositories only see this user's rows, in products_<username>.db or
+        # in the shared database when PRODUCT_STORAGE=shared.
+        self.conn, self.products, self.credits = open_user_storage(self.username, self.user_id)
     
     def create_widgets(self):
         """Create the main GUI widgets"""
@@ -114,10 +124,16 @@ class ProductManagerMultiUser:
         user_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="User", menu=user_menu)
         user_menu.add_command(label="Switch User", command=self.switch_user)
+        user_menu.add_command(label="Import Products...", command=self.import_products)
         user_menu.add_command(label="Export Data", command=self.export_data)
+        user_menu.add_command(label="Verify Credit Summary", command=self.verify_credit_summary)
         user_menu.add_separator()
         user_menu.add_command(label="Exit", command=self.root.quit)
         
+        # Status line for background saves (packed first so the notebook cannot cover it)
+        self.write_status_var = tk.StringVar(value="Ready")
+        ttk.Label(main_frame, textvariable=self.write_status_var, anchor=tk.W).pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+        
         # Create notebook for tabs
         self.notebook = ttk.Notebook(main_frame)
         self.notebook.pack(fill=tk.BOTH, expand=True)
@@ -126,12 +142,20 @@ class ProductManagerMultiUser:
         self.product_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.product_frame, text="Product Management")
         
-        # Credit Management Tab
+        # Credit Management Tab, built (and its data loaded) the first time it is
+        # selected so the window appears without waiting for it
         self.credit_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.credit_frame, text="Credit Management")
+        self.credit_tab_built = False
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
         
         self.create_product_tab()
-        self.create_credit_tab()
+    
+    def on_tab_changed(self, event=None):
+        """Build the credit tab when it is first selected"""
+        if not self.credit_tab_built and self.notebook.select() == str(self.credit_frame):
+            self.create_credit_tab()
+            self.credit_tab_built = True
     
     def create_product_tab(self):
         """Create the product management tab"""
@@ -233,6 +257,34 @@ class ProductManagerMultiUser:
         list_frame = ttk.LabelFrame(right_panel, text="Products", padding=10)
         list_frame.pack(fill=tk.BOTH, expand=True)
         
+        # Search box (full-text prefix search, runs as you type)
+        search_frame = ttk.Frame(list_frame)
+        search_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        search_entry.bind('<KeyRelease>', self.on_search_key)
+        self.search_job = None
+        self.search_active = False
+        
+        # Status and category filters (applied in SQL, like the column sorting)
+        filter_frame = ttk.Frame(list_frame)
+        filter_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="Status:").pack(side=tk.LEFT)
+        self.status_filter_var = tk.StringVar(value=ALL_FILTER)
+        status_filter = ttk.Combobox(filter_frame, textvariable=self.status_filter_var, width=12, state="readonly",
+                                     values=(ALL_FILTER,) + PRODUCT_STATUSES)
+        status_filter.pack(side=tk.LEFT, padx=(5, 10))
+        status_filter.bind('<<ComboboxSelected>>', self.on_product_filter)
+        ttk.Label(filter_frame, text="Category:").pack(side=tk.LEFT)
+        self.category_filter_var = tk.StringVar(value=ALL_FILTER)
+        # Categories are read when the list is opened, so new ones show up
+        self.category_filter = ttk.Combobox(filter_frame, textvariable=self.category_filter_var, width=18,
+                                            state="readonly", postcommand=self.update_category_choices)
+        self.category_filter.pack(side=tk.LEFT, padx=(5, 0))
+        self.category_filter.bind('<<ComboboxSelected>>', self.on_product_filter)
+        
         # Treeview for products
         columns = ('ID', 'Name', 'Category', 'Cost USD', 'Cost DZD', 'Sale Price', 'Status')
         self.product_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=15)
@@ -241,12 +293,20 @@ class ProductManagerMultiUser:
             self.product_tree.heading(col, text=col)
             self.product_tree.column(col, width=100)
         
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.product_tree.yview)
-        self.product_tree.configure(yscrollcommand=scrollbar.set)
+        # Clicking a heading sorts by that column; clicking it again reverses the order
+        self.product_sort = 'id'
+        self.product_descending = False
+        self.product_headings = {sort: columns[position] for sort, (_, position, _) in PRODUCT_SORT_KEYS.items()}
+        for sort, col in self.product_headings.items():
+            self.product_tree.heading(col, command=lambda sort=sort: self.sort_products(sort))
+        self.show_sort_headings(self.product_tree, self.product_headings, self.product_sort, self.product_descending)
+        
+        # Scrollbar (fetches the next page when the end of the list comes into view)
+        self.product_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.product_tree.yview)
+        self.product_tree.configure(yscrollcommand=self.on_product_scroll)
         
         self.product_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.product_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Bind selection event
         self.product_tree.bind('<<TreeviewSelect>>', self.on_product_select)
@@ -275,40 +335,54 @@ class ProductManagerMultiUser:
         # Product selection for credit
         ttk.Label(credit_form_frame, text="Select Product:").grid(row=0, column=0, sticky=tk.W, pady=5)
         self.credit_product_var = tk.StringVar()
-        self.credit_product_combo = ttk.Combobox(credit_form_frame, textvariable=self.credit_product_var, width=25, state="readonly")
+        self.credit_product_combo = ttk.Combobox(credit_form_frame, textvariable=self.credit_product_var, width=25)
         self.credit_product_combo.grid(row=0, column=1, pady=5)
+        # Typing the start of a name lists the matching in-stock products
+        self.credit_product_combo.bind('<KeyRelease>', self.on_product_pick_key)
+        self.product_pick_job = None
+        self.product_choices = PrefixCache(self.products.in_stock_matching, PICKER_LIMIT)
         self.update_credit_products()
         
         # Customer name
         ttk.Label(credit_form_frame, text="Customer Name:").grid(row=1, column=0, sticky=tk.W, pady=5)
         self.customer_name_var = tk.StringVar()
-        ttk.Entry(credit_form_frame, textvariable=self.customer_name_var, width=25).grid(row=1, column=1, pady=5)
+        self.customer_combo = ttk.Combobox(credit_form_frame, textvariable=self.customer_name_var, width=25)
+        self.customer_combo.grid(row=1, column=1, pady=5)
+        # Suggest existing customers as the name is typed
+        self.customer_combo.bind('<KeyRelease>', self.on_customer_key)
+        self.customer_combo.bind('<<ComboboxSelected>>', self.update_customer_choices)
+        self.customer_job = None
+        
+        # What the customer already owes
+        self.customer_balance_var = tk.StringVar()
+        ttk.Label(credit_form_frame, textvariable=self.customer_balance_var, foreground="gray").grid(row=2, column=1, sticky=tk.W)
         
         # Total amount
-        ttk.Label(credit_form_frame, text="Total Amount:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        ttk.Label(credit_form_frame, text="Total Amount:").grid(row=3, column=0, sticky=tk.W, pady=5)
         self.total_amount_var = tk.StringVar()
         total_amount_entry = ttk.Entry(credit_form_frame, textvariable=self.total_amount_var, width=25)
-        total_amount_entry.grid(row=2, column=1, pady=5)
+        total_amount_entry.grid(row=3, column=1, pady=5)
         total_amount_entry.bind('<KeyRelease>', self.calculate_remaining)
         
         # Amount paid
-        ttk.Label(credit_form_frame, text="Amount Paid:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        ttk.Label(credit_form_frame, text="Amount Paid:").grid(row=4, column=0, sticky=tk.W, pady=5)
         self.amount_paid_var = tk.StringVar()
         amount_paid_entry = ttk.Entry(credit_form_frame, textvariable=self.amount_paid_var, width=25)
-        amount_paid_entry.grid(row=3, column=1, pady=5)
+        amount_paid_entry.grid(row=4, column=1, pady=5)
         amount_paid_entry.bind('<KeyRelease>', self.calculate_remaining)
         
         # Amount remaining (calculated)
-        ttk.Label(credit_form_frame, text="Amount Remaining:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        ttk.Label(credit_form_frame, text="Amount Remaining:").grid(row=5, column=0, sticky=tk.W, pady=5)
         self.amount_remaining_var = tk.StringVar()
-        ttk.Entry(credit_form_frame, textvariable=self.amount_remaining_var, width=25, state='readonly').grid(row=4, column=1, pady=5)
+        ttk.Entry(credit_form_frame, textvariable=self.amount_remaining_var, width=25, state='readonly').grid(row=5, column=1, pady=5)
         
         # Credit buttons
         credit_button_frame = ttk.Frame(credit_form_frame)
-        credit_button_frame.grid(row=5, column=0, columnspan=2, pady=10)
+        credit_button_frame.grid(row=6, column=0, columnspan=2, pady=10)
         
         ttk.Button(credit_button_frame, text="Create Credit Sale", command=self.create_credit_sale).pack(side=tk.LEFT, padx=2)
         ttk.Button(credit_button_frame, text="Add Payment", command=self.add_payment).pack(side=tk.LEFT, padx=2)
+        ttk.Button(credit_button_frame, text="Payment History", command=self.view_payment_history).pack(side=tk.LEFT, padx=2)
         ttk.Button(credit_button_frame, text="Clear", command=self.clear_credit_form).pack(side=tk.LEFT, padx=2)
         
         # Credit transactions list
@@ -323,12 +397,30 @@ class ProductManagerMultiUser:
             self.credit_tree.heading(col, text=col)
             self.credit_tree.column(col, width=100)
         
-        # Credit scrollbar
-        credit_scrollbar = ttk.Scrollbar(credit_list_frame, orient=tk.VERTICAL, command=self.credit_tree.yview)
-        self.credit_tree.configure(yscrollcommand=credit_scrollbar.set)
+        # Sortable headings (all but the product name, which comes from a join)
+        self.credit_sort = 'transaction_date'
+        self.credit_descending = True
+        self.credit_headings = {sort: credit_columns[position] for sort, (_, position, _) in CREDIT_SORT_KEYS.items()}
+        for sort, col in self.credit_headings.items():
+            self.credit_tree.heading(col, command=lambda sort=sort: self.sort_credits(sort))
+        self.show_sort_headings(self.credit_tree, self.credit_headings, self.credit_sort, self.credit_descending)
+        
+        # Credit scrollbar (fetches the next page when the end of the list comes into view)
+        self.credit_scrollbar = ttk.Scrollbar(credit_list_frame, orient=tk.VERTICAL, command=self.credit_tree.yview)
+        self.credit_tree.configure(yscrollcommand=self.on_credit_scroll)
+        
+        # Balance filter, under the list
+        balance_filter_frame = ttk.Frame(credit_list_frame)
+        balance_filter_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+        ttk.Label(balance_filter_frame, text="Show:").pack(side=tk.LEFT)
+        self.balance_filter_var = tk.StringVar(value=ALL_FILTER)
+        balance_filter = ttk.Combobox(balance_filter_frame, textvariable=self.balance_filter_var, width=12,
+                                      state="readonly", values=tuple(BALANCE_FILTERS))
+        balance_filter.pack(side=tk.LEFT, padx=(5, 0))
+        balance_filter.bind('<<ComboboxSelected>>', lambda event: self.load_credit_transactions())
         
         self.credit_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        credit_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.credit_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Load credit transactions
         self.load_credit_transactions()
@@ -354,26 +446,148 @@ class ProductManagerMultiUser:
     
     def switch_user(self):
         """Switch to different user"""
+        # Commit queued saves before another window opens the databases
+        self.writer.close()
         self.root.destroy()
         from user_manager import UserManager
         app = UserManager()
         app.run()
     
     def export_data(self):
-        """Export user data"""
+        """Export user data as a database backup, CSV, NDJSON or Parquet"""
+        # Imported on first use: it checks for pyarrow, which is slow to import
+        import data_export
+        
+        filetypes = [("Database backup", "*.db"), ("CSV files", "*.csv"), ("NDJSON files", "*.ndjson")]
+        if data_export.pyarrow is not None:
+            filetypes.append(("Parquet files", "*.parquet"))
         filename = filedialog.asksaveasfilename(
             title="Export Data",
             defaultextension=".db",
-            filetypes=[("Database files", "*.db"), ("All files", "*.*")]
+            filetypes=filetypes + [("All files", "*.*")]
         )
-        if filename:
+        if not filename:
+            return
+        
+        try:
+            data_export.export_format(filename)
+        except (ValueError, RuntimeError) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        db_filename, user_id = user_database(self.username, self.user_id)
+        
+        def work(report):
+            return data_export.export_database(
+                db_filename, filename,
+                progress=lambda path, done, total: report(
+                    f"{os.path.basename(path)}: " + (f"{done} of {total} pages" if total else f"{done} rows")),
+                user_id=user_id)
+        
+        self.run_in_background("Exporting Data", f"Writing {os.path.basename(filename)}...", work,
+                               lambda message: messagebox.showinfo("Success", message),
+                               lambda e: messagebox.showerror("Error", f"Failed to export data: {str(e)}"))
+    
+    def import_products(self):
+        """Import products from a CSV or Excel file in the background"""
+        # Imported on first use: it checks for openpyxl, which is slow to import
+        import product_import
+        
+        filetypes = [("CSV files", "*.csv"), ("All files", "*.*")]
+        if product_import.openpyxl is not None:
+            filetypes.insert(1, ("Excel files", "*.xlsx"))
+        filename = filedialog.askopenfilename(title="Import Products", filetypes=filetypes)
+        if not filename:
+            return
+        
+        def work(report):
+            # The import runs on its own connection, off the Tk thread
+            conn, products, _ = open_user_storage(self.username, self.user_id)
+            try:
+                return product_import.import_products(
+                    products, filename, self.usd_to_dzd_rate,
+                    progress=lambda r: report(f"{r.rows_read} rows read, {r.imported} imported"))
+            finally:
+                conn.close()
+        
+        self.run_in_background("Importing Products", f"Reading {os.path.basename(filename)}...",
+                               work, self.finish_import,
+                               lambda e: messagebox.showerror("Error", f"Failed to import products: {str(e)}"))
+    
+    def finish_import(self, result):
+        """Report the outcome of a background import and show the new products"""
+        self.load_products()
+        if self.credit_tab_built:
+            self.update_credit_products()
+        
+        message = f"Imported {result.imported} of {result.rows_read} rows."
+        if result.errors:
+            details = "\n".join(f"Line {line}: {error}" for line, error in result.errors[:10])
+            if len(result.errors) > 10:
+                details += f"\n... and {len(result.errors) - 10} more"
+            messagebox.showwarning("Import Products", f"{message}\n\nSkipped rows:\n{details}")
+        else:
+            messagebox.showinfo("Import Products", message)
+    
+    def run_in_background(self, title, message, work, on_done, on_error):
+        """Run work(report) on a thread behind a modal progress window
+        
+        work may call report(text) to update the window. on_done(result) or
+        on_error(exception) is then called on the Tk thread.
+        """
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title(title)
+        progress_window.geometry("380x110")
+        progress_window.transient(self.root)
+        progress_window.grab_set()
+        progress_window.protocol("WM_DELETE_WINDOW", lambda: None)  # Wait for the work to finish
+        
+        progress_var = tk.StringVar(value=message)
+        ttk.Label(progress_window, textvariable=progress_var).pack(pady=(15, 5))
+        progress_bar = ttk.Progressbar(progress_window, mode='indeterminate', length=300)
+        progress_bar.pack(pady=5)
+        progress_bar.start(10)
+        
+        # The thread never touches Tk; it reports back through this queue
+        updates = queue.Queue()
+        
+        def run():
             try:
-                import shutil
-                db_filename = f'products_{self.username}.db'
-                shutil.copy2(db_filename, filename)
-                messagebox.showinfo("Success", f"Data exported to {filename}")
+                updates.put(('done', work(lambda text: updates.put(('progress', text)))))
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to export data: {str(e)}")
+                updates.put(('error', e))
+        
+        def poll():
+            try:
+                while True:
+                    kind, value = updates.get_nowait()
+                    if kind == 'progress':
+                        progress_var.set(value)
+                        continue
+                    progress_window.destroy()
+                    (on_done if kind == 'done' else on_error)(value)
+                    return
+            except queue.Empty:
+                pass
+            self.root.after(BACKGROUND_POLL_MS, poll)
+        
+        threading.Thread(target=run, name=title, daemon=True).start()
+        self.root.after(BACKGROUND_POLL_MS, poll)
+    
+    def verify_credit_summary(self):
+        """Check the maintained credit totals against a full recount"""
+        mismatches = self.credits.verify_summary()
+        if not mismatches:
+            messagebox.showinfo("Credit Summary", "Credit summary totals are up to date.")
+            return
+        
+        details = "\n".join(f"{column}: stored {stored:.2f}, actual {actual:.2f}"
+                            for column, stored, actual in mismatches)
+        if messagebox.askyesno("Credit Summary",
+                               f"Credit summary totals have drifted:\n\n{details}\n\nRebuild them now?"):
+            self.credits.rebuild_summary()
+            if self.credit_tab_built:
+                self.update_credit_summary()
     
     # Copy all the methods from the original ProductManager class
     # (calculate_dzd, browse_picture, browse_package_image, add_product, etc.)
@@ -396,6 +610,7 @@ class ProductManagerMultiUser:
         if file_path:
             self.picture_path_var.set(file_path)
             self.picture_label.config(text=os.path.basename(file_path))
+            self.image_loader.prefetch(file_path)
     
     def browse_package_image(self):
         """Browse for package image"""
@@ -406,6 +621,33 @@ class ProductManagerMultiUser:
         if file_path:
             self.package_image_path_var.set(file_path)
             self.package_img_label.config(text=os.path.basename(file_path))
+            self.image_loader.prefetch(file_path)
+    
+    def submit_write(self, work, on_done, describe_error, on_failed=None):
+        """Run work(products, credits) on the writer thread and keep the window responsive
+        
+        on_done(result) runs once the write is committed and returns the status
+        line to show; describe_error(exception) returns the message for a failure,
+        after on_failed() (if given) has put the submitted input back.
+        """
+        def done(result):
+            self.show_write_status(on_done(result))
+        
+        def failed(e):
+            self.show_write_status("Save failed")
+            if on_failed is not None:
+                on_failed()
+            messagebox.showerror("Error", describe_error(e))
+        
+        self.writer.submit(work, done, failed)
+        self.show_write_status()
+    
+    def show_write_status(self, message=None):
+        """Show how many writes are still queued, or message once all are saved"""
+        if self.writer.pending:
+            self.write_status_var.set(f"Saving {self.writer.pending} change(s)...")
+        elif message:
+            self.write_status_var.set(message)
     
     def add_product(self):
         """Add a new product to the database"""
@@ -414,35 +656,24 @@ class ProductManagerMultiUser:
             return
         
         try:
-            self.cursor.execute('''
-                INSERT INTO products (name, category, cost_price_usd, cost_price_dzd, 
-                                    transport_price, sale_price, picture_path, package_size,
-                                    package_image_path, arrival_date, sale_date, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                self.name_var.get(),
-                self.category_var.get(),
-                float(self.cost_usd_var.get()) if self.cost_usd_var.get() else 0,
-                float(self.cost_dzd_var.get()) if self.cost_dzd_var.get() else 0,
-                float(self.transport_var.get()) if self.transport_var.get() else 0,
-                float(self.sale_price_var.get()) if self.sale_price_var.get() else 0,
-                self.picture_path_var.get(),
-                self.package_size_var.get(),
-                self.package_image_path_var.get(),
-                self.arrival_date_var.get(),
-                self.sale_date_var.get(),
-                self.status_var.get()
-            ))
-            
-            self.conn.commit()
-            messagebox.showinfo("Success", "Product added successfully!")
-            self.clear_form()
-            self.load_products()
-            
-        except ValueError as e:
+            product = self.get_form_product()
+        except ValueError:
             messagebox.showerror("Error", "Please enter valid numeric values for prices!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to add product: {str(e)}")
+            return
+        
+        # The form is free for the next product while this one is saved; a
+        # failed save puts the product back in it
+        form = self.form_state(self.product_form_vars())
+        self.clear_form()
+        
+        def done(product_id):
+            self.changes.product_changed(product_id)
+            self.apply_changes()
+            return f"Product '{product['name']}' added"
+        
+        self.submit_write(lambda products, credits: products.add(product), done,
+                          lambda e: f"Failed to add product '{product['name']}': {str(e)}",
+                          lambda: self.restore_product_form(form))
     
     def update_product(self):
         """Update selected product"""
@@ -456,39 +687,24 @@ class ProductManagerMultiUser:
             return
         
         try:
-            item = self.product_tree.item(selection[0])
-            product_id = item['values'][0]
-            
-            self.cursor.execute('''
-                UPDATE products SET name=?, category=?, cost_price_usd=?, cost_price_dzd=?, 
-                                  transport_price=?, sale_price=?, picture_path=?, package_size=?,
-                                  package_image_path=?, arrival_date=?, sale_date=?, status=?
-                WHERE id=?
-            ''', (
-                self.name_var.get(),
-                self.category_var.get(),
-                float(self.cost_usd_var.get()) if self.cost_usd_var.get() else 0,
-                float(self.cost_dzd_var.get()) if self.cost_dzd_var.get() else 0,
-                float(self.transport_var.get()) if self.transport_var.get() else 0,
-                float(self.sale_price_var.get()) if self.sale_price_var.get() else 0,
-                self.picture_path_var.get(),
-                self.package_size_var.get(),
-                self.package_image_path_var.get(),
-                self.arrival_date_var.get(),
-                self.sale_date_var.get(),
-                self.status_var.get(),
-                product_id
-            ))
-            
-            self.conn.commit()
-            messagebox.showinfo("Success", "Product updated successfully!")
-            self.clear_form()
-            self.load_products()
-            
-        except ValueError as e:
+            product = self.get_form_product()
+        except ValueError:
             messagebox.showerror("Error", "Please enter valid numeric values for prices!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to update product: {str(e)}")
+            return
+        
+        item = self.product_tree.item(selection[0])
+        product_id = item['values'][0]
+        form = self.form_state(self.product_form_vars())
+        self.clear_form()
+        
+        def done(result):
+            self.changes.product_changed(product_id)
+            self.apply_changes()
+            return f"Product '{product['name']}' updated"
+        
+        self.submit_write(lambda products, credits: products.update(product_id, product), done,
+                          lambda e: f"Failed to update product '{product['name']}': {str(e)}",
+                          lambda: self.restore_product_form(form))
     
     def delete_product(self):
         """Delete selected product"""
@@ -497,20 +713,68 @@ class ProductManagerMultiUser:
             messagebox.showerror("Error", "Please select a product to delete!")
             return
         
-        if messagebox.askyesno("Confirm", "Are you sure you want to delete this product?"):
-            try:
-                item = self.product_tree.item(selection[0])
-                product_id = item['values'][0]
-                
-                self.cursor.execute('DELETE FROM products WHERE id=?', (product_id,))
-                self.conn.commit()
-                
-                messagebox.showinfo("Success", "Product deleted successfully!")
-                self.clear_form()
-                self.load_products()
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to delete product: {str(e)}")
+        if not messagebox.askyesno("Confirm", "Are you sure you want to delete this product?"):
+            return
+        
+        item = self.product_tree.item(selection[0])
+        product_id = item['values'][0]
+        self.clear_form()
+        
+        def done(result):
+            self.changes.product_changed(product_id)
+            self.apply_changes()
+            return "Product deleted"
+        
+        def describe_error(e):
+            if isinstance(e, sqlite3.IntegrityError):
+                return ("This product has credit transactions and cannot be deleted. "
+                        "Mark it as Sold or Damaged instead.")
+            return f"Failed to delete product: {str(e)}"
+        
+        self.submit_write(lambda products, credits: products.delete(product_id), done, describe_error)
+    
+    def get_form_product(self):
+        """Return the product form as a dict of repository fields (raises ValueError on bad prices)"""
+        return {
+            'name': self.name_var.get(),
+            'category': self.category_var.get(),
+            'cost_price_usd': float(self.cost_usd_var.get()) if self.cost_usd_var.get() else 0,
+            'cost_price_dzd': float(self.cost_dzd_var.get()) if self.cost_dzd_var.get() else 0,
+            'transport_price': float(self.transport_var.get()) if self.transport_var.get() else 0,
+            'sale_price': float(self.sale_price_var.get()) if self.sale_price_var.get() else 0,
+            'picture_path': self.picture_path_var.get(),
+            'package_size': self.package_size_var.get(),
+            'package_image_path': self.package_image_path_var.get(),
+            'arrival_date': self.arrival_date_var.get(),
+            'sale_date': self.sale_date_var.get(),
+            'status': self.status_var.get(),
+        }
+    
+    def product_form_vars(self):
+        """Return the variables of the product form"""
+        return [self.name_var, self.category_var, self.cost_usd_var, self.cost_dzd_var, self.transport_var,
+                self.sale_price_var, self.picture_path_var, self.package_size_var, self.package_image_path_var,
+                self.arrival_date_var, self.sale_date_var, self.status_var]
+    
+    def form_state(self, variables):
+        """Return the current values of form variables, for restore_form"""
+        return [(var, var.get()) for var in variables]
+    
+    def restore_form(self, state):
+        """Put values saved by form_state back in the form"""
+        for var, value in state:
+            var.set(value)
+    
+    def restore_product_form(self, state):
+        """Put a product whose save failed back in the product form"""
+        self.restore_form(state)
+        self.update_picture_labels()
+    
+    def update_picture_labels(self):
+        """Show the file names of the form's picture and package image"""
+        for path, label in ((self.picture_path_var.get(), self.picture_label),
+                            (self.package_image_path_var.get(), self.package_img_label)):
+            label.config(text=os.path.basename(path) if path else "No image selected")
     
     def clear_form(self):
         """Clear all form fields"""
@@ -526,15 +790,154 @@ class ProductManagerMultiUser:
         self.arrival_date_var.set(datetime.now().strftime("%Y-%m-%d"))
     
     def load_products(self):
-        """Load products from database into the treeview"""
+        """Load the first page of products into the treeview"""
         # Clear existing items
-        for item in self.product_tree.get_children():
-            self.product_tree.delete(item)
+        self.product_tree.delete(*self.product_tree.get_children())
         
-        # Load products
-        self.cursor.execute('SELECT id, name, category, cost_price_usd, cost_price_dzd, sale_price, status FROM products')
-        for row in self.cursor.fetchall():
-            self.product_tree.insert('', 'end', values=row)
+        self.search_active = False
+        
+        # Keyset pagination state: rows are loaded in the sort order after last_product_row
+        self.last_product_row = None
+        self.products_exhausted = False
+        self.product_page_pending = False
+        
+        self.load_more_products()
+    
+    def load_more_products(self):
+        """Fetch the next page of products after the last loaded row"""
+        self.product_page_pending = False
+        if self.products_exhausted:
+            return
+        
+        status, category = self.product_filters()
+        rows = self.products.sorted_page(self.product_sort, self.product_descending, status, category,
+                                         self.last_product_row, PRODUCT_PAGE_SIZE)
+        for row in rows:
+            self.product_tree.insert('', 'end', iid=str(row[0]), values=row)
+        
+        if rows:
+            self.last_product_row = rows[-1]
+        if len(rows) < PRODUCT_PAGE_SIZE:
+            self.products_exhausted = True
+    
+    def product_filters(self):
+        """Return the (status, category) chosen in the filters, None for all"""
+        status = self.status_filter_var.get()
+        category = self.category_filter_var.get()
+        return (None if status == ALL_FILTER else status,
+                None if category == ALL_FILTER else category)
+    
+    def product_list_sorted(self):
+        """Whether the product list is sorted or filtered differently from id order"""
+        return self.product_sort != 'id' or self.product_descending or self.product_filters() != (None, None)
+    
+    def update_category_choices(self):
+        """Offer the current product categories in the category filter"""
+        self.category_filter['values'] = (ALL_FILTER,) + tuple(self.products.categories())
+    
+    def on_product_filter(self, event=None):
+        """Show the products matching the chosen status and category"""
+        # The search shows its own ranked results, so leave it for the filtered list
+        self.search_var.set("")
+        self.load_products()
+    
+    def sort_products(self, sort):
+        """Sort the product list by a column, reversing the order on a second click"""
+        self.product_descending = not self.product_descending if sort == self.product_sort else False
+        self.product_sort = sort
+        self.show_sort_headings(self.product_tree, self.product_headings, self.product_sort, self.product_descending)
+        self.search_var.set("")
+        self.load_products()
+    
+    def show_sort_headings(self, tree, headings, sort, descending):
+        """Mark the sorted column's heading with the sort direction"""
+        for key, col in headings.items():
+            arrow = (" \u25bc" if descending else " \u25b2") if key == sort else ""
+            tree.heading(col, text=col + arrow)
+    
+    def on_product_scroll(self, first, last):
+        """Keep the scrollbar in sync and load another page near the end of the list"""
+        self.product_scrollbar.set(first, last)
+        if float(last) >= 0.9 and not self.products_exhausted and not self.product_page_pending:
+            # Defer the fetch so we don't insert rows from inside the scroll callback
+            self.product_page_pending = True
+            self.root.after_idle(self.load_more_products)
+    
+    def apply_changes(self):
+        """Refresh only the product and credit rows touched since the last mutation"""
+        product_ids, credit_ids = self.changes.drain()
+        
+        if product_ids and self.credit_tab_built:
+            # Product names or statuses changed under the credit sale picker
+            self.product_choices.clear()
+        
+        # A sorted or filtered list cannot tell where a changed row now belongs (or
+        # whether it still does), so it reloads its first page instead of patching rows
+        reload_products = product_ids and not self.search_active and self.product_list_sorted()
+        for product_id in product_ids:
+            if not reload_products:
+                self.refresh_product_row(product_id)
+            
+            # Credit rows show the product name (and disappear with a deleted
+            # product), so follow the product to its credits
+            if self.credit_tab_built:
+                credit_ids.update(self.credits.ids_for_product(product_id))
+        if reload_products:
+            self.load_products()
+
+        if not self.credit_tab_built:
+            # The credit tab reads everything fresh when it is built
+            return
+        if credit_ids and self.credit_list_sorted():
+            self.load_credit_transactions()
+        else:
+            for credit_id in credit_ids:
+                self.refresh_credit_row(credit_id)
+        
+        if credit_ids:
+            self.update_credit_summary()
+    
+    def refresh_product_row(self, product_id):
+        """Patch a single product row in place instead of reloading the whole list"""
+        iid = str(product_id)
+        row = self.products.list_row(product_id)
+        
+        if row is None:
+            # Product was deleted
+            if self.product_tree.exists(iid):
+                self.product_tree.delete(iid)
+        elif self.product_tree.exists(iid):
+            self.product_tree.item(iid, values=row)
+        elif self.products_exhausted and not self.search_active:
+            # New products have the highest id, so they belong at the end of the loaded list.
+            # If more pages are still pending, the row will arrive with them instead.
+            self.product_tree.insert('', 'end', iid=iid, values=row)
+            self.last_product_row = row
+    
+    def on_search_key(self, event=None):
+        """Schedule a product search once typing pauses"""
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DELAY_MS, self.search_products)
+    
+    def search_products(self):
+        """Show the products matching the search box, best matches first"""
+        self.search_job = None
+        text = self.search_var.get().strip()
+        if not text:
+            # Back to the normal paged list
+            self.load_products()
+            return
+        
+        rows = self.products.search(text)
+        
+        self.product_tree.delete(*self.product_tree.get_children())
+        for row in rows:
+            self.product_tree.insert('', 'end', iid=str(row[0]), values=row)
+        
+        # Results are a single ranked page, so disable scroll paging
+        self.search_active = True
+        self.products_exhausted = True
     
     def on_product_select(self, event):
         """Handle product selection in treeview"""
@@ -544,8 +947,7 @@ class ProductManagerMultiUser:
             product_id = item['values'][0]
             
             # Load product details from database
-            self.cursor.execute('SELECT * FROM products WHERE id=?', (product_id,))
-            product = self.cursor.fetchone()
+            product = self.products.get(product_id)
             
             if product:
                 # Fill form with product data
@@ -562,16 +964,7 @@ class ProductManagerMultiUser:
                 self.sale_date_var.set(product[11] or "")  # sale_date
                 self.status_var.set(product[12] or "In Stock")  # status
                 
-                # Update picture labels
-                if product[7]:
-                    self.picture_label.config(text=os.path.basename(product[7]))
-                else:
-                    self.picture_label.config(text="No image selected")
-                
-                if product[9]:
-                    self.package_img_label.config(text=os.path.basename(product[9]))
-                else:
-                    self.package_img_label.config(text="No image selected")
+                self.update_picture_labels()
     
     def view_product_details(self):
         """View detailed information about selected product"""
@@ -584,8 +977,7 @@ class ProductManagerMultiUser:
         product_id = item['values'][0]
         
         # Load product details from database
-        self.cursor.execute('SELECT * FROM products WHERE id=?', (product_id,))
-        product = self.cursor.fetchone()
+        product = self.products.get(product_id)
         
         if product:
             # Create details window
@@ -632,37 +1024,29 @@ class ProductManagerMultiUser:
                     row=i, column=1, sticky=tk.W, pady=5
                 )
             
-            # Product image
+            # Product image (a placeholder is shown until the background decode finishes)
             if product[7] and os.path.exists(product[7]):
-                try:
-                    image_frame = ttk.LabelFrame(scrollable_frame, text="Product Image", padding=20)
-                    image_frame.pack(fill=tk.X, padx=20, pady=10)
-                    
-                    image = Image.open(product[7])
-                    image.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                    photo = ImageTk.PhotoImage(image)
-                    
-                    image_label = tk.Label(image_frame, image=photo, bg="#f0f0f0")
-                    image_label.image = photo  # Keep a reference
-                    image_label.pack()
-                except Exception as e:
-                    print(f"Error loading image: {e}")
+                image_frame = ttk.LabelFrame(scrollable_frame, text="Product Image", padding=20)
+                image_frame.pack(fill=tk.X, padx=20, pady=10)
+                
+                image_label = tk.Label(image_frame, text="Loading image...", bg="#f0f0f0")
+                image_label.pack()
+                self.image_loader.load(
+                    product[7],
+                    lambda photo, error: self.show_loaded_image(image_label, photo, error, "image")
+                )
             
             # Package image
             if product[9] and os.path.exists(product[9]):
-                try:
-                    package_frame = ttk.LabelFrame(scrollable_frame, text="Package Image", padding=20)
-                    package_frame.pack(fill=tk.X, padx=20, pady=10)
-                    
-                    package_image = Image.open(product[9])
-                    package_image.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                    package_photo = ImageTk.PhotoImage(package_image)
-                    
-                    package_label = tk.Label(package_frame, image=package_photo, bg="#f0f0f0")
-                    package_label.image = package_photo  # Keep a reference
-                    package_label.pack()
-                except Exception as e:
-                    print(f"Error loading package image: {e}")
+                package_frame = ttk.LabelFrame(scrollable_frame, text="Package Image", padding=20)
+                package_frame.pack(fill=tk.X, padx=20, pady=10)
+                
+                package_label = tk.Label(package_frame, text="Loading image...", bg="#f0f0f0")
+                package_label.pack()
+                self.image_loader.load(
+                    product[9],
+                    lambda photo, error: self.show_loaded_image(package_label, photo, error, "package image")
+                )
             
             # Profit calculation
             if product[3] and product[6]:  # cost_price_usd and sale_price
@@ -681,6 +1065,20 @@ class ProductManagerMultiUser:
             canvas.pack(side="left", fill="both", expand=True)
             scrollbar.pack(side="right", fill="y")
     
+    def show_loaded_image(self, label, photo, error, description):
+        """Replace an image placeholder once the background decode has finished"""
+        if not label.winfo_exists():
+            # The details window was closed while the image was loading
+            return
+        
+        if error is not None:
+            print(f"Error loading {description}: {error}")
+            label.config(text=f"Could not load {description}")
+            return
+        
+        label.config(image=photo, text="")
+        label.image = photo  # Keep a reference
+    
     # Credit management methods
     def calculate_remaining(self, event=None):
         """Calculate remaining amount for credit"""
@@ -694,10 +1092,48 @@ class ProductManagerMultiUser:
     
     def update_credit_products(self):
         """Update the product dropdown for credit sales"""
-        self.cursor.execute('SELECT id, name, sale_price FROM products WHERE status="In Stock"')
-        products = self.cursor.fetchall()
-        product_list = [f"{p[0]} - {p[1]} (${p[2]:.2f})" for p in products]
-        self.credit_product_combo['values'] = product_list
+        # Stock changed, so cached matches may be stale
+        self.product_choices.clear()
+        self.show_product_choices()
+    
+    def on_product_pick_key(self, event=None):
+        """Schedule a product lookup once typing pauses"""
+        if self.product_pick_job is not None:
+            self.root.after_cancel(self.product_pick_job)
+        self.product_pick_job = self.root.after(SEARCH_DELAY_MS, self.show_product_choices)
+    
+    def show_product_choices(self, event=None):
+        """List the first in-stock products whose name starts with the typed text"""
+        self.product_pick_job = None
+        text = self.credit_product_var.get()
+        if PRODUCT_CHOICE.match(text):
+            # A product was picked from the list rather than typed
+            return
+        
+        # Only the top matches are fetched, from the status and name index
+        products = self.product_choices.get(text.lstrip())
+        self.credit_product_combo['values'] = [f"{p[0]} - {p[1]} (${p[2] or 0:.2f})" for p in products]
+    
+    def on_customer_key(self, event=None):
+        """Schedule a customer lookup once typing pauses"""
+        if self.customer_job is not None:
+            self.root.after_cancel(self.customer_job)
+        self.customer_job = self.root.after(SEARCH_DELAY_MS, self.update_customer_choices)
+    
+    def update_customer_choices(self, event=None):
+        """Offer the customers whose name starts with the typed text and show the typed customer's balance"""
+        self.customer_job = None
+        text = self.customer_name_var.get()
+        # A range of the customer name index, so this stays fast with many customers
+        self.customer_combo['values'] = [customer[1] for customer in self.credits.customers(text)]
+        
+        customer = self.credits.customer(text) if text.strip() else None
+        if customer:
+            self.customer_balance_var.set(f"Owes ${customer[4]:.2f} on {customer[2]} credit(s)")
+        elif text.strip():
+            self.customer_balance_var.set("New customer")
+        else:
+            self.customer_balance_var.set("")
     
     def create_credit_sale(self):
         """Create a new credit sale"""
@@ -705,101 +1141,218 @@ class ProductManagerMultiUser:
             messagebox.showerror("Error", "Please select a product and enter customer name!")
             return
         
+        # Extract product ID from selection
+        choice = PRODUCT_CHOICE.match(self.credit_product_var.get())
+        if not choice:
+            messagebox.showerror("Error", "Please choose a product from the list!")
+            return
+        product_id = int(choice.group(1))
+        
         try:
-            # Extract product ID from selection
-            product_id = int(self.credit_product_var.get().split(' - ')[0])
-            
             total_amount = float(self.total_amount_var.get()) if self.total_amount_var.get() else 0
             amount_paid = float(self.amount_paid_var.get()) if self.amount_paid_var.get() else 0
-            amount_remaining = total_amount - amount_paid
-            
-            # Insert credit transaction
-            self.cursor.execute('''
-                INSERT INTO credit_transactions (product_id, customer_name, amount_paid, amount_remaining, transaction_date)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                product_id,
-                self.customer_name_var.get(),
-                amount_paid,
-                amount_remaining,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ))
-            
-            # Update product status if fully paid
-            if amount_remaining <= 0:
-                self.cursor.execute('UPDATE products SET status="Sold", sale_date=? WHERE id=?', 
-                                  (datetime.now().strftime("%Y-%m-%d"), product_id))
-            else:
-                self.cursor.execute('UPDATE products SET status="Reserved" WHERE id=?', (product_id,))
-            
-            self.conn.commit()
-            messagebox.showinfo("Success", "Credit sale created successfully!")
-            
-            self.clear_credit_form()
-            self.load_credit_transactions()
-            self.update_credit_summary()
-            self.load_products()  # Refresh product list
-            
         except ValueError:
             messagebox.showerror("Error", "Please enter valid numeric values!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to create credit sale: {str(e)}")
+            return
+        
+        customer_name = self.customer_name_var.get().strip()
+        form = self.form_state([self.credit_product_var, self.customer_name_var, self.total_amount_var,
+                                self.amount_paid_var, self.amount_remaining_var])
+        self.clear_credit_form()
+        
+        def done(credit_id):
+            self.changes.credit_changed(credit_id)
+            self.changes.product_changed(product_id)
+            self.apply_changes()
+            self.update_credit_products()
+            return f"Credit sale to {customer_name} created"
+        
+        # Record the credit and mark the product Sold/Reserved in one transaction
+        self.submit_write(
+            lambda products, credits: credits.create_sale(product_id, customer_name, total_amount, amount_paid),
+            done, lambda e: f"Failed to create credit sale: {str(e)}", lambda: self.restore_form(form))
     
     def add_payment(self):
-        """Add a payment to existing credit"""
-        messagebox.showinfo("Info", "Payment addition functionality - select a credit transaction first")
+        """Record a payment against the selected credit transaction"""
+        selection = self.credit_tree.selection()
+        if not selection:
+            messagebox.showerror("Error", "Please select a credit transaction first!")
+            return
+        credit_id = int(selection[0])
+        
+        row = self.credits.list_row(credit_id)
+        if row is None:
+            messagebox.showerror("Error", "This credit transaction no longer exists!")
+            return
+        
+        remaining = round(row[5] or 0, 2)
+        if remaining <= 0:
+            messagebox.showinfo("Info", "This credit is already paid off.")
+            return
+        
+        # Payments still queued are not in this balance yet, so maxvalue only
+        # guides the user; add_payment checks the balance again when it runs
+        amount = simpledialog.askfloat(
+            "Add Payment",
+            f"Payment from {row[2]} for {row[1]}\nRemaining: ${remaining:.2f}\n\nAmount:",
+            parent=self.root, minvalue=0.01, maxvalue=remaining
+        )
+        if amount is None:
+            return
+        
+        product_id = self.credits.product_id(credit_id)
+        
+        def done(result):
+            self.changes.credit_changed(credit_id)
+            # Paying off the credit marks its product Sold
+            if product_id is not None:
+                self.changes.product_changed(product_id)
+            self.apply_changes()
+            return f"Payment of ${amount:.2f} from {row[2]} recorded"
+        
+        # One insert into the payment ledger; triggers update the balances and totals
+        self.submit_write(lambda products, credits: credits.add_payment(credit_id, amount), done,
+                          lambda e: f"Failed to add payment: {str(e)}")
+    
+    def view_payment_history(self):
+        """Show the selected credit's payments and its customer's balance history"""
+        selection = self.credit_tree.selection()
+        if not selection:
+            messagebox.showerror("Error", "Please select a credit transaction first!")
+            return
+        credit_id = int(selection[0])
+        
+        row = self.credits.list_row(credit_id)
+        if row is None:
+            messagebox.showerror("Error", "This credit transaction no longer exists!")
+            return
+        customer_name = row[2]
+        
+        history_window = tk.Toplevel(self.root)
+        history_window.title(f"Payment History - {customer_name}")
+        history_window.geometry("700x550")
+        history_window.configure(bg="#f0f0f0")
+        
+        # Running totals are computed by window functions in the queries
+        sections = [
+            (f"Payments on credit #{credit_id} ({row[1]})",
+             ('Date', 'Type', 'Amount', 'Paid to Date', 'Balance'),
+             [(p[1], p[2], f"{p[3]:.2f}", f"{p[4]:.2f}", f"{p[5]:.2f}")
+              for p in self.credits.payments(credit_id)]),
+            (f"Balance history for {customer_name}",
+             ('Date', 'Credit', 'Type', 'Charge', 'Payment', 'Balance'),
+             [(h[0], h[1], h[2], f"{h[3]:.2f}" if h[3] else "", f"{h[4]:.2f}" if h[4] else "", f"{h[5]:.2f}")
+              for h in self.credits.customer_history(customer_name)]),
+        ]
+        
+        for title, columns, rows in sections:
+            frame = ttk.LabelFrame(history_window, text=title, padding=10)
+            frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+            
+            tree = ttk.Treeview(frame, columns=columns, show='headings', height=8)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=110)
+            
+            scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            
+            for values in rows:
+                tree.insert('', 'end', values=values)
     
     def clear_credit_form(self):
         """Clear credit form fields"""
         self.credit_product_var.set("")
         self.customer_name_var.set("")
+        self.customer_balance_var.set("")
         self.total_amount_var.set("")
         self.amount_paid_var.set("")
         self.amount_remaining_var.set("")
     
     def load_credit_transactions(self):
-        """Load credit transactions into the treeview"""
+        """Load the first page of credit transactions into the treeview"""
         # Clear existing items
-        for item in self.credit_tree.get_children():
-            self.credit_tree.delete(item)
-        
-        # Load transactions with product details
-        self.cursor.execute('''
-            SELECT ct.id, p.name, ct.customer_name, 
-                   (ct.amount_paid + ct.amount_remaining) as total,
-                   ct.amount_paid, ct.amount_remaining, ct.transaction_date
-            FROM credit_transactions ct
-            JOIN products p ON ct.product_id = p.id
-            ORDER BY ct.transaction_date DESC
-        ''')
-        
-        for row in self.cursor.fetchall():
-            self.credit_tree.insert('', 'end', values=row)
+        self.credit_tree.delete(*self.credit_tree.get_children())
+        
+        # Keyset pagination state, as for the product list
+        self.last_credit_row = None
+        self.newest_credit_id = 0
+        self.credits_exhausted = False
+        self.credit_page_pending = False
+        
+        self.load_more_credits()
+    
+    def load_more_credits(self):
+        """Fetch the next page of credit transactions after the last loaded row"""
+        self.credit_page_pending = False
+        if self.credits_exhausted:
+            return
+        
+        rows = self.credits.sorted_page(self.credit_sort, self.credit_descending,
+                                        BALANCE_FILTERS[self.balance_filter_var.get()],
+                                        self.last_credit_row, CREDIT_PAGE_SIZE)
+        for row in rows:
+            self.credit_tree.insert('', 'end', iid=str(row[0]), values=row)
+            self.newest_credit_id = max(self.newest_credit_id, row[0])
+        
+        if rows:
+            self.last_credit_row = rows[-1]
+        if len(rows) < CREDIT_PAGE_SIZE:
+            self.credits_exhausted = True
+    
+    def on_credit_scroll(self, first, last):
+        """Keep the scrollbar in sync and load another page near the end of the list"""
+        self.credit_scrollbar.set(first, last)
+        if float(last) >= 0.9 and not self.credits_exhausted and not self.credit_page_pending:
+            self.credit_page_pending = True
+            self.root.after_idle(self.load_more_credits)
+    
+    def credit_list_sorted(self):
+        """Whether the credit list is sorted or filtered differently from newest first"""
+        return (self.credit_sort != 'transaction_date' or not self.credit_descending
+                or BALANCE_FILTERS[self.balance_filter_var.get()] is not None)
+    
+    def sort_credits(self, sort):
+        """Sort the credit list by a column, reversing the order on a second click"""
+        self.credit_descending = not self.credit_descending if sort == self.credit_sort else False
+        self.credit_sort = sort
+        self.show_sort_headings(self.credit_tree, self.credit_headings, self.credit_sort, self.credit_descending)
+        self.load_credit_transactions()
+    
+    def refresh_credit_row(self, credit_id):
+        """Patch a single credit transaction row in place"""
+        iid = str(credit_id)
+        row = self.credits.list_row(credit_id)
+        
+        if row is None:
+            # Credit (or its product) was deleted
+            if self.credit_tree.exists(iid):
+                self.credit_tree.delete(iid)
+        elif self.credit_tree.exists(iid):
+            self.credit_tree.item(iid, values=row)
+        elif credit_id > self.newest_credit_id:
+            # The list is ordered newest first, so new credits go on top (older
+            # credits not loaded yet arrive with their page instead)
+            self.credit_tree.insert('', 0, iid=iid, values=row)
+            self.newest_credit_id = credit_id
     
     def update_credit_summary(self):
         """Update credit summary statistics"""
-        # Calculate totals
-        self.cursor.execute('''
-            SELECT 
-                SUM(amount_paid + amount_remaining) as total_credits,
-                SUM(amount_paid) as total_paid,
-                SUM(amount_remaining) as total_outstanding
-            FROM credit_transactions
-        ''')
-        
-        result = self.cursor.fetchone()
-        if result:
-            total_credits = result[0] or 0
-            total_paid = result[1] or 0
-            total_outstanding = result[2] or 0
-            
-            self.total_credits_var.set(f"${total_credits:.2f}")
-            self.total_paid_var.set(f"${total_paid:.2f}")
-            self.total_outstanding_var.set(f"${total_outstanding:.2f}")
+        # Totals are maintained by triggers on credit_transactions
+        total_credits, total_paid, total_outstanding = self.credits.summary()
+        
+        self.total_credits_var.set(f"${total_credits:.2f}")
+        self.total_paid_var.set(f"${total_paid:.2f}")
+        self.total_outstanding_var.set(f"${total_outstanding:.2f}")
     
     def run(self):
         """Start the application"""
         self.root.mainloop()
+        self.image_loader.shutdown()
+        # Saves still queued when the window closed are committed before exiting
+        self.writer.close()
         self.conn.close()
 
 if __name__ == "__main__":
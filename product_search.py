@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Product Search for Product Manager
+Prefix full-text search over the products_fts index, ranked with BM25
+"""
+
+import re
+
+# Relative BM25 weights of the indexed columns: name, category, package_size, notes
+BM25_WEIGHTS = (10.0, 3.0, 1.0, 1.0)
+
+# Text columns of the index; the shared database also indexes user_id (see SHARED_MIGRATIONS)
+TEXT_COLUMNS = 'name category package_size notes'
+
+
+# Maximum number of search results shown in the product list
+SEARCH_LIMIT = 200
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word is a prefix match
+
+    Returns None when the text contains nothing searchable.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    # Quote each word so FTS5 operators typed by the user are treated as text
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_products(cursor, text, columns, limit=SEARCH_LIMIT, user_id=None):
+    """Return the best matching product rows (selected columns) for the search text
+
+    user_id limits the search to one user's products in the shared database.
+    """
+    match_query = build_match_query(text)
+    if match_query is None:
+        return []
+
+    weights = BM25_WEIGHTS
+    if user_id is not None:
+        match_query = f'user_id : "{int(user_id)}" AND {{{TEXT_COLUMNS}}} : ({match_query})'
+        weights += (0.0,)
+    rank = f"bm25({', '.join(str(weight) for weight in weights)})"
+    select_list = ', '.join(f'p.{column.strip()}' for column in columns.split(','))
+    # Every match is ranked: FTS5 keeps only the best `limit` while scoring, so
+    # a broad prefix costs one pass over its matches and products are only
+    # read for the rows returned
+    cursor.execute(f'''
+        SELECT {select_list}
+        FROM (
+            SELECT rowid, rank
+            FROM products_fts
+            WHERE products_fts MATCH ? AND rank MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ) matches
+        JOIN products p ON p.id = matches.rowid
+        ORDER BY matches.rank
+    ''', (match_query, rank, limit))
+    return cursor.fetchall()
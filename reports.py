@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Consolidated Reports for Product Manager
+Inventory value, sold revenue and outstanding credit across every user,
+broken down by user, category and month
+Usage: python reports.py [--by user category month] [--json] [--workers N] [--no-cache]
+
+Each user's figures are computed in a separate process and cached in
+.report_cache/, keyed by the database file's mtime and size (and its WAL),
+so only the users whose data changed are recomputed.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from repository import open_product_database, product_db_filename
+from shared_storage import (SHARED_DB_FILENAME, load_users, open_shared_database,
+                            shared_storage_enabled)
+
+CACHE_DIR = '.report_cache'
+
+# Bump when the cached figures change shape
+CACHE_FORMAT = 1
+
+# {scope} is '1' for a per-user database or 'user_id = ?' for the shared one
+CATEGORY_SQL = '''
+    SELECT IFNULL(NULLIF(category, ''), '(none)'),
+           COUNT(*),
+           IFNULL(SUM(status = 'In Stock'), 0),
+           IFNULL(SUM(CASE WHEN status = 'In Stock'
+                           THEN IFNULL(cost_price_usd, 0) + IFNULL(transport_price, 0) END), 0),
+           IFNULL(SUM(CASE WHEN status = 'In Stock' THEN IFNULL(sale_price, 0) END), 0),
+           IFNULL(SUM(status = 'Sold'), 0),
+           IFNULL(SUM(CASE WHEN status = 'Sold' THEN IFNULL(sale_price, 0) END), 0),
+           IFNULL(SUM(CASE WHEN status = 'Sold'
+                           THEN IFNULL(cost_price_usd, 0) + IFNULL(transport_price, 0) END), 0)
+    FROM products
+    WHERE {scope}
+    GROUP BY 1
+'''
+SALES_BY_MONTH_SQL = '''
+    SELECT substr(sale_date, 1, 7), COUNT(*), IFNULL(SUM(sale_price), 0),
+           IFNULL(SUM(IFNULL(cost_price_usd, 0) + IFNULL(transport_price, 0)), 0)
+    FROM products
+    WHERE {scope} AND status = 'Sold' AND sale_date > ''
+    GROUP BY 1
+'''
+CREDITS_BY_MONTH_SQL = '''
+    SELECT substr(transaction_date, 1, 7), COUNT(*),
+           IFNULL(SUM(IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0)), 0),
+           IFNULL(SUM(IFNULL(amount_remaining, 0)), 0)
+    FROM credit_transactions
+    WHERE {scope}
+    GROUP BY 1
+'''
+
+# Figures per category and per month, in the order the queries return them
+CATEGORY_FIELDS = ('products', 'in_stock', 'inventory_cost', 'inventory_value', 'sold', 'revenue', 'sold_cost')
+MONTH_FIELDS = ('sold', 'revenue', 'sold_cost', 'credits', 'credit_total', 'credit_outstanding')
+
+
+def file_version(filename):
+    """Return the (mtime, size) of a database and its WAL; any write changes it"""
+    version = []
+    for path in (filename, f'{filename}-wal'):
+        try:
+            stat = os.stat(path)
+            version += [stat.st_mtime_ns, stat.st_size]
+        except FileNotFoundError:
+            version += [0, 0]
+    return version
+
+
+def report_database(filename, user_id=None):
+    """Compute one user's figures (runs in a worker process)
+
+    user_id selects a user's rows of the shared database; None reports a whole per-user file.
+    """
+    if user_id is None:
+        conn = open_product_database(filename)
+        scope, params = '1', ()
+    else:
+        conn = open_shared_database(filename)
+        scope, params = 'user_id = ?', (user_id,)
+    conn.execute('PRAGMA query_only=ON')
+
+    try:
+        categories = {row[0]: list(row[1:]) for row in
+                      conn.execute(CATEGORY_SQL.format(scope=scope), params)}
+        months = {}
+        for month, sold, revenue, cost in conn.execute(SALES_BY_MONTH_SQL.format(scope=scope), params):
+            months.setdefault(month, [0] * len(MONTH_FIELDS))[0:3] = [sold, revenue, cost]
+        for month, count, total, outstanding in conn.execute(CREDITS_BY_MONTH_SQL.format(scope=scope), params):
+            months.setdefault(month or '(no date)', [0] * len(MONTH_FIELDS))[3:6] = [count, total, outstanding]
+    finally:
+        conn.close()
+
+    return {'categories': categories, 'months': months}
+
+
+class ReportCache:
+    """Per-user results on disk, valid while the database file is unchanged"""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path(self, filename, user_id):
+        key = f"{os.path.abspath(filename)}:{user_id}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def get(self, filename, user_id, version):
+        try:
+            with open(self.path(filename, user_id)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('format') != CACHE_FORMAT or entry.get('version') != version:
+            return None
+        return entry['result']
+
+    def put(self, filename, user_id, version, result):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(filename, user_id)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'format': CACHE_FORMAT, 'version': version, 'result': result}, f)
+        os.replace(temp_path, path)
+
+
+def report_sources():
+    """Return [(username, database file, user_id filter)] for every user with data"""
+    if shared_storage_enabled():
+        if not os.path.exists(SHARED_DB_FILENAME):
+            return []
+        return [(username, SHARED_DB_FILENAME, user_id) for username, user_id in sorted(load_users().items())]
+
+    prefix, suffix = product_db_filename('*').split('*')
+    return [(filename[len(prefix):-len(suffix)], filename, None)
+            for filename in sorted(glob.glob(product_db_filename('*')))]
+
+
+def collect(sources, workers=None, cache=None):
+    """Return {username: figures}, computing uncached users in parallel processes"""
+    results = {}
+    pending = []
+    for username, filename, user_id in sources:
+        version = file_version(filename)
+        cached = cache.get(filename, user_id, version) if cache else None
+        if cached is not None:
+            results[username] = cached
+        else:
+            pending.append((username, filename, user_id, version))
+
+    if len(pending) == 1:
+        # Not worth starting a process pool for
+        username, filename, user_id, version = pending[0]
+        pending_results = [report_database(filename, user_id)]
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending_results = list(executor.map(report_database, [p[1] for p in pending], [p[2] for p in pending]))
+    else:
+        pending_results = []
+
+    for (username, filename, user_id, version), result in zip(pending, pending_results):
+        results[username] = result
+        if cache:
+            cache.put(filename, user_id, version, result)
+    return results
+
+
+def consolidate(results):
+    """Return the totals by user, by category and by month, each as {key: {field: value}}"""
+    by_user, by_category, by_month = {}, {}, {}
+
+    for username, result in results.items():
+        user_totals = dict.fromkeys(CATEGORY_FIELDS + MONTH_FIELDS[3:], 0)
+        for category, values in result['categories'].items():
+            totals = by_category.setdefault(category, dict.fromkeys(CATEGORY_FIELDS, 0))
+            for field, value in zip(CATEGORY_FIELDS, values):
+                totals[field] += value
+                user_totals[field] += value
+        for month, values in result['months'].items():
+            totals = by_month.setdefault(month, dict.fromkeys(MONTH_FIELDS, 0))
+            for field, value in zip(MONTH_FIELDS, values):
+                totals[field] += value
+            for field, value in zip(MONTH_FIELDS[3:], values[3:]):
+                user_totals[field] += value
+        by_user[username] = user_totals
+
+    return {'user': by_user, 'category': by_category, 'month': dict(sorted(by_month.items()))}
+
+
+REPORT_COLUMNS = {
+    'user': [('products', 'Products'), ('in_stock', 'In stock'), ('inventory_value', 'Stock value'),
+             ('sold', 'Sold'), ('revenue', 'Revenue'), ('credit_total', 'Credit'),
+             ('credit_outstanding', 'Outstanding')],
+    'category': [('products', 'Products'), ('in_stock', 'In stock'), ('inventory_cost', 'Stock cost'),
+                 ('inventory_value', 'Stock value'), ('sold', 'Sold'), ('revenue', 'Revenue')],
+    'month': [('sold', 'Sold'), ('revenue', 'Revenue'), ('sold_cost', 'Cost'), ('credits', 'Credits'),
+              ('credit_total', 'Credit'), ('credit_outstanding', 'Outstanding')],
+}
+
+
+def print_report(title, rows, columns):
+    """Print one breakdown as an aligned text table with a total line"""
+    print(f"\n{title}")
+    header = f"{'':24}" + ''.join(f"{label:>16}" for _, label in columns)
+    print(header)
+    print('-' * len(header))
+
+    def cells(values):
+        return ''.join(f"{values[field]:>16,.2f}" if isinstance(values[field], float) else f"{values[field]:>16,}"
+                       for field, _ in columns)
+
+    grand_total = {field: 0 for field, _ in columns}
+    for key, values in rows.items():
+        print(f"{str(key)[:24]:24}{cells(values)}")
+        for field, _ in columns:
+            grand_total[field] += values[field]
+    print('-' * len(header))
+    print(f"{'Total':24}{cells(grand_total)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report inventory, sales and credit across all users")
+    parser.add_argument('--by', nargs='+', choices=['user', 'category', 'month'],
+                        default=['user', 'category', 'month'], help="breakdowns to show")
+    parser.add_argument('--json', action='store_true', help="print the figures as JSON")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--no-cache', action='store_true', help="recompute every user")
+    args = parser.parse_args()
+
+    sources = report_sources()
+    if not sources:
+        print("No product databases found.")
+        return
+
+    results = collect(sources, args.workers, None if args.no_cache else ReportCache())
+    report = consolidate(results)
+
+    if args.json:
+        json.dump({by: report[by] for by in args.by}, sys.stdout, indent=2)
+        print()
+        return
+
+    titles = {'user': 'By user', 'category': 'By category', 'month': 'By month'}
+    for by in args.by:
+        print_report(titles[by], report[by], REPORT_COLUMNS[by])
+
+if __name__ == "__main__":
+    main()
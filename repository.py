@@ -0,0 +1,699 @@
+#!/usr/bin/env python3
+"""
+Data Access for Product Manager
+Headless repositories over a product database, shared by the desktop apps,
+the sample data scripts and the benchmarks (no Tkinter required)
+"""
+
+import json
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+from db_connection import connect
+from db_schema import LOGGED_TABLES, migrate, rebuild_credit_summary, row_json, verify_credit_summary
+from product_search import SEARCH_LIMIT, search_products
+
+# Every product column, in table order (product[1] is the name, product[12] the status...)
+PRODUCT_COLUMNS = ('id, name, category, cost_price_usd, cost_price_dzd, transport_price, sale_price, '
+                   'picture_path, package_size, package_image_path, arrival_date, sale_date, status, notes')
+
+# Columns shown in the product lists
+PRODUCT_LIST_COLUMNS = 'id, name, category, cost_price_usd, cost_price_dzd, sale_price, status'
+
+# Product fields written by add/update, in statement parameter order
+PRODUCT_FIELDS = ('name', 'category', 'cost_price_usd', 'cost_price_dzd', 'transport_price',
+                  'sale_price', 'picture_path', 'package_size', 'package_image_path',
+                  'arrival_date', 'sale_date', 'status')
+
+# Fields written by add/add_many: imports may also set notes, which the form does not edit
+PRODUCT_INSERT_FIELDS = PRODUCT_FIELDS + ('notes',)
+
+# Allowed values of products.status
+PRODUCT_STATUSES = ('In Stock', 'Sold', 'Reserved', 'Damaged')
+
+# Most customers offered by the customer picker at a time
+CUSTOMER_LIMIT = 20
+
+# Most products offered by the credit sale product picker at a time
+PICKER_LIMIT = 20
+
+# Most change log entries returned by one ChangeLogRepository.changes() call
+CHANGE_PAGE_SIZE = 500
+
+# Fewest changes between two change log snapshots
+SNAPSHOT_MIN_CHANGES = 1000
+
+# Sortable product list columns -> (ORDER BY expression, position in a list row,
+# value the expression gives a NULL column). Each expression is indexed (schema
+# version 8), with the rowid breaking ties, so a sorted page is an index range.
+PRODUCT_SORT_KEYS = {
+    'id': ('id', 0, None),
+    'name': ('name COLLATE NOCASE', 1, None),
+    'category': ("IFNULL(category, '') COLLATE NOCASE", 2, ''),
+    'cost_price_usd': ('IFNULL(cost_price_usd, 0)', 3, 0),
+    'cost_price_dzd': ('IFNULL(cost_price_dzd, 0)', 4, 0),
+    'sale_price': ('IFNULL(sale_price, 0)', 5, 0),
+    'status': ("IFNULL(status, '')", 6, ''),
+}
+
+# Credit transactions with their product name, as shown in the credit lists
+CREDIT_LIST_QUERY = '''
+    SELECT ct.id, p.name, ct.customer_name,
+           (IFNULL(ct.amount_paid, 0) + IFNULL(ct.amount_remaining, 0)) as total,
+           ct.amount_paid, ct.amount_remaining, ct.transaction_date
+    FROM credit_transactions ct
+    JOIN products p ON ct.product_id = p.id
+'''
+
+# Sortable credit list columns, as PRODUCT_SORT_KEYS. The product name comes
+# from the join, so the credit list cannot be sorted by it without a full sort.
+CREDIT_SORT_KEYS = {
+    'id': ('ct.id', 0, None),
+    'customer_name': ("IFNULL(ct.customer_name, '') COLLATE NOCASE", 2, ''),
+    'total': ('IFNULL(ct.amount_paid, 0) + IFNULL(ct.amount_remaining, 0)', 3, 0),
+    'amount_paid': ('IFNULL(ct.amount_paid, 0)', 4, 0),
+    'amount_remaining': ('IFNULL(ct.amount_remaining, 0)', 5, 0),
+    'transaction_date': ('ct.transaction_date', 6, None),
+}
+
+
+def product_db_filename(username):
+    """Return the database file holding a user's products"""
+    return f'products_{username}.db'
+
+
+def open_product_database(filename, **options):
+    """Open a product database, creating or upgrading its schema
+
+    options are passed on to db_connection.connect().
+    """
+    conn = connect(filename, **options)
+    migrate(conn)
+    return conn
+
+
+@lru_cache(maxsize=None)
+def sorted_page_sql(select, id_column, expression, descending, conditions, after):
+    """Return the query for one page of select ordered by expression, then id_column
+
+    select ends in a WHERE clause that conditions are ANDed to. With after, the page
+    continues past the (expression, id) passed as the parameters before the limit.
+    Queries are cached so each combination is one constant statement for sqlite3's cache.
+    """
+    keys = (id_column,) if expression == id_column else (expression, id_column)
+    conditions = list(conditions)
+    if after:
+        # Row values compare on the sort key, then the id, in a single index range
+        placeholders = ', '.join('?' for _ in keys)
+        conditions.append(f"({', '.join(keys)}) {'<' if descending else '>'} ({placeholders})")
+    order = ', '.join(f"{key} DESC" if descending else key for key in keys)
+    return f"{select} {''.join(f' AND {condition}' for condition in conditions)} ORDER BY {order} LIMIT ?"
+
+
+def sorted_page(conn, select, params, id_column, sort_key, descending, filters, after, limit):
+    """Run one sorted, filtered page of select (keyset pagination)
+
+    sort_key is an entry of PRODUCT_SORT_KEYS or CREDIT_SORT_KEYS, filters are
+    (condition, condition parameters) pairs and after is the last list row already
+    shown (None for the first page).
+    """
+    expression, position, missing = sort_key
+    conditions = tuple(condition for condition, _ in filters)
+    if f"{expression} = ?" in conditions:
+        # Every row has the same sort key (e.g. sorting by status while filtering on
+        # one), which SQLite would still sort; the ties are in id order anyway
+        expression = id_column
+    params = list(params)
+    for _, filter_params in filters:
+        params.extend(filter_params)
+    if after is not None:
+        if expression != id_column:
+            params.append(missing if after[position] is None else after[position])
+        params.append(after[0])
+    sql = sorted_page_sql(select, id_column, expression, descending, conditions, after is not None)
+    return conn.execute(sql, params + [limit]).fetchall()
+
+
+@contextmanager
+def transaction(conn):
+    """Run a block in a transaction, or join the caller's transaction if one is open
+
+    This lets callers group several repository calls into one commit.
+    """
+    if conn.in_transaction:
+        yield
+        return
+
+    # Begin explicitly: sqlite3 only opens a transaction at the first write,
+    # so nested calls could not otherwise tell that one is in progress
+    conn.execute('BEGIN')
+    try:
+        yield
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+class ProductRepository:
+    # SQL is kept constant so sqlite3's statement cache reuses the prepared statements
+    INSERT_SQL = f'''
+        INSERT INTO products ({", ".join(PRODUCT_INSERT_FIELDS)})
+        VALUES ({", ".join("?" for _ in PRODUCT_INSERT_FIELDS)})
+    '''
+    UPDATE_SQL = f'''
+        UPDATE products SET {", ".join(f"{field}=?" for field in PRODUCT_FIELDS)}
+        WHERE id=?
+    '''
+    DELETE_SQL = 'DELETE FROM products WHERE id=?'
+    GET_SQL = f'SELECT {PRODUCT_COLUMNS} FROM products WHERE id=?'
+    LIST_ROW_SQL = f'SELECT {PRODUCT_LIST_COLUMNS} FROM products WHERE id=?'
+    PAGE_SQL = f'SELECT {PRODUCT_LIST_COLUMNS} FROM products WHERE id > ? ORDER BY id LIMIT ?'
+    # sorted_page adds the filters, the keyset condition and the ORDER BY to this
+    SORTED_PAGE_SQL = f'SELECT {PRODUCT_LIST_COLUMNS} FROM products WHERE 1'
+    # Filters compare the sort key expressions, so they can use the same indexes
+    STATUS_FILTER = "IFNULL(status, '') = ?"
+    CATEGORY_FILTER = "IFNULL(category, '') COLLATE NOCASE = ?"
+    # Distinct categories in any (ASCII) case, read from idx_products_category
+    CATEGORIES_SQL = '''
+        SELECT MIN(category) FROM products
+        WHERE IFNULL(category, '') COLLATE NOCASE > ''
+        GROUP BY IFNULL(category, '') COLLATE NOCASE
+        ORDER BY IFNULL(category, '') COLLATE NOCASE
+    '''
+    IN_STOCK_SQL = "SELECT id, name, sale_price FROM products WHERE status='In Stock'"
+    # In-stock products whose name starts with a prefix in any (ASCII) case, as one
+    # range of idx_products_status in name order
+    IN_STOCK_MATCHING_SQL = '''
+        SELECT id, name, sale_price FROM products
+        WHERE status='In Stock'
+          AND name COLLATE NOCASE >= ?1 AND name COLLATE NOCASE < ?1 || char(1114111)
+        ORDER BY name COLLATE NOCASE LIMIT ?2
+    '''
+    TRIGGER_SQL = "SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?"
+    FTS_INDEX_SQL = '''
+        INSERT INTO products_fts (rowid, name, category, package_size, notes)
+        SELECT id, name, category, package_size, notes FROM products WHERE id > ?
+    '''
+    # The change log entries products_log_insert would have written for the rows after an id
+    LOG_INSERTS_SQL = f'''
+        INSERT INTO change_log (table_name, row_id, operation, data)
+        SELECT 'products', id, 'insert', {row_json('products', 'products')} FROM products WHERE id > ? ORDER BY id
+    '''
+
+    STATISTICS_SQL = '''
+        SELECT COUNT(*),
+               IFNULL(SUM(status = 'In Stock'), 0),
+               IFNULL(SUM(status = 'Sold'), 0),
+               IFNULL(SUM(status = 'Reserved'), 0),
+               IFNULL(SUM(CASE WHEN status = 'Sold' THEN IFNULL(sale_price, 0) END), 0),
+               IFNULL(SUM(CASE WHEN status = 'Sold'
+                               THEN IFNULL(cost_price_usd, 0) + IFNULL(transport_price, 0) END), 0)
+        FROM products
+    '''
+
+    # add_many batches at least this big index the search table in one pass
+    BULK_INDEX_THRESHOLD = 1000
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def insert_values(self, product):
+        """Return the INSERT_SQL parameters for a product (a dict of PRODUCT_INSERT_FIELDS)"""
+        return [product.get(field) for field in PRODUCT_INSERT_FIELDS]
+
+    def add(self, product):
+        """Insert a product (a dict of PRODUCT_INSERT_FIELDS) and return its id"""
+        with transaction(self.conn):
+            cursor = self.conn.execute(self.INSERT_SQL, self.insert_values(product))
+        return cursor.lastrowid
+
+    def add_many(self, products):
+        """Insert many products in one transaction and return how many were inserted"""
+        rows = [self.insert_values(product) for product in products]
+        with transaction(self.conn):
+            triggers = []
+            if len(rows) >= self.BULK_INDEX_THRESHOLD:
+                # Indexing and logging row by row through the insert triggers costs
+                # several times more than the insert itself, so index and log the new
+                # rows in one pass each. DDL is transactional, the triggers are back
+                # before anyone can see the rows
+                last_id = self.conn.execute('SELECT IFNULL(MAX(id), 0) FROM products').fetchone()[0]
+                for name, bulk_sql in (('products_fts_insert', self.FTS_INDEX_SQL),
+                                       ('products_log_insert', self.LOG_INSERTS_SQL)):
+                    trigger = self.conn.execute(self.TRIGGER_SQL, (name,)).fetchone()
+                    if trigger:
+                        self.conn.execute(f'DROP TRIGGER {name}')
+                        triggers.append((trigger[0], bulk_sql))
+            self.conn.executemany(self.INSERT_SQL, rows)
+            for trigger, bulk_sql in triggers:
+                self.conn.execute(bulk_sql, (last_id,))
+                self.conn.execute(trigger)
+        return len(rows)
+
+    def update(self, product_id, product):
+        """Overwrite the editable fields of a product"""
+        with transaction(self.conn):
+            self.conn.execute(self.UPDATE_SQL, [product.get(field) for field in PRODUCT_FIELDS] + [product_id])
+
+    def delete(self, product_id):
+        """Delete a product"""
+        with transaction(self.conn):
+            self.conn.execute(self.DELETE_SQL, (product_id,))
+
+    def get(self, product_id):
+        """Return every column of a product, or None if it does not exist"""
+        return self.conn.execute(self.GET_SQL, (product_id,)).fetchone()
+
+    def list_row(self, product_id):
+        """Return a product's list columns, or None if it does not exist"""
+        return self.conn.execute(self.LIST_ROW_SQL, (product_id,)).fetchone()
+
+    def page(self, after_id=0, limit=-1):
+        """Return the list rows of the products after after_id in id order (keyset pagination)
+
+        A negative limit returns every remaining product.
+        """
+        return self.conn.execute(self.PAGE_SQL, (after_id, limit)).fetchall()
+
+    def sorted_page(self, sort='id', descending=False, status=None, category=None, after=None, limit=-1):
+        """Return a page of list rows ordered by a PRODUCT_SORT_KEYS column (keyset pagination)
+
+        status and category filter the rows when given. after is the last row of the
+        previous page, or None for the first page.
+        """
+        return sorted_page(self.conn, self.SORTED_PAGE_SQL, (), 'id', PRODUCT_SORT_KEYS[sort],
+                           descending, self.filters(status, category), after, limit)
+
+    def filters(self, status, category):
+        """Return the sorted_page filters selecting a status and a category"""
+        filters = []
+        if status is not None:
+            filters.append((self.STATUS_FILTER, (status,)))
+        if category is not None:
+            filters.append((self.CATEGORY_FILTER, (category,)))
+        return filters
+
+    def categories(self):
+        """Return the product categories for the category filter, in name order"""
+        return [row[0] for row in self.conn.execute(self.CATEGORIES_SQL)]
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """Return the list rows of the products best matching the search text"""
+        return search_products(self.conn.cursor(), text, PRODUCT_LIST_COLUMNS, limit)
+
+    def in_stock(self):
+        """Return (id, name, sale_price) for every product in stock"""
+        return self.conn.execute(self.IN_STOCK_SQL).fetchall()
+
+    def in_stock_matching(self, prefix='', limit=PICKER_LIMIT):
+        """Return (id, name, sale_price) of the first in-stock products whose name starts with prefix"""
+        return self.conn.execute(self.IN_STOCK_MATCHING_SQL, (prefix, limit)).fetchall()
+
+    def statistics(self):
+        """Return (total, in stock, sold, reserved, revenue, cost) in one pass over the products
+
+        Revenue and cost only count sold products, as the web store's getAnalytics does.
+        """
+        return self.conn.execute(self.STATISTICS_SQL).fetchone()
+
+
+class CreditRepository:
+    INSERT_SQL = '''
+        INSERT INTO credit_transactions (product_id, customer_name, amount_paid, amount_remaining, transaction_date)
+        VALUES (?, ?, ?, ?, ?)
+    '''
+    MARK_SOLD_SQL = "UPDATE products SET status='Sold', sale_date=? WHERE id=?"
+    MARK_RESERVED_SQL = "UPDATE products SET status='Reserved' WHERE id=?"
+    LIST_SQL = CREDIT_LIST_QUERY + ' ORDER BY ct.transaction_date DESC'
+    LIST_ROW_SQL = CREDIT_LIST_QUERY + ' WHERE ct.id=?'
+    FIRST_PAGE_SQL = CREDIT_LIST_QUERY + ' ORDER BY ct.transaction_date DESC, ct.id DESC LIMIT ?'
+    PAGE_SQL = CREDIT_LIST_QUERY + '''
+        WHERE (ct.transaction_date, ct.id) < (?, ?)
+        ORDER BY ct.transaction_date DESC, ct.id DESC LIMIT ?
+    '''
+    SORTED_PAGE_SQL = CREDIT_LIST_QUERY + ' WHERE 1'
+    OUTSTANDING_FILTER = 'IFNULL(ct.amount_remaining, 0) > 0'
+    PAID_OFF_FILTER = 'IFNULL(ct.amount_remaining, 0) <= 0'
+    IDS_FOR_PRODUCT_SQL = 'SELECT id FROM credit_transactions WHERE product_id=?'
+    PRODUCT_ID_SQL = 'SELECT product_id FROM credit_transactions WHERE id=?'
+    SUMMARY_SQL = 'SELECT total_credits, total_paid, total_outstanding FROM credit_summary WHERE id = 1'
+    # Inserting through a SELECT records nothing when the credit does not exist or
+    # the amount is more than what remains (checked here, as the form's bound may be stale)
+    ADD_PAYMENT_SQL = '''
+        INSERT INTO credit_payments (credit_id, amount, payment_date)
+        SELECT id, ?1, ?2 FROM credit_transactions WHERE id=?3 AND IFNULL(amount_remaining, 0) >= ?1 - 0.005
+    '''
+    REMAINING_SQL = 'SELECT IFNULL(amount_remaining, 0) FROM credit_transactions WHERE id=?'
+    MARK_PAID_OFF_SQL = '''
+        UPDATE products SET status='Sold', sale_date=?
+        WHERE status='Reserved'
+          AND id=(SELECT product_id FROM credit_transactions WHERE id=? AND amount_remaining <= 0.005)
+    '''
+    # (id, date, kind, amount, paid to date, balance) of a credit's payments, oldest first
+    PAYMENTS_SQL = '''
+        SELECT p.id, p.payment_date, p.kind, p.amount,
+               SUM(p.amount) OVER running,
+               IFNULL(ct.amount_paid, 0) + IFNULL(ct.amount_remaining, 0) - SUM(p.amount) OVER running
+        FROM credit_payments p
+        JOIN credit_transactions ct ON ct.id = p.credit_id
+        WHERE p.credit_id=?
+        WINDOW running AS (ORDER BY p.payment_date, p.id)
+        ORDER BY p.payment_date, p.id
+    '''
+    # (date, credit id, kind, charge, payment, balance) of a customer's credits and payments, oldest first
+    CUSTOMER_HISTORY_SQL = '''
+        WITH events AS (
+            SELECT transaction_date AS event_date, id AS credit_id, 'Credit' AS kind, id AS event_id,
+                   IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0) AS charge, 0 AS payment
+            FROM credit_transactions
+            WHERE customer_id=(SELECT id FROM customers WHERE name_key=lower(trim(?)))
+            UNION ALL
+            SELECT p.payment_date, p.credit_id, p.kind, p.id, 0, p.amount
+            FROM credit_transactions ct
+            JOIN credit_payments p ON p.credit_id = ct.id
+            WHERE ct.customer_id=(SELECT id FROM customers WHERE name_key=lower(trim(?)))
+        )
+        SELECT event_date, credit_id, kind, charge, payment,
+               SUM(charge - payment) OVER (ORDER BY event_date, kind, event_id)
+        FROM events
+        ORDER BY event_date, kind, event_id
+    '''
+    # Customers whose name starts with a prefix, as a range of the name_key index
+    # (char(1114111) sorts after any character that can follow the prefix)
+    CUSTOMERS_SQL = '''
+        SELECT id, name, outstanding FROM customers
+        WHERE name_key >= lower(trim(?1)) AND name_key < lower(trim(?1)) || char(1114111)
+        ORDER BY name_key LIMIT ?2
+    '''
+    CUSTOMER_SQL = '''
+        SELECT id, name, credit_count, total_credit, outstanding FROM customers WHERE name_key=lower(trim(?))
+    '''
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def add_transaction(self, product_id, customer_name, amount_paid, amount_remaining, transaction_date=None):
+        """Record a credit transaction as-is and return its id"""
+        if transaction_date is None:
+            transaction_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with transaction(self.conn):
+            cursor = self.conn.execute(self.INSERT_SQL, (
+                product_id, customer_name, amount_paid, amount_remaining, transaction_date
+            ))
+        return cursor.lastrowid
+
+    def create_sale(self, product_id, customer_name, total_amount, amount_paid, transaction_date=None):
+        """Sell a product on credit and return the new credit id
+
+        The product becomes Sold when nothing remains to be paid, Reserved otherwise.
+        """
+        if transaction_date is None:
+            transaction_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        amount_remaining = total_amount - amount_paid
+        with transaction(self.conn):
+            credit_id = self.add_transaction(product_id, customer_name, amount_paid, amount_remaining,
+                                             transaction_date)
+            if amount_remaining <= 0:
+                self.conn.execute(self.MARK_SOLD_SQL, (transaction_date[:10], product_id))
+            else:
+                self.conn.execute(self.MARK_RESERVED_SQL, (product_id,))
+        return credit_id
+
+    def add_payment(self, credit_id, amount, payment_date=None):
+        """Record a payment against a credit and return its id
+
+        A trigger moves the amount from the credit's remaining to its paid
+        total; the product becomes Sold once nothing remains to be paid.
+        """
+        if amount <= 0:
+            raise ValueError("Payment amount must be positive")
+        if payment_date is None:
+            payment_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with transaction(self.conn):
+            cursor = self.conn.execute(self.ADD_PAYMENT_SQL, (amount, payment_date, credit_id))
+            if cursor.rowcount == 0:
+                self.refuse_payment(self.conn.execute(self.REMAINING_SQL, (credit_id,)).fetchone(),
+                                    credit_id, amount)
+            self.conn.execute(self.MARK_PAID_OFF_SQL, (payment_date[:10], credit_id))
+        return cursor.lastrowid
+
+    def refuse_payment(self, remaining, credit_id, amount):
+        """Raise ValueError for a payment ADD_PAYMENT_SQL did not record (remaining is a REMAINING_SQL row)"""
+        if remaining is None:
+            raise ValueError(f"Credit {credit_id} does not exist")
+        raise ValueError(f"Payment of {amount:.2f} is more than the {max(remaining[0], 0):.2f} remaining")
+
+    def payments(self, credit_id):
+        """Return a credit's payments with the running paid total and balance, oldest first"""
+        return self.conn.execute(self.PAYMENTS_SQL, (credit_id,)).fetchall()
+
+    def customer_history(self, customer_name):
+        """Return a customer's credits and payments with the running balance owed, oldest first"""
+        return self.conn.execute(self.CUSTOMER_HISTORY_SQL, (customer_name, customer_name)).fetchall()
+
+    def customers(self, prefix='', limit=CUSTOMER_LIMIT):
+        """Return (id, name, outstanding) of the customers whose name starts with prefix, by name"""
+        return self.conn.execute(self.CUSTOMERS_SQL, (prefix, limit)).fetchall()
+
+    def customer(self, name):
+        """Return (id, name, credits, total credit, outstanding) of a customer, or None
+
+        Names match ignoring case and surrounding spaces.
+        """
+        return self.conn.execute(self.CUSTOMER_SQL, (name,)).fetchone()
+
+    def product_id(self, credit_id):
+        """Return the product a credit was recorded against, or None"""
+        row = self.conn.execute(self.PRODUCT_ID_SQL, (credit_id,)).fetchone()
+        return row[0] if row else None
+
+    def list_rows(self):
+        """Return every credit list row, newest first"""
+        return self.conn.execute(self.LIST_SQL).fetchall()
+
+    def page(self, before=None, limit=-1):
+        """Return the credit list rows older than before, newest first (keyset pagination)
+
+        before is the (transaction_date, id) of the last row already seen, or None for the first page.
+        """
+        if before is None:
+            return self.conn.execute(self.FIRST_PAGE_SQL, (limit,)).fetchall()
+        return self.conn.execute(self.PAGE_SQL, (before[0], before[1], limit)).fetchall()
+
+    def sorted_page(self, sort='transaction_date', descending=True, outstanding=None, after=None, limit=-1):
+        """Return a page of credit list rows ordered by a CREDIT_SORT_KEYS column (keyset pagination)
+
+        outstanding=True keeps the credits with a balance left, False the paid-off ones.
+        after is the last row of the previous page, or None for the first page.
+        """
+        return sorted_page(self.conn, self.SORTED_PAGE_SQL, (), 'ct.id', CREDIT_SORT_KEYS[sort],
+                           descending, self.balance_filters(outstanding), after, limit)
+
+    def balance_filters(self, outstanding):
+        """Return the sorted_page filters selecting outstanding or paid-off credits"""
+        if outstanding is None:
+            return ()
+        return ((self.OUTSTANDING_FILTER if outstanding else self.PAID_OFF_FILTER, ()),)
+
+    def list_row(self, credit_id):
+        """Return a credit's list row, or None if it (or its product) no longer exists"""
+        return self.conn.execute(self.LIST_ROW_SQL, (credit_id,)).fetchone()
+
+    def ids_for_product(self, product_id):
+        """Return the ids of the credits recorded against a product"""
+        return [row[0] for row in self.conn.execute(self.IDS_FOR_PRODUCT_SQL, (product_id,))]
+
+    def summary(self):
+        """Return (total credits, total paid, total outstanding)"""
+        result = self.conn.execute(self.SUMMARY_SQL).fetchone()
+        return tuple(value or 0 for value in result) if result else (0, 0, 0)
+
+    def verify_summary(self):
+        """Return the maintained totals that drifted from a full recount"""
+        return verify_credit_summary(self.conn)
+
+    def rebuild_summary(self):
+        """Recompute the maintained totals from scratch"""
+        rebuild_credit_summary(self.conn)
+
+
+class ChangeLogRepository:
+    """The append-only log of product, credit and payment changes, and its snapshots
+
+    Triggers write the log (schema version 9); this reads it back for tailing and
+    audits, takes snapshots and rebuilds the rows as they were at a past time.
+    """
+
+    CHANGES_SQL = '''
+        SELECT seq, changed_at, table_name, row_id, operation, data FROM change_log
+        WHERE seq > ? ORDER BY seq LIMIT ?
+    '''
+    HISTORY_SQL = '''
+        SELECT seq, changed_at, table_name, row_id, operation, data FROM change_log
+        WHERE table_name=? AND row_id=? ORDER BY seq
+    '''
+    LAST_SEQ_SQL = 'SELECT IFNULL(MAX(seq), 0) FROM change_log'
+    LAST_SNAPSHOT_SQL = 'SELECT id, seq, row_count FROM change_snapshots ORDER BY taken_at DESC, id DESC LIMIT 1'
+    FIRST_SNAPSHOT_SQL = 'SELECT seq, taken_at FROM change_snapshots ORDER BY taken_at, id LIMIT 1'
+    # The snapshots around a point in time: the last one taken by then and the first one after
+    SNAPSHOT_BEFORE_SQL = '''
+        SELECT id, seq FROM change_snapshots WHERE taken_at <= ? ORDER BY taken_at DESC, id DESC LIMIT 1
+    '''
+    SNAPSHOT_AFTER_SQL = 'SELECT seq FROM change_snapshots WHERE taken_at > ? ORDER BY taken_at, id LIMIT 1'
+    SNAPSHOT_ROWS_SQL = 'SELECT table_name, row_id, data FROM snapshot_rows WHERE snapshot_id=?'
+    REPLAY_SQL = '''
+        SELECT table_name, row_id, data FROM change_log
+        WHERE seq > ? AND seq <= ? AND changed_at <= ? ORDER BY seq
+    '''
+    # The last seq of the next limit changes after a seq, and how many there are
+    WINDOW_SQL = 'SELECT MAX(seq), COUNT(*) FROM (SELECT seq FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?)'
+    # The last change to each row changed in a range of seq (SQLite takes data from the MAX(seq) entry)
+    LATEST_CHANGES_SQL = '''
+        SELECT table_name, row_id, MAX(seq), data FROM change_log
+        WHERE seq > ? AND seq <= ? GROUP BY table_name, row_id ORDER BY 3
+    '''
+    SNAPSHOT_SEQ_SQL = 'SELECT seq FROM change_snapshots WHERE id=?'
+    SNAPSHOT_PAGE_SQL = '''
+        SELECT table_name, row_id, data FROM snapshot_rows
+        WHERE snapshot_id=? AND (table_name, row_id) > (?, ?) ORDER BY table_name, row_id LIMIT ?
+    '''
+    ROW_VERSION_SQL = 'SELECT IFNULL(MAX(seq), 0) FROM change_log WHERE table_name=? AND row_id=?'
+    ROW_CHANGE_AT_SQL = '''
+        SELECT data FROM change_log WHERE table_name=?1 AND row_id=?2 AND seq <= ?3 ORDER BY seq DESC LIMIT 1
+    '''
+    # A row with no change up to a seq is the same in every snapshot taken by then
+    SNAPSHOT_ROW_AT_SQL = '''
+        SELECT r.data FROM change_snapshots s
+        JOIN snapshot_rows r ON r.snapshot_id = s.id AND r.table_name = ?1 AND r.row_id = ?2
+        WHERE s.seq <= ?3 ORDER BY s.seq DESC LIMIT 1
+    '''
+    # Inserting the snapshot first takes the write lock, so the copied rows are exactly
+    # the state after change seq
+    INSERT_SNAPSHOT_SQL = 'INSERT INTO change_snapshots (seq) SELECT IFNULL(MAX(seq), 0) FROM change_log'
+    COPY_ROWS_SQL = tuple(f'''
+        INSERT INTO snapshot_rows (snapshot_id, table_name, row_id, data)
+        SELECT ?, '{table}', id, {row_json(table, table)} FROM {table}
+    ''' for table in LOGGED_TABLES)
+    ROW_COUNT_SQL = 'UPDATE change_snapshots SET row_count=? WHERE id=?'
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def last_seq(self):
+        """Return the seq of the latest change (0 before the first); tail from there to skip the history"""
+        return self.conn.execute(self.LAST_SEQ_SQL, self.scoped()).fetchone()[0]
+
+    def changes(self, after=0, limit=CHANGE_PAGE_SIZE):
+        """Return the changes after seq after, oldest first
+
+        Rows are (seq, changed_at, table, row id, operation, data), data being the
+        row after the change as JSON (None for a delete). Pass the last seq seen
+        to read the next page, or the next changes as they happen.
+        """
+        return self.conn.execute(self.CHANGES_SQL, self.scoped(after, limit)).fetchall()
+
+    def history(self, table, row_id):
+        """Return every change to one row, oldest first, as changes() does"""
+        return self.conn.execute(self.HISTORY_SQL, self.scoped(table, row_id)).fetchall()
+
+    def latest_changes(self, after, limit):
+        """Return the changes in the next limit entries after seq after, one per row
+
+        Returns (rows, end, full): rows are (table, row id, seq, data) of each row's
+        last change in the window, end is the window's last seq (after if there
+        are no changes) and full is True when more changes may follow.
+        """
+        end, count = self.conn.execute(self.WINDOW_SQL, self.scoped(after, limit)).fetchone()
+        if not count:
+            return [], after, False
+        rows = self.conn.execute(self.LATEST_CHANGES_SQL, self.scoped(after, end)).fetchall()
+        return rows, end, count == limit
+
+    def last_snapshot(self):
+        """Return (id, seq, row count) of the latest snapshot, or None"""
+        return self.conn.execute(self.LAST_SNAPSHOT_SQL, self.scoped()).fetchone()
+
+    def snapshot_seq(self, snapshot_id):
+        """Return the seq a snapshot was taken at, or None if there is no such snapshot"""
+        row = self.conn.execute(self.SNAPSHOT_SEQ_SQL, self.scoped(snapshot_id)).fetchone()
+        return row[0] if row else None
+
+    def snapshot_page(self, snapshot_id, after=('', 0), limit=CHANGE_PAGE_SIZE):
+        """Return (table, row id, data) of a snapshot's rows after (table, row id), in that order"""
+        params = self.scoped(snapshot_id, after[0], after[1], limit)
+        return self.conn.execute(self.SNAPSHOT_PAGE_SQL, params).fetchall()
+
+    def row_version(self, table, row_id):
+        """Return the seq of a row's last change (0 if it has not changed since the log began)"""
+        return self.conn.execute(self.ROW_VERSION_SQL, self.scoped(table, row_id)).fetchone()[0]
+
+    def row_at(self, table, row_id, seq):
+        """Return a row as it was after change seq ({column: value}), or None if it did not exist"""
+        row = self.conn.execute(self.ROW_CHANGE_AT_SQL, self.scoped(table, row_id, seq)).fetchone()
+        if row is None:
+            row = self.conn.execute(self.SNAPSHOT_ROW_AT_SQL, self.scoped(table, row_id, seq)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def snapshot(self):
+        """Record every logged row as of the latest change, returns how many rows were recorded"""
+        with transaction(self.conn):
+            snapshot_id = self.conn.execute(self.INSERT_SNAPSHOT_SQL, self.scoped()).lastrowid
+            row_count = sum(self.conn.execute(sql, self.scoped(snapshot_id)).rowcount for sql in self.COPY_ROWS_SQL)
+            self.conn.execute(self.ROW_COUNT_SQL, (row_count, snapshot_id))
+        return row_count
+
+    def snapshot_due(self):
+        """Return True once the changes since the last snapshot outnumber the rows it holds
+
+        Rebuilding any past state then replays no more changes than a snapshot
+        holds rows, and the snapshots together take no more room than the log.
+        """
+        _, seq, row_count = self.last_snapshot() or (None, 0, 0)
+        threshold = max(SNAPSHOT_MIN_CHANGES, row_count)
+        return self.changes_since(seq, threshold) >= threshold
+
+    def snapshot_if_due(self):
+        """Take a snapshot if snapshot_due(), returns its row count or None"""
+        if self.snapshot_due():
+            return self.snapshot()
+        return None
+
+    def changes_since(self, seq, limit):
+        """Return how many changes follow seq, counting no further than limit"""
+        # Entries are never deleted and a rollback hands its seq numbers back, so
+        # the difference is the count
+        return min(self.last_seq() - seq, limit)
+
+    def state_at(self, timestamp):
+        """Rebuild every logged row as it was at timestamp ('YYYY-MM-DD HH:MM:SS', local time)
+
+        Returns {table: {row id: {column: value}}}. Starts from the last snapshot
+        taken by then and replays the changes up to the next one at most.
+        """
+        state = {table: {} for table in LOGGED_TABLES}
+        base = self.conn.execute(self.SNAPSHOT_BEFORE_SQL, self.scoped(timestamp)).fetchone()
+        if base is None:
+            first = self.conn.execute(self.FIRST_SNAPSHOT_SQL, self.scoped()).fetchone()
+            if first is not None and first[0] == 0:
+                # The starting snapshot holds the rows from before the log existed
+                raise ValueError(f"No change history before {first[1]}")
+            after = 0
+        else:
+            snapshot_id, after = base
+            for table, row_id, data in self.conn.execute(self.SNAPSHOT_ROWS_SQL, (snapshot_id,)):
+                state[table][row_id] = json.loads(data)
+
+        until = self.conn.execute(self.SNAPSHOT_AFTER_SQL, self.scoped(timestamp)).fetchone()
+        until = until[0] if until else self.last_seq()
+        for table, row_id, data in self.conn.execute(self.REPLAY_SQL, self.scoped(after, until, timestamp)):
+            if data is None:
+                state[table].pop(row_id, None)
+            else:
+                state[table][row_id] = json.loads(data)
+        return state
+
+    def scoped(self, *params):
+        """Return a query's parameters (SharedChangeLogRepository puts the user first)"""
+        return params
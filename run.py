@@ -2,12 +2,80 @@
 """
 Product Manager Launcher - Multi-User Edition
 Easy way to start the Product Management System with multi-user support
+Usage: python run.py [--profile-startup [USERNAME]]
 """
 
+import argparse
 import os
 import sys
+import time
+
+# Taken before the app's modules are imported, so startup timings include them
+STARTED = time.perf_counter()
+
+# Functions listed by --profile-startup
+PROFILE_LINES = 25
+
+def profile_startup(username):
+    """Open the first window, print how long it took to appear and where the time went, then exit
+    
+    With a username, time that user's product window instead of the user selection.
+    """
+    import cProfile
+    import pstats
+    
+    timings = []
+    profiler = cProfile.Profile()
+    profiler.enable()
+    
+    if username:
+        from db_connection import connect
+        from product_manager_multiuser import ProductManagerMultiUser
+        timings.append(("imports", time.perf_counter()))
+    
+        conn = connect('users.db')
+        user = conn.execute('SELECT * FROM users WHERE username=?', (username,)).fetchone()
+        conn.close()
+        if user is None:
+            profiler.disable()
+            print(f"Unknown user: {username}")
+            return
+    
+        app = ProductManagerMultiUser(user)
+    else:
+        from user_manager import UserManager
+        timings.append(("imports", time.perf_counter()))
+        app = UserManager()
+    timings.append(("window built", time.perf_counter()))
+    
+    # Runs the pending layout and drawing, i.e. until the window is on screen
+    app.root.update()
+    timings.append(("first paint", time.perf_counter()))
+    profiler.disable()
+    
+    previous = STARTED
+    for stage, finished in timings:
+        print(f"{stage:14} {(finished - previous) * 1000:8.1f} ms")
+        previous = finished
+    print(f"{'total':14} {(previous - STARTED) * 1000:8.1f} ms\n")
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    
+    if username:
+        app.writer.close()
+        app.image_loader.shutdown()
+    app.root.destroy()
+    app.conn.close()
 
 def main():
+    parser = argparse.ArgumentParser(description="Start the Product Management System")
+    parser.add_argument('--profile-startup', nargs='?', const='', metavar='USERNAME',
+                        help="time opening the first window (or USERNAME's product window) and exit")
+    args = parser.parse_args()
+    
+    if args.profile_startup is not None:
+        profile_startup(args.profile_startup)
+        return
+    
     print("=== Product Management System - Multi-User Edition ===")
     print("Starting user selection...")
     
@@ -28,4 +96,4 @@ def main():
         print(f"Error starting application: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
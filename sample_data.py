@@ -4,12 +4,12 @@ Sample Data Generator for Product Management System
 Run this to add some example products to get started
 """
 
-import sqlite3
 from datetime import datetime, timedelta
+from repository import open_product_database
 
 def add_sample_data():
     """Add sample products to the database"""
-    conn = sqlite3.connect('products.db')
+    conn = open_product_database('products.db')
     cursor = conn.cursor()
     
     # Sample products
@@ -2,18 +2,179 @@
 """
 Sample Data Generator for Multi-User Product Management System
 Creates sample users and their product data
+Usage: python sample_data_multiuser.py
+       python sample_data_multiuser.py --users N --products M --credits K [--seed S] [--workers W]
+
+The second form generates N users with M random products and K credit sales
+each, modeled on the sample products below. The data depends only on the
+seed, and each user's database is built in a separate process.
 """
 
+import argparse
+import os
+import random
 import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from db_connection import connect
+from repository import (CreditRepository, ProductRepository, open_product_database,
+                        product_db_filename, transaction)
 
-def create_sample_users():
-    """Create sample users"""
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    
-    # Create users table if it doesn't exist
-    cursor.execute('''
+# Sample users
+SAMPLE_USERS = [
+    {
+        'username': 'amine_algiers',
+        'full_name': 'Amine Djelloud',
+        'location': 'Algiers',
+        'business_name': 'Tech Import Algiers',
+        'usd_to_dzd_rate': 134.5
+    },
+    {
+        'username': 'mohamed_oran',
+        'full_name': 'Mohamed Benali',
+        'location': 'Oran',
+        'business_name': 'Electronics Store Oran',
+        'usd_to_dzd_rate': 135.0
+    },
+    {
+        'username': 'fatima_constantine',
+        'full_name': 'Fatima Khelifi',
+        'location': 'Constantine',
+        'business_name': 'Computer Shop Constantine',
+        'usd_to_dzd_rate': 134.0
+    }
+]
+
+# Sample products tailored to each user's location
+SAMPLE_PRODUCTS = {
+    'algiers': [
+        {
+            'name': 'MacBook Pro 14" M3',
+            'category': 'ordinateur-portable',
+            'cost_price_usd': 1200.00,
+            'transport_price': 80.00,
+            'sale_price': 1650.00,
+            'package_size': '32cm x 22cm x 2.5cm',
+            'status': 'In Stock'
+        },
+        {
+            'name': 'Dell XPS 15',
+            'category': 'ordinateur-portable',
+            'cost_price_usd': 900.00,
+            'transport_price': 70.00,
+            'sale_price': 1300.00,
+            'package_size': '35cm x 24cm x 2.8cm',
+            'status': 'Sold',
+            'sale_days_ago': 2
+        },
+        {
+            'name': 'iPhone 15 Pro',
+            'category': 'smartphone',
+            'cost_price_usd': 700.00,
+            'transport_price': 30.00,
+            'sale_price': 980.00,
+            'package_size': '16cm x 8cm x 2cm',
+            'status': 'Reserved'
+        }
+    ],
+    'oran': [
+        {
+            'name': 'ASUS ROG Strix Gaming',
+            'category': 'ordinateur-portable',
+            'cost_price_usd': 800.00,
+            'transport_price': 65.00,
+            'sale_price': 1150.00,
+            'package_size': '40cm x 28cm x 4cm',
+            'status': 'In Stock'
+        },
+        {
+            'name': 'Samsung Galaxy S24',
+            'category': 'smartphone',
+            'cost_price_usd': 550.00,
+            'transport_price': 25.00,
+            'sale_price': 780.00,
+            'package_size': '15cm x 7.5cm x 1.5cm',
+            'status': 'In Stock'
+        },
+        {
+            'name': 'iPad Air 5th Gen',
+            'category': 'tablet',
+            'cost_price_usd': 450.00,
+            'transport_price': 35.00,
+            'sale_price': 650.00,
+            'package_size': '25cm x 18cm x 1.2cm',
+            'status': 'Sold',
+            'sale_days_ago': 1
+        }
+    ],
+    'constantine': [
+        {
+            'name': 'Lenovo Legion 5 Pro',
+            'category': 'ordinateur-portable',
+            'cost_price_usd': 750.00,
+            'transport_price': 60.00,
+            'sale_price': 1080.00,
+            'package_size': '38cm x 26cm x 3.5cm',
+            'status': 'In Stock'
+        },
+        {
+            'name': 'Surface Pro 9',
+            'category': 'tablet',
+            'cost_price_usd': 600.00,
+            'transport_price': 40.00,
+            'sale_price': 890.00,
+            'package_size': '29cm x 21cm x 1cm',
+            'status': 'Reserved'
+        },
+        {
+            'name': 'AirPods Pro 2nd Gen',
+            'category': 'accessoires',
+            'cost_price_usd': 180.00,
+            'transport_price': 15.00,
+            'sale_price': 280.00,
+            'package_size': '12cm x 10cm x 5cm',
+            'status': 'In Stock'
+        }
+    ],
+}
+
+# A sample credit transaction for each user: (product index, customer, paid, remaining)
+SAMPLE_CREDITS = {
+    'amine_algiers': (2, 'Karim Belkacem', 400.00, 580.00),  # iPhone 15 Pro
+    'mohamed_oran': (0, 'Amina Zeraoulia', 500.00, 650.00),  # ASUS ROG
+    'fatima_constantine': (1, 'Youcef Brahimi', 300.00, 590.00),  # Surface Pro 9
+}
+
+# Generated products vary each sample's cost and transport price by this much either way
+PRICE_SPREAD = 0.15
+
+# (name, category, cost range in USD, transport range, markup) of every sample product.
+# Picking uniformly keeps the samples' category mix: mostly laptops, few accessories.
+PRODUCT_TEMPLATES = [
+    (product['name'], product['category'],
+     (product['cost_price_usd'] * (1 - PRICE_SPREAD), product['cost_price_usd'] * (1 + PRICE_SPREAD)),
+     (product['transport_price'] * (1 - PRICE_SPREAD), product['transport_price'] * (1 + PRICE_SPREAD)),
+     product['sale_price'] / product['cost_price_usd'])
+    for products in SAMPLE_PRODUCTS.values() for product in products
+]
+
+# Status mix of a shop with steady turnover
+STATUS_WEIGHTS = [('In Stock', 60), ('Sold', 25), ('Reserved', 12), ('Damaged', 3)]
+
+PACKAGE_SIZES = sorted({product['package_size'] for products in SAMPLE_PRODUCTS.values() for product in products})
+
+FIRST_NAMES = ['Karim', 'Amina', 'Youcef', 'Sara', 'Mehdi', 'Nadia', 'Rachid', 'Lina', 'Sofiane', 'Meriem']
+LAST_NAMES = ['Belkacem', 'Zeraoulia', 'Brahimi', 'Haddad', 'Mansouri', 'Cherif', 'Bouzid', 'Saidi']
+LOCATIONS = ['Algiers', 'Oran', 'Constantine', 'Annaba', 'Blida', 'Setif', 'Tlemcen', 'Bejaia']
+
+# Generated data is dated from here, so it does not depend on the day it was made
+GENERATED_START_DATE = datetime(2024, 1, 1)
+
+# Products passed to executemany at a time (all of a user's rows share one transaction)
+GENERATE_BATCH_SIZE = 10000
+
+USERS_TABLE_SQL = '''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
@@ -24,32 +185,17 @@ def create_sample_users():
             created_date TEXT,
             last_login TEXT
         )
-    ''')
+'''
+
+def create_sample_users():
+    """Create sample users"""
+    conn = connect('users.db')
+    cursor = conn.cursor()
     
-    # Sample users
-    sample_users = [
-        {
-            'username': 'amine_algiers',
-            'full_name': 'Amine Djelloud',
-            'location': 'Algiers',
-            'business_name': 'Tech Import Algiers',
-            'usd_to_dzd_rate': 134.5
-        },
-        {
-            'username': 'mohamed_oran',
-            'full_name': 'Mohamed Benali',
-            'location': 'Oran',
-            'business_name': 'Electronics Store Oran',
-            'usd_to_dzd_rate': 135.0
-        },
-        {
-            'username': 'fatima_constantine',
-            'full_name': 'Fatima Khelifi',
-            'location': 'Constantine',
-            'business_name': 'Computer Shop Constantine',
-            'usd_to_dzd_rate': 134.0
-        }
-    ]
+    # Create users table if it doesn't exist
+    cursor.execute(USERS_TABLE_SQL)
+    
+    sample_users = SAMPLE_USERS
     
     for user in sample_users:
         try:
@@ -74,200 +220,184 @@ def create_sample_users():
 
 def add_sample_products_for_user(username, usd_rate):
     """Add sample products for a specific user"""
-    db_filename = f'products_{username}.db'
-    conn = sqlite3.connect(db_filename)
-    cursor = conn.cursor()
+    # Create tables and indexes if they don't exist
+    conn = open_product_database(product_db_filename(username))
+    products = ProductRepository(conn)
+    credits = CreditRepository(conn)
     
-    # Create tables if they don't exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            category TEXT,
-            cost_price_usd REAL,
-            cost_price_dzd REAL,
-            transport_price REAL,
-            sale_price REAL,
-            picture_path TEXT,
-            package_size TEXT,
-            package_image_path TEXT,
-            arrival_date TEXT,
-            sale_date TEXT,
-            status TEXT DEFAULT 'In Stock',
-            notes TEXT
-        )
-    ''')
+    location = next(location for location in SAMPLE_PRODUCTS if location in username)
+    sample_products = SAMPLE_PRODUCTS[location]
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS credit_transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER,
-            customer_name TEXT,
-            amount_paid REAL,
-            amount_remaining REAL,
-            transaction_date TEXT,
-            FOREIGN KEY (product_id) REFERENCES products (id)
-        )
-    ''')
-    
-    # Sample products tailored to each user's location
-    if 'algiers' in username:
-        sample_products = [
-            {
-                'name': 'MacBook Pro 14" M3',
-                'category': 'ordinateur-portable',
-                'cost_price_usd': 1200.00,
-                'transport_price': 80.00,
-                'sale_price': 1650.00,
-                'package_size': '32cm x 22cm x 2.5cm',
-                'status': 'In Stock'
-            },
-            {
-                'name': 'Dell XPS 15',
-                'category': 'ordinateur-portable',
-                'cost_price_usd': 900.00,
-                'transport_price': 70.00,
-                'sale_price': 1300.00,
-                'package_size': '35cm x 24cm x 2.8cm',
-                'status': 'Sold',
-                'sale_date': (datetime.now() - timedelta(days=2)).strftime("%Y-%m-%d")
-            },
-            {
-                'name': 'iPhone 15 Pro',
-                'category': 'smartphone',
-                'cost_price_usd': 700.00,
-                'transport_price': 30.00,
-                'sale_price': 980.00,
-                'package_size': '16cm x 8cm x 2cm',
-                'status': 'Reserved'
-            }
-        ]
-    elif 'oran' in username:
-        sample_products = [
-            {
-                'name': 'ASUS ROG Strix Gaming',
-                'category': 'ordinateur-portable',
-                'cost_price_usd': 800.00,
-                'transport_price': 65.00,
-                'sale_price': 1150.00,
-                'package_size': '40cm x 28cm x 4cm',
-                'status': 'In Stock'
-            },
-            {
-                'name': 'Samsung Galaxy S24',
-                'category': 'smartphone',
-                'cost_price_usd': 550.00,
-                'transport_price': 25.00,
-                'sale_price': 780.00,
-                'package_size': '15cm x 7.5cm x 1.5cm',
-                'status': 'In Stock'
-            },
-            {
-                'name': 'iPad Air 5th Gen',
-                'category': 'tablet',
-                'cost_price_usd': 450.00,
-                'transport_price': 35.00,
-                'sale_price': 650.00,
-                'package_size': '25cm x 18cm x 1.2cm',
-                'status': 'Sold',
-                'sale_date': (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-            }
+    with transaction(conn):
+        product_ids = [
+            products.add({
+                **product,
+                'cost_price_dzd': product['cost_price_usd'] * usd_rate,
+                'arrival_date': (datetime.now() - timedelta(days=5)).strftime("%Y-%m-%d"),
+                'sale_date': sale_date(product),
+            })
+            for product in sample_products
         ]
-    else:  # constantine
-        sample_products = [
-            {
-                'name': 'Lenovo Legion 5 Pro',
-                'category': 'ordinateur-portable',
-                'cost_price_usd': 750.00,
-                'transport_price': 60.00,
-                'sale_price': 1080.00,
-                'package_size': '38cm x 26cm x 3.5cm',
-                'status': 'In Stock'
-            },
-            {
-                'name': 'Surface Pro 9',
-                'category': 'tablet',
-                'cost_price_usd': 600.00,
-                'transport_price': 40.00,
-                'sale_price': 890.00,
-                'package_size': '29cm x 21cm x 1cm',
-                'status': 'Reserved'
-            },
-            {
-                'name': 'AirPods Pro 2nd Gen',
-                'category': 'accessoires',
-                'cost_price_usd': 180.00,
-                'transport_price': 15.00,
-                'sale_price': 280.00,
-                'package_size': '12cm x 10cm x 5cm',
-                'status': 'In Stock'
-            }
-        ]
-    
-    for product in sample_products:
-        cost_dzd = product['cost_price_usd'] * usd_rate
-        arrival_date = (datetime.now() - timedelta(days=5)).strftime("%Y-%m-%d")
         
-        cursor.execute('''
-            INSERT INTO products (name, category, cost_price_usd, cost_price_dzd, 
-                                transport_price, sale_price, package_size,
-                                arrival_date, sale_date, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            product['name'],
-            product['category'],
-            product['cost_price_usd'],
-            cost_dzd,
-            product['transport_price'],
-            product['sale_price'],
-            product['package_size'],
-            arrival_date,
-            product.get('sale_date', ''),
-            product['status']
-        ))
+        # Add a sample credit transaction for each user
+        if username in SAMPLE_CREDITS:
+            index, customer, paid, remaining = SAMPLE_CREDITS[username]
+            credits.add_transaction(product_ids[index], customer, paid, remaining)
     
-    # Add a sample credit transaction for each user
-    if username == 'amine_algiers':
-        cursor.execute('''
-            INSERT INTO credit_transactions (product_id, customer_name, amount_paid, amount_remaining, transaction_date)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            3,  # iPhone 15 Pro
-            'Karim Belkacem',
-            400.00,
-            580.00,
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ))
-    elif username == 'mohamed_oran':
-        cursor.execute('''
-            INSERT INTO credit_transactions (product_id, customer_name, amount_paid, amount_remaining, transaction_date)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            1,  # ASUS ROG
-            'Amina Zeraoulia',
-            500.00,
-            650.00,
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ))
-    elif username == 'fatima_constantine':
-        cursor.execute('''
-            INSERT INTO credit_transactions (product_id, customer_name, amount_paid, amount_remaining, transaction_date)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            2,  # Surface Pro 9
-            'Youcef Brahimi',
-            300.00,
-            590.00,
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ))
-    
-    conn.commit()
     conn.close()
     
     return sample_products
 
+def sale_date(product):
+    """Return a sample product's sale date, counted back from today"""
+    if 'sale_days_ago' not in product:
+        return ''
+    return (datetime.now() - timedelta(days=product['sale_days_ago'])).strftime("%Y-%m-%d")
+
+def random_product(rng, usd_rate, start_date):
+    """Return a random product dict shaped like the repository's PRODUCT_FIELDS"""
+    name, category, cost_range, transport_range, markup = rng.choice(PRODUCT_TEMPLATES)
+    status = rng.choices([s for s, _ in STATUS_WEIGHTS], [w for _, w in STATUS_WEIGHTS])[0]
+    cost = round(rng.uniform(*cost_range), 2)
+    arrival = start_date + timedelta(days=rng.randrange(365))
+    sold_on = ''
+    if status == 'Sold':
+        sold_on = (arrival + timedelta(days=rng.randrange(1, 60))).strftime("%Y-%m-%d")
+
+    return {
+        'name': f"{name} #{rng.randrange(1, 10000)}",
+        'category': category,
+        'cost_price_usd': cost,
+        'cost_price_dzd': round(cost * usd_rate, 2),
+        'transport_price': round(rng.uniform(*transport_range), 2),
+        'sale_price': round(cost * markup * rng.uniform(0.95, 1.05), 2),
+        'package_size': rng.choice(PACKAGE_SIZES),
+        'arrival_date': arrival.strftime("%Y-%m-%d"),
+        'sale_date': sold_on,
+        'status': status,
+    }
+
+def random_credit(rng, product_id, sale_price, start_date):
+    """Return (product_id, customer, paid, remaining, date) for a random credit sale"""
+    paid = round(sale_price * rng.uniform(0.2, 1.0), 2)
+    date = start_date + timedelta(minutes=rng.randrange(60 * 24 * 365))
+    customer = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    return (product_id, customer, paid, round(sale_price - paid, 2), date.strftime("%Y-%m-%d %H:%M:%S"))
+
+def fill_product_database(conn, rng, product_count, credit_count, usd_rate):
+    """Add random products and credit sales to a product database in one transaction
+
+    Returns the number of credits added, which is at most the number of products sold or reserved.
+    """
+    products = ProductRepository(conn)
+    with transaction(conn):
+        batch = []
+        for _ in range(product_count):
+            batch.append(random_product(rng, usd_rate, GENERATED_START_DATE))
+            if len(batch) >= GENERATE_BATCH_SIZE:
+                products.add_many(batch)
+                batch = []
+        if batch:
+            products.add_many(batch)
+
+        # Credits go to products that left the shelf
+        sold = conn.execute("SELECT id, sale_price FROM products WHERE status IN ('Sold', 'Reserved')").fetchall()
+        credit_count = min(len(sold), credit_count)
+        conn.executemany(CreditRepository.INSERT_SQL,
+                         [random_credit(rng, product_id, sale_price, GENERATED_START_DATE)
+                          for product_id, sale_price in rng.sample(sold, credit_count)])
+    return credit_count
+
+def build_product_database(filename, product_count, credit_ratio=0.1, usd_rate=134.5, seed=0):
+    """Create a migrated product database with random products and credits, returns the connection"""
+    conn = open_product_database(filename)
+    fill_product_database(conn, random.Random(seed), product_count, int(product_count * credit_ratio), usd_rate)
+    conn.execute('ANALYZE')
+    return conn
+
+def generated_users(count, seed):
+    """Return count random users, the same ones for the same seed"""
+    rng = random.Random(f"{seed}:users")
+    users = []
+    for index in range(1, count + 1):
+        location = rng.choice(LOCATIONS)
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        users.append({
+            'username': f"{first_name.lower()}_{location.lower()}_{index:05d}",
+            'full_name': f"{first_name} {last_name}",
+            'location': location,
+            'business_name': f"{last_name} Electronics {location}",
+            'usd_to_dzd_rate': round(rng.uniform(133.5, 135.5), 1),
+        })
+    return users
+
+def create_generated_users(users):
+    """Save generated users to users.db in one transaction, keeping any that already exist"""
+    conn = connect('users.db')
+    conn.execute(USERS_TABLE_SQL)
+    with transaction(conn):
+        conn.executemany('''
+            INSERT OR IGNORE INTO users (username, full_name, location, business_name, usd_to_dzd_rate, created_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(user['username'], user['full_name'], user['location'], user['business_name'],
+               user['usd_to_dzd_rate'], GENERATED_START_DATE.strftime("%Y-%m-%d %H:%M:%S")) for user in users])
+    conn.close()
+
+def generate_user_database(username, usd_rate, product_count, credit_count, seed):
+    """Build one generated user's product database (runs in a worker process)
+
+    Returns (products, credits) added, or None if the user already has a database.
+    """
+    filename = product_db_filename(username)
+    if os.path.exists(filename):
+        # Leave existing data alone; rerunning with the same seed would recreate it anyway
+        return None
+    
+    conn = open_product_database(filename)
+    try:
+        credits = fill_product_database(conn, random.Random(f"{seed}:{username}"), product_count,
+                                        credit_count, usd_rate)
+    finally:
+        conn.close()
+    return product_count, credits
+
+def generate(user_count, product_count, credit_count, seed, workers):
+    """Create generated users and build their product databases in parallel processes"""
+    users = generated_users(user_count, seed)
+    create_generated_users(users)
+    
+    started = time.perf_counter()
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(generate_user_database,
+                               [user['username'] for user in users],
+                               [user['usd_to_dzd_rate'] for user in users],
+                               [product_count] * len(users), [credit_count] * len(users), [seed] * len(users))
+        for user, result in zip(users, results):
+            if result is None:
+                print(f"  {user['username']}: database already exists, skipping...")
+                continue
+            total_rows += sum(result)
+            print(f"  {user['username']}: {result[0]} products, {result[1]} credits")
+    
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ {total_rows} rows generated for {len(users)} users in {elapsed:.1f} s")
+
 def main():
     """Create sample data for multi-user system"""
+    parser = argparse.ArgumentParser(description="Create sample users and products, or generate random ones")
+    parser.add_argument('--users', type=int, help="generate this many random users instead of the samples")
+    parser.add_argument('--products', type=int, default=1000, help="products generated per user")
+    parser.add_argument('--credits', type=int, default=100, help="credit sales generated per user")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the generated data")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+    
+    if args.users:
+        print(f"Generating {args.users} users with {args.products} products and {args.credits} credits each...")
+        generate(args.users, args.products, args.credits, args.seed, args.workers)
+        return
+    
     print("Creating sample users and data...")
     
     # Create sample users
@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+Shared Storage for Product Manager
+Optional storage mode keeping every user's products and credits in one
+database (shop.db) instead of one products_<username>.db per user. Rows
+carry a user_id and every index starts with it, so one user's data is a
+contiguous index range and shop-wide queries are a single scan.
+
+Enable it by setting PRODUCT_STORAGE=shared before starting the app, after
+merging the existing per-user files:
+    python shared_storage.py merge [USERNAME ...]
+    python shared_storage.py extract USERNAME OUTPUT.db
+"""
+
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from db_connection import connect
+from db_schema import LOGGED_TABLES, SHARED_MIGRATIONS, SUMMARY_COLUMNS, SUMMARY_TOLERANCE, migrate, row_json
+from product_search import SEARCH_LIMIT, search_products
+from repository import (CREDIT_LIST_QUERY, CREDIT_SORT_KEYS, CUSTOMER_LIMIT, PICKER_LIMIT, PRODUCT_COLUMNS,
+                        PRODUCT_FIELDS, PRODUCT_INSERT_FIELDS, PRODUCT_LIST_COLUMNS, PRODUCT_SORT_KEYS,
+                        ChangeLogRepository, CreditRepository, ProductRepository, open_product_database,
+                        product_db_filename, sorted_page, transaction)
+
+SHARED_DB_FILENAME = 'shop.db'
+
+# Environment variable selecting the storage mode: 'shared' or unset for one file per user
+STORAGE_ENV = 'PRODUCT_STORAGE'
+
+# Product columns without the id, as stored in both kinds of database
+PRODUCT_DATA_COLUMNS = PRODUCT_COLUMNS.split(', ', 1)[1]
+CREDIT_DATA_COLUMNS = 'customer_name, amount_paid, amount_remaining, transaction_date'
+PAYMENT_DATA_COLUMNS = 'amount, payment_date, kind'
+
+# Triggers that derive payments and balances; copied rows already carry both
+PAYMENT_TRIGGERS = ('credit_payments_down_payment', 'credit_payments_balance')
+
+# One user's rows of each logged table (?1 is the user id), as index ranges
+USER_ROWS = {
+    'products': 'user_id = ?1',
+    'credit_transactions': 'user_id = ?1',
+    'credit_payments': 'credit_id IN (SELECT id FROM credit_transactions WHERE user_id = ?1)',
+}
+
+
+def shared_storage_enabled():
+    """Return True when the app is configured to use the shared database"""
+    return os.environ.get(STORAGE_ENV, '').strip().lower() == 'shared'
+
+
+def open_shared_database(filename=SHARED_DB_FILENAME, **options):
+    """Open the shared database, creating or upgrading its schema"""
+    conn = connect(filename, **options)
+    migrate(conn, migrations=SHARED_MIGRATIONS)
+    return conn
+
+
+def user_database(username, user_id):
+    """Return (database file, user_id filter) holding a user's data in the configured storage mode
+
+    The filter is None for a per-user database, which holds only that user's rows.
+    """
+    if shared_storage_enabled():
+        return SHARED_DB_FILENAME, user_id
+    return product_db_filename(username), None
+
+
+def open_user_storage(username, user_id, **options):
+    """Open a user's data in the configured storage mode, returns (conn, products, credits)"""
+    if shared_storage_enabled():
+        conn = open_shared_database(**options)
+        return conn, SharedProductRepository(conn, user_id), SharedCreditRepository(conn, user_id)
+
+    conn = open_product_database(product_db_filename(username), **options)
+    return conn, ProductRepository(conn), CreditRepository(conn)
+
+
+def user_change_log(conn, user_id):
+    """Return the change log of a user's data opened with open_user_storage"""
+    if shared_storage_enabled():
+        return SharedChangeLogRepository(conn, user_id)
+    return ChangeLogRepository(conn)
+
+
+class SharedProductRepository(ProductRepository):
+    """ProductRepository limited to one user's rows of the shared database"""
+
+    INSERT_SQL = f'''
+        INSERT INTO products (user_id, {", ".join(PRODUCT_INSERT_FIELDS)})
+        VALUES (?, {", ".join("?" for _ in PRODUCT_INSERT_FIELDS)})
+    '''
+    UPDATE_SQL = f'''
+        UPDATE products SET {", ".join(f"{field}=?" for field in PRODUCT_FIELDS)}
+        WHERE id=? AND user_id=?
+    '''
+    DELETE_SQL = 'DELETE FROM products WHERE id=? AND user_id=?'
+    GET_SQL = f'SELECT {PRODUCT_COLUMNS} FROM products WHERE id=? AND user_id=?'
+    LIST_ROW_SQL = f'SELECT {PRODUCT_LIST_COLUMNS} FROM products WHERE id=? AND user_id=?'
+    PAGE_SQL = f'SELECT {PRODUCT_LIST_COLUMNS} FROM products WHERE user_id=? AND id > ? ORDER BY id LIMIT ?'
+    SORTED_PAGE_SQL = f'SELECT {PRODUCT_LIST_COLUMNS} FROM products WHERE user_id=?'
+    CATEGORIES_SQL = '''
+        SELECT MIN(category) FROM products
+        WHERE user_id=? AND IFNULL(category, '') COLLATE NOCASE > ''
+        GROUP BY IFNULL(category, '') COLLATE NOCASE
+        ORDER BY IFNULL(category, '') COLLATE NOCASE
+    '''
+    IN_STOCK_SQL = "SELECT id, name, sale_price FROM products WHERE user_id=? AND status='In Stock'"
+    IN_STOCK_MATCHING_SQL = '''
+        SELECT id, name, sale_price FROM products
+        WHERE user_id=?1 AND status='In Stock'
+          AND name COLLATE NOCASE >= ?2 AND name COLLATE NOCASE < ?2 || char(1114111)
+        ORDER BY name COLLATE NOCASE LIMIT ?3
+    '''
+    FTS_INDEX_SQL = '''
+        INSERT INTO products_fts (rowid, name, category, package_size, notes, user_id)
+        SELECT id, name, category, package_size, notes, user_id FROM products WHERE id > ?
+    '''
+    LOG_INSERTS_SQL = f'''
+        INSERT INTO change_log (user_id, table_name, row_id, operation, data)
+        SELECT user_id, 'products', id, 'insert', {row_json('products', 'products')}
+        FROM products WHERE id > ? ORDER BY id
+    '''
+    STATISTICS_SQL = ProductRepository.STATISTICS_SQL + ' WHERE user_id = ?'
+
+    def __init__(self, conn, user_id):
+        super().__init__(conn)
+        self.user_id = user_id
+
+    def insert_values(self, product):
+        return [self.user_id] + super().insert_values(product)
+
+    def update(self, product_id, product):
+        with transaction(self.conn):
+            self.conn.execute(self.UPDATE_SQL, [product.get(field) for field in PRODUCT_FIELDS]
+                              + [product_id, self.user_id])
+
+    def delete(self, product_id):
+        with transaction(self.conn):
+            self.conn.execute(self.DELETE_SQL, (product_id, self.user_id))
+
+    def get(self, product_id):
+        return self.conn.execute(self.GET_SQL, (product_id, self.user_id)).fetchone()
+
+    def list_row(self, product_id):
+        return self.conn.execute(self.LIST_ROW_SQL, (product_id, self.user_id)).fetchone()
+
+    def page(self, after_id=0, limit=-1):
+        return self.conn.execute(self.PAGE_SQL, (self.user_id, after_id, limit)).fetchall()
+
+    def sorted_page(self, sort='id', descending=False, status=None, category=None, after=None, limit=-1):
+        return sorted_page(self.conn, self.SORTED_PAGE_SQL, (self.user_id,), 'id', PRODUCT_SORT_KEYS[sort],
+                           descending, self.filters(status, category), after, limit)
+
+    def categories(self):
+        return [row[0] for row in self.conn.execute(self.CATEGORIES_SQL, (self.user_id,))]
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        return search_products(self.conn.cursor(), text, PRODUCT_LIST_COLUMNS, limit, user_id=self.user_id)
+
+    def in_stock(self):
+        return self.conn.execute(self.IN_STOCK_SQL, (self.user_id,)).fetchall()
+
+    def in_stock_matching(self, prefix='', limit=PICKER_LIMIT):
+        return self.conn.execute(self.IN_STOCK_MATCHING_SQL, (self.user_id, prefix, limit)).fetchall()
+
+    def statistics(self):
+        return self.conn.execute(self.STATISTICS_SQL, (self.user_id,)).fetchone()
+
+
+class SharedCreditRepository(CreditRepository):
+    """CreditRepository limited to one user's rows of the shared database"""
+
+    INSERT_SQL = '''
+        INSERT INTO credit_transactions (user_id, product_id, customer_name, amount_paid, amount_remaining,
+                                         transaction_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    MARK_SOLD_SQL = "UPDATE products SET status='Sold', sale_date=? WHERE id=? AND user_id=?"
+    MARK_RESERVED_SQL = "UPDATE products SET status='Reserved' WHERE id=? AND user_id=?"
+    LIST_SQL = CREDIT_LIST_QUERY + ' WHERE ct.user_id=? ORDER BY ct.transaction_date DESC'
+    LIST_ROW_SQL = CREDIT_LIST_QUERY + ' WHERE ct.id=? AND ct.user_id=?'
+    FIRST_PAGE_SQL = CREDIT_LIST_QUERY + '''
+        WHERE ct.user_id=?
+        ORDER BY ct.transaction_date DESC, ct.id DESC LIMIT ?
+    '''
+    PAGE_SQL = CREDIT_LIST_QUERY + '''
+        WHERE ct.user_id=? AND (ct.transaction_date, ct.id) < (?, ?)
+        ORDER BY ct.transaction_date DESC, ct.id DESC LIMIT ?
+    '''
+    SORTED_PAGE_SQL = CREDIT_LIST_QUERY + ' WHERE ct.user_id=?'
+    IDS_FOR_PRODUCT_SQL = 'SELECT id FROM credit_transactions WHERE product_id=? AND user_id=?'
+    PRODUCT_ID_SQL = 'SELECT product_id FROM credit_transactions WHERE id=? AND user_id=?'
+    ADD_PAYMENT_SQL = '''
+        INSERT INTO credit_payments (credit_id, amount, payment_date)
+        SELECT id, ?1, ?2 FROM credit_transactions
+        WHERE id=?3 AND user_id=?4 AND IFNULL(amount_remaining, 0) >= ?1 - 0.005
+    '''
+    REMAINING_SQL = 'SELECT IFNULL(amount_remaining, 0) FROM credit_transactions WHERE id=? AND user_id=?'
+    PAYMENTS_SQL = '''
+        SELECT p.id, p.payment_date, p.kind, p.amount,
+               SUM(p.amount) OVER running,
+               IFNULL(ct.amount_paid, 0) + IFNULL(ct.amount_remaining, 0) - SUM(p.amount) OVER running
+        FROM credit_payments p
+        JOIN credit_transactions ct ON ct.id = p.credit_id
+        WHERE p.credit_id=? AND ct.user_id=?
+        WINDOW running AS (ORDER BY p.payment_date, p.id)
+        ORDER BY p.payment_date, p.id
+    '''
+    CUSTOMER_HISTORY_SQL = '''
+        WITH events AS (
+            SELECT transaction_date AS event_date, id AS credit_id, 'Credit' AS kind, id AS event_id,
+                   IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0) AS charge, 0 AS payment
+            FROM credit_transactions
+            WHERE customer_id=(SELECT id FROM customers WHERE user_id=? AND name_key=lower(trim(?)))
+            UNION ALL
+            SELECT p.payment_date, p.credit_id, p.kind, p.id, 0, p.amount
+            FROM credit_transactions ct
+            JOIN credit_payments p ON p.credit_id = ct.id
+            WHERE ct.customer_id=(SELECT id FROM customers WHERE user_id=? AND name_key=lower(trim(?)))
+        )
+        SELECT event_date, credit_id, kind, charge, payment,
+               SUM(charge - payment) OVER (ORDER BY event_date, kind, event_id)
+        FROM events
+        ORDER BY event_date, kind, event_id
+    '''
+    CUSTOMERS_SQL = '''
+        SELECT id, name, outstanding FROM customers
+        WHERE user_id=?1 AND name_key >= lower(trim(?2)) AND name_key < lower(trim(?2)) || char(1114111)
+        ORDER BY name_key LIMIT ?3
+    '''
+    CUSTOMER_SQL = '''
+        SELECT id, name, credit_count, total_credit, outstanding FROM customers
+        WHERE user_id=? AND name_key=lower(trim(?))
+    '''
+    SUMMARY_SQL = 'SELECT total_credits, total_paid, total_outstanding FROM credit_summary WHERE user_id=?'
+    COMPUTE_SUMMARY_SQL = '''
+        SELECT IFNULL(SUM(IFNULL(amount_paid, 0) + IFNULL(amount_remaining, 0)), 0),
+               IFNULL(SUM(IFNULL(amount_paid, 0)), 0),
+               IFNULL(SUM(IFNULL(amount_remaining, 0)), 0),
+               COUNT(*)
+        FROM credit_transactions WHERE user_id=?
+    '''
+
+    def __init__(self, conn, user_id):
+        super().__init__(conn)
+        self.user_id = user_id
+
+    def add_transaction(self, product_id, customer_name, amount_paid, amount_remaining, transaction_date=None):
+        if transaction_date is None:
+            transaction_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with transaction(self.conn):
+            cursor = self.conn.execute(self.INSERT_SQL, (
+                self.user_id, product_id, customer_name, amount_paid, amount_remaining, transaction_date
+            ))
+        return cursor.lastrowid
+
+    def create_sale(self, product_id, customer_name, total_amount, amount_paid, transaction_date=None):
+        if transaction_date is None:
+            transaction_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        amount_remaining = total_amount - amount_paid
+        with transaction(self.conn):
+            credit_id = self.add_transaction(product_id, customer_name, amount_paid, amount_remaining,
+                                             transaction_date)
+            if amount_remaining <= 0:
+                self.conn.execute(self.MARK_SOLD_SQL, (transaction_date[:10], product_id, self.user_id))
+            else:
+                self.conn.execute(self.MARK_RESERVED_SQL, (product_id, self.user_id))
+        return credit_id
+
+    def add_payment(self, credit_id, amount, payment_date=None):
+        if amount <= 0:
+            raise ValueError("Payment amount must be positive")
+        if payment_date is None:
+            payment_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with transaction(self.conn):
+            cursor = self.conn.execute(self.ADD_PAYMENT_SQL, (amount, payment_date, credit_id, self.user_id))
+            if cursor.rowcount == 0:
+                self.refuse_payment(self.conn.execute(self.REMAINING_SQL, (credit_id, self.user_id)).fetchone(),
+                                    credit_id, amount)
+            # The credit belongs to this user, so its product does too
+            self.conn.execute(self.MARK_PAID_OFF_SQL, (payment_date[:10], credit_id))
+        return cursor.lastrowid
+
+    def payments(self, credit_id):
+        return self.conn.execute(self.PAYMENTS_SQL, (credit_id, self.user_id)).fetchall()
+
+    def customer_history(self, customer_name):
+        return self.conn.execute(self.CUSTOMER_HISTORY_SQL,
+                                 (self.user_id, customer_name, self.user_id, customer_name)).fetchall()
+
+    def customers(self, prefix='', limit=CUSTOMER_LIMIT):
+        return self.conn.execute(self.CUSTOMERS_SQL, (self.user_id, prefix, limit)).fetchall()
+
+    def customer(self, name):
+        return self.conn.execute(self.CUSTOMER_SQL, (self.user_id, name)).fetchone()
+
+    def product_id(self, credit_id):
+        row = self.conn.execute(self.PRODUCT_ID_SQL, (credit_id, self.user_id)).fetchone()
+        return row[0] if row else None
+
+    def list_rows(self):
+        return self.conn.execute(self.LIST_SQL, (self.user_id,)).fetchall()
+
+    def list_row(self, credit_id):
+        return self.conn.execute(self.LIST_ROW_SQL, (credit_id, self.user_id)).fetchone()
+
+    def page(self, before=None, limit=-1):
+        if before is None:
+            return self.conn.execute(self.FIRST_PAGE_SQL, (self.user_id, limit)).fetchall()
+        return self.conn.execute(self.PAGE_SQL, (self.user_id, before[0], before[1], limit)).fetchall()
+
+    def sorted_page(self, sort='transaction_date', descending=True, outstanding=None, after=None, limit=-1):
+        return sorted_page(self.conn, self.SORTED_PAGE_SQL, (self.user_id,), 'ct.id', CREDIT_SORT_KEYS[sort],
+                           descending, self.balance_filters(outstanding), after, limit)
+
+    def ids_for_product(self, product_id):
+        return [row[0] for row in self.conn.execute(self.IDS_FOR_PRODUCT_SQL, (product_id, self.user_id))]
+
+    def summary(self):
+        result = self.conn.execute(self.SUMMARY_SQL, (self.user_id,)).fetchone()
+        return tuple(value or 0 for value in result) if result else (0, 0, 0)
+
+    def verify_summary(self):
+        stored = self.conn.execute(f'SELECT {", ".join(SUMMARY_COLUMNS)} FROM credit_summary WHERE user_id=?',
+                                   (self.user_id,)).fetchone() or (0, 0, 0, 0)
+        actual = self.conn.execute(self.COMPUTE_SUMMARY_SQL, (self.user_id,)).fetchone()
+        return [
+            (column, stored_value, actual_value)
+            for column, stored_value, actual_value in zip(SUMMARY_COLUMNS, stored, actual)
+            if abs(stored_value - actual_value) > SUMMARY_TOLERANCE
+        ]
+
+    def rebuild_summary(self):
+        with transaction(self.conn):
+            actual = self.conn.execute(self.COMPUTE_SUMMARY_SQL, (self.user_id,)).fetchone()
+            self.conn.execute(f'''
+                INSERT OR REPLACE INTO credit_summary (user_id, {", ".join(SUMMARY_COLUMNS)})
+                VALUES (?, ?, ?, ?, ?)
+            ''', (self.user_id,) + tuple(actual))
+
+
+class SharedChangeLogRepository(ChangeLogRepository):
+    """ChangeLogRepository limited to one user's changes and snapshots in the shared database
+
+    seq counts every user's changes, so a user's entries are a range of idx_change_log_user with gaps.
+    """
+
+    CHANGES_SQL = '''
+        SELECT seq, changed_at, table_name, row_id, operation, data FROM change_log
+        WHERE user_id=? AND seq > ? ORDER BY seq LIMIT ?
+    '''
+    HISTORY_SQL = '''
+        SELECT seq, changed_at, table_name, row_id, operation, data FROM change_log
+        WHERE user_id=? AND table_name=? AND row_id=? ORDER BY seq
+    '''
+    LAST_SEQ_SQL = 'SELECT IFNULL(MAX(seq), 0) FROM change_log WHERE user_id=?'
+    CHANGES_SINCE_SQL = 'SELECT COUNT(*) FROM (SELECT 1 FROM change_log WHERE user_id=? AND seq > ? LIMIT ?)'
+    LAST_SNAPSHOT_SQL = '''
+        SELECT id, seq, row_count FROM change_snapshots WHERE user_id=? ORDER BY taken_at DESC, id DESC LIMIT 1
+    '''
+    FIRST_SNAPSHOT_SQL = 'SELECT seq, taken_at FROM change_snapshots WHERE user_id=? ORDER BY taken_at, id LIMIT 1'
+    SNAPSHOT_BEFORE_SQL = '''
+        SELECT id, seq FROM change_snapshots WHERE user_id=? AND taken_at <= ?
+        ORDER BY taken_at DESC, id DESC LIMIT 1
+    '''
+    SNAPSHOT_AFTER_SQL = '''
+        SELECT seq FROM change_snapshots WHERE user_id=? AND taken_at > ? ORDER BY taken_at, id LIMIT 1
+    '''
+    REPLAY_SQL = '''
+        SELECT table_name, row_id, data FROM change_log
+        WHERE user_id=? AND seq > ? AND seq <= ? AND changed_at <= ? ORDER BY seq
+    '''
+    WINDOW_SQL = '''
+        SELECT MAX(seq), COUNT(*) FROM (SELECT seq FROM change_log WHERE user_id=? AND seq > ? ORDER BY seq LIMIT ?)
+    '''
+    LATEST_CHANGES_SQL = '''
+        SELECT table_name, row_id, MAX(seq), data FROM change_log
+        WHERE user_id=? AND seq > ? AND seq <= ? GROUP BY table_name, row_id ORDER BY 3
+    '''
+    SNAPSHOT_SEQ_SQL = 'SELECT seq FROM change_snapshots WHERE user_id=? AND id=?'
+    # Snapshot ids come from clients, so check the snapshot is this user's
+    SNAPSHOT_PAGE_SQL = '''
+        SELECT table_name, row_id, data FROM snapshot_rows
+        WHERE snapshot_id=(SELECT id FROM change_snapshots WHERE id=?2 AND user_id=?1)
+          AND (table_name, row_id) > (?3, ?4) ORDER BY table_name, row_id LIMIT ?5
+    '''
+    ROW_VERSION_SQL = 'SELECT IFNULL(MAX(seq), 0) FROM change_log WHERE table_name=?2 AND row_id=?3 AND user_id=?1'
+    ROW_CHANGE_AT_SQL = '''
+        SELECT data FROM change_log WHERE table_name=?2 AND row_id=?3 AND seq <= ?4 AND user_id=?1
+        ORDER BY seq DESC LIMIT 1
+    '''
+    SNAPSHOT_ROW_AT_SQL = '''
+        SELECT r.data FROM change_snapshots s
+        JOIN snapshot_rows r ON r.snapshot_id = s.id AND r.table_name = ?2 AND r.row_id = ?3
+        WHERE s.user_id = ?1 AND s.seq <= ?4 ORDER BY s.seq DESC LIMIT 1
+    '''
+    INSERT_SNAPSHOT_SQL = 'INSERT INTO change_snapshots (user_id, seq) SELECT ?, IFNULL(MAX(seq), 0) FROM change_log'
+    COPY_ROWS_SQL = tuple(f'''
+        INSERT INTO snapshot_rows (snapshot_id, table_name, row_id, data)
+        SELECT ?2, '{table}', id, {row_json(table, table)} FROM {table}
+        WHERE {USER_ROWS[table]}
+    ''' for table in LOGGED_TABLES)
+
+    def __init__(self, conn, user_id):
+        super().__init__(conn)
+        self.user_id = user_id
+
+    def changes_since(self, seq, limit):
+        # Other users' changes take seq numbers too, so count this user's
+        return self.conn.execute(self.CHANGES_SINCE_SQL, (self.user_id, seq, limit)).fetchone()[0]
+
+    def scoped(self, *params):
+        return (self.user_id,) + params
+
+
+@contextmanager
+def triggers_suspended(conn, names):
+    """Drop triggers for the duration of a block and recreate them (call inside a transaction)"""
+    definitions = [conn.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?",
+                                (name,)).fetchone()[0] for name in names]
+    for name in names:
+        conn.execute(f'DROP TRIGGER {name}')
+    yield
+    for sql in definitions:
+        conn.execute(sql)
+
+
+def merge_user_database(conn, filename, user_id):
+    """Copy a per-user database into the shared database, returns (products, credits, payments) copied
+
+    Rows keep their relative order but get new ids above the shared database's
+    current maximum, so ids never collide between users.
+    """
+    # Bring the source to the current per-user schema so the columns line up
+    open_product_database(filename).close()
+
+    if conn.execute('SELECT 1 FROM products WHERE user_id=? LIMIT 1', (user_id,)).fetchone() or \
+            conn.execute('SELECT 1 FROM credit_transactions WHERE user_id=? LIMIT 1', (user_id,)).fetchone():
+        raise ValueError(f"User {user_id} already has data in the shared database")
+
+    # ATTACH cannot run inside a transaction
+    conn.execute('ATTACH DATABASE ? AS source', (filename,))
+    try:
+        with transaction(conn):
+            product_offset = conn.execute('SELECT IFNULL(MAX(id), 0) FROM products').fetchone()[0]
+            credit_offset = conn.execute('SELECT IFNULL(MAX(id), 0) FROM credit_transactions').fetchone()[0]
+            payment_offset = conn.execute('SELECT IFNULL(MAX(id), 0) FROM credit_payments').fetchone()[0]
+
+            # Index and log the copied rows in one pass instead of through the per-row triggers
+            with triggers_suspended(conn, ('products_fts_insert', 'products_log_insert')):
+                products = conn.execute(f'''
+                    INSERT INTO products (id, user_id, {PRODUCT_DATA_COLUMNS})
+                    SELECT id + ?, ?, {PRODUCT_DATA_COLUMNS} FROM source.products ORDER BY id
+                ''', (product_offset, user_id)).rowcount
+                conn.execute(SharedProductRepository.FTS_INDEX_SQL, (product_offset,))
+                conn.execute(SharedProductRepository.LOG_INSERTS_SQL, (product_offset,))
+
+            with triggers_suspended(conn, PAYMENT_TRIGGERS):
+                # Credits whose product was deleted before foreign keys were enforced keep a NULL product
+                credits = conn.execute(f'''
+                    INSERT INTO credit_transactions (id, user_id, product_id, {CREDIT_DATA_COLUMNS})
+                    SELECT ct.id + ?, ?, p.id + ?, {", ".join(f"ct.{c}" for c in CREDIT_DATA_COLUMNS.split(", "))}
+                    FROM source.credit_transactions ct
+                    LEFT JOIN source.products p ON p.id = ct.product_id
+                    ORDER BY ct.id
+                ''', (credit_offset, user_id, product_offset)).rowcount
+                payments = conn.execute(f'''
+                    INSERT INTO credit_payments (id, credit_id, {PAYMENT_DATA_COLUMNS})
+                    SELECT id + ?, credit_id + ?, {PAYMENT_DATA_COLUMNS} FROM source.credit_payments ORDER BY id
+                ''', (payment_offset, credit_offset)).rowcount
+    finally:
+        conn.execute('DETACH DATABASE source')
+
+    return products, credits, payments
+
+
+def extract_user_database(shared_filename, user_id, filename):
+    """Write one user's rows of the shared database to a new per-user database file"""
+    if os.path.exists(filename):
+        raise ValueError(f"{filename} already exists")
+
+    conn = open_product_database(filename)
+    try:
+        conn.execute('ATTACH DATABASE ? AS shared', (shared_filename,))
+        with transaction(conn):
+            conn.execute(f'''
+                INSERT INTO products (id, {PRODUCT_DATA_COLUMNS})
+                SELECT id, {PRODUCT_DATA_COLUMNS} FROM shared.products WHERE user_id=? ORDER BY id
+            ''', (user_id,))
+            with triggers_suspended(conn, PAYMENT_TRIGGERS):
+                conn.execute(f'''
+                    INSERT INTO credit_transactions (id, product_id, {CREDIT_DATA_COLUMNS})
+                    SELECT id, product_id, {CREDIT_DATA_COLUMNS}
+                    FROM shared.credit_transactions WHERE user_id=? ORDER BY id
+                ''', (user_id,))
+                conn.execute(f'''
+                    INSERT INTO credit_payments (id, credit_id, {PAYMENT_DATA_COLUMNS})
+                    SELECT p.id, p.credit_id, {", ".join(f"p.{c}" for c in PAYMENT_DATA_COLUMNS.split(", "))}
+                    FROM shared.credit_payments p
+                    JOIN shared.credit_transactions ct ON ct.id = p.credit_id
+                    WHERE ct.user_id=? ORDER BY p.id
+                ''', (user_id,))
+        conn.execute('DETACH DATABASE shared')
+        # A self-contained single file, like the backups made by data_export
+        conn.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        conn.close()
+
+
+def delete_user_data(conn, user_id):
+    """Delete every row of a user from the shared database in one transaction, returns the products deleted"""
+    with transaction(conn):
+        # The user's change log goes too, so do not log the deletes
+        with triggers_suspended(conn, [f'{table}_log_delete' for table in LOGGED_TABLES]):
+            conn.execute(f"DELETE FROM credit_payments WHERE {USER_ROWS['credit_payments']}", (user_id,))
+            conn.execute('DELETE FROM credit_transactions WHERE user_id=?', (user_id,))
+            conn.execute('DELETE FROM customers WHERE user_id=?', (user_id,))
+            conn.execute('DELETE FROM credit_summary WHERE user_id=?', (user_id,))
+            # products_fts_delete removes the search entries
+            products = conn.execute('DELETE FROM products WHERE user_id=?', (user_id,)).rowcount
+        conn.execute('DELETE FROM snapshot_rows WHERE snapshot_id IN '
+                     '(SELECT id FROM change_snapshots WHERE user_id=?)', (user_id,))
+        conn.execute('DELETE FROM change_snapshots WHERE user_id=?', (user_id,))
+        conn.execute('DELETE FROM change_log WHERE user_id=?', (user_id,))
+    return products
+
+
+def load_users(users_db='users.db'):
+    """Return {username: user id} for every user"""
+    conn = connect(users_db)
+    try:
+        return dict(conn.execute('SELECT username, id FROM users'))
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the shared multi-user database")
+    parser.add_argument('--shared', default=SHARED_DB_FILENAME, help="shared database file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    merge_parser = commands.add_parser('merge', help="copy per-user databases into the shared database")
+    merge_parser.add_argument('usernames', nargs='*', help="users to merge (default: every user)")
+    extract_parser = commands.add_parser('extract', help="write one user's data to a per-user database")
+    extract_parser.add_argument('username')
+    extract_parser.add_argument('output')
+    args = parser.parse_args()
+
+    users = load_users()
+    if args.command == 'extract':
+        if args.username not in users:
+            parser.error(f"unknown user: {args.username}")
+        try:
+            extract_user_database(args.shared, users[args.username], args.output)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"{args.username}: written to {args.output}")
+        return
+
+    failed = False
+    conn = open_shared_database(args.shared)
+    try:
+        for username in args.usernames or sorted(users):
+            filename = product_db_filename(username)
+            if username not in users:
+                print(f"{username}: unknown user")
+                failed = True
+                continue
+            if not os.path.exists(filename):
+                print(f"{username}: no {filename}, skipped")
+                continue
+            try:
+                products, credits, payments = merge_user_database(conn, filename, users[username])
+            except ValueError as e:
+                print(f"{username}: {e}")
+                failed = True
+                continue
+            print(f"{username}: merged {products} products, {credits} credits and {payments} payments "
+                  f"from {filename}")
+    finally:
+        conn.close()
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
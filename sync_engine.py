@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Sync Engine for Product Manager
+Exchanges product and credit changes with another copy of a user's data (the
+web frontend, or any client keeping its own store) as deltas since the
+client's last sync cursor, read from the change log (schema version 9)
+
+Pull: the client sends the cursor it stored after its last sync (none the
+first time) and gets each row changed since then once, with its version (the
+seq of its last change). A first sync starts from the latest change log
+snapshot instead of the whole log. Pages are followed through 'next' until it is None;
+the last page's 'cursor' is the one to store.
+
+Push: the client sends its cursor and its changes in order:
+    {'table': 'products', 'op': 'update', 'id': 12, 'data': {'sale_price': 40}}
+Rows created on the client use negative ids, which the response maps to the
+new server ids. Later changes in the same push may refer to them (e.g. a
+credit's product_id). Values are checked and converted as product_import
+does for imported rows. A change is based on the cursor (or its own
+'base_version'), or on the push's last change to the same row if later.
+Conflicts are resolved the same way every time:
+- a row unchanged on the server since its base takes the client's change
+- otherwise an update keeps the fields the server left alone since the
+  base and the server's values for the ones both sides changed ('merged')
+- a delete of a row the server changed since its base is refused, as is any
+  change to a row that no longer exists or a sale of a product no longer
+  in stock ('conflict')
+Credits and payments can only be added: a credit is a credit sale, which
+reserves or sells its product as in the desktop app, and balances move
+through payments. The next pull brings the client the server's values.
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+
+from product_import import DATE_FIELDS, NUMERIC_FIELDS, STATUS_LOOKUP, parse_date, parse_number
+from repository import CHANGE_PAGE_SIZE, PRODUCT_FIELDS, PRODUCT_STATUSES, transaction
+
+# Operations a client may push for each table, and the fields it may set
+SYNC_TABLES = {
+    'products': (('insert', 'update', 'delete'), PRODUCT_FIELDS),
+    'credit_transactions': (('insert',), ('product_id', 'customer_name', 'amount_paid', 'amount_remaining',
+                                          'transaction_date')),
+    'credit_payments': (('insert',), ('credit_id', 'amount', 'payment_date')),
+}
+
+# Fields holding the id of another synced row, which a push may give as a new row's negative id
+REFERENCES = {'product_id': 'products', 'credit_id': 'credit_transactions'}
+
+# Most changes accepted in one push
+MAX_PUSH_CHANGES = 5000
+
+# Product fields as returned by ProductRepository.get() (the id first)
+PRODUCT_ROW_FIELDS = ('id',) + PRODUCT_FIELDS + ('notes',)
+
+# Product fields stored as numbers (imports compute the DZD cost, a client may send it)
+PRICE_FIELDS = NUMERIC_FIELDS + ('cost_price_dzd',)
+
+
+class SyncEngine:
+    def __init__(self, products, credits, change_log):
+        """Repositories over one user's data (the Shared* ones in the shared database)"""
+        self.conn = products.conn
+        self.products = products
+        self.credits = credits
+        self.change_log = change_log
+
+    def pull(self, cursor=None, limit=CHANGE_PAGE_SIZE, snapshot=None, after=('', 0)):
+        """Return the rows changed since cursor as {'changes', 'cursor', 'next'}
+
+        changes are {'table', 'id', 'version', 'data'}, data being None for a
+        deleted row. next holds the pull arguments of the next page, or None.
+        Without a cursor (a first sync), snapshot and after page through the
+        starting snapshot.
+        """
+        if (cursor is not None and cursor < 0) or limit < 1:
+            raise ValueError("cursor and limit must be positive")
+
+        if cursor is None and snapshot is None:
+            # Start from the latest snapshot; with none, every one of the user's rows is in the log
+            latest = self.change_log.last_snapshot()
+            if latest is not None:
+                snapshot = latest[0]
+            cursor = 0
+        if snapshot is not None:
+            return self.pull_snapshot(snapshot, after, limit)
+
+        rows, end, full = self.change_log.latest_changes(cursor, limit)
+        return {
+            'changes': [{'table': table, 'id': row_id, 'version': seq, 'data': decode(data)}
+                        for table, row_id, seq, data in rows],
+            'cursor': end,
+            'next': {'cursor': end} if full else None,
+        }
+
+    def pull_snapshot(self, snapshot, after, limit):
+        """Return a page of a snapshot's rows, then continue with the changes after it"""
+        seq = self.change_log.snapshot_seq(snapshot)
+        if seq is None:
+            raise ValueError(f"Unknown snapshot: {snapshot}")
+        rows = self.change_log.snapshot_page(snapshot, after, limit)
+        if len(rows) == limit:
+            next_page = {'snapshot': snapshot, 'after': (rows[-1][0], rows[-1][1])}
+        else:
+            next_page = {'cursor': seq}
+        # A snapshot row's last change is at or before the snapshot, so its seq
+        # is a safe version: a push based on it only conflicts with later changes
+        return {
+            'changes': [{'table': table, 'id': row_id, 'version': seq, 'data': decode(data)}
+                        for table, row_id, data in rows],
+            'cursor': seq,
+            'next': next_page,
+        }
+
+    def push(self, cursor, changes):
+        """Apply a client's changes made since cursor, returns {'results', 'ids'}
+
+        results has one {'table', 'id', 'status'} per change, status being
+        'applied', 'merged' (with the 'kept' server fields), 'conflict' or
+        'rejected' (both with a 'reason'). ids maps each table's new client ids
+        (as strings, like JSON object keys) to the server ids.
+        """
+        if not isinstance(changes, list):
+            raise ValueError("changes must be a list")
+        if len(changes) > MAX_PUSH_CHANGES:
+            raise ValueError(f"At most {MAX_PUSH_CHANGES} changes can be pushed at once")
+
+        ids = {table: {} for table in SYNC_TABLES}
+        # (table, id) -> seq of this push's last change to the row, so a later
+        # change to it is not taken for a change made on the server
+        pushed = {}
+        results = []
+        with transaction(self.conn):
+            seq = self.change_log.last_seq()
+            for change in changes:
+                # Like the desktop writer: a failing change does not undo the others
+                self.conn.execute('SAVEPOINT sync_change')
+                try:
+                    result = self.apply(change, cursor, ids, pushed)
+                except (ValueError, TypeError, sqlite3.IntegrityError) as e:
+                    self.conn.execute('ROLLBACK TO sync_change')
+                    result = {'status': 'rejected', 'reason': str(e)}
+                else:
+                    seq = self.note_pushed(seq, pushed)
+                self.conn.execute('RELEASE sync_change')
+                if isinstance(change, dict):
+                    result = {'table': change.get('table'), 'id': change.get('id'), **result}
+                results.append(result)
+        self.change_log.snapshot_if_due()
+
+        return {'results': results,
+                'ids': {table: {str(client): server for client, server in mapped.items()}
+                        for table, mapped in ids.items() if mapped}}
+
+    def note_pushed(self, seq, pushed):
+        """Record the seq of each row's last change after seq in pushed, returns the last seq"""
+        while True:
+            rows, seq, full = self.change_log.latest_changes(seq, CHANGE_PAGE_SIZE)
+            for table, row_id, row_seq, _ in rows:
+                pushed[(table, row_id)] = row_seq
+            if not full:
+                return seq
+
+    def apply(self, change, cursor, ids, pushed):
+        """Apply one pushed change, returns its result (without the table and id)"""
+        if not isinstance(change, dict):
+            raise ValueError("A change must be an object")
+        table, op, row_id = change.get('table'), change.get('op'), change.get('id')
+        if table not in SYNC_TABLES:
+            raise ValueError(f"Unknown table: {table!r}")
+        operations, fields = SYNC_TABLES[table]
+        if op not in operations:
+            raise ValueError(f"{op!r} is not allowed on {table}")
+        if not isinstance(row_id, int) or isinstance(row_id, bool):
+            raise ValueError("id must be a number")
+        data = change.get('data') or {}
+        if not isinstance(data, dict):
+            raise ValueError("data must be an object")
+        unknown = sorted(set(data) - set(fields))
+        if unknown:
+            raise ValueError(f"{table} cannot set {', '.join(unknown)}")
+        if any(isinstance(value, (list, dict)) for value in data.values()):
+            raise ValueError("Field values must be text or numbers")
+        data = CLEANERS[table](self.resolve_references(data, ids))
+
+        if op == 'insert':
+            if row_id >= 0:
+                raise ValueError("New rows need a negative client id")
+            if row_id in ids[table]:
+                raise ValueError(f"Client id {row_id} is used twice")
+            if table == 'credit_transactions':
+                product = self.products.get(data['product_id'])
+                if product is None:
+                    raise ValueError(f"Product {data['product_id']} does not exist")
+                status = dict(zip(PRODUCT_ROW_FIELDS, product))['status']
+                if status != 'In Stock':
+                    return {'status': 'conflict', 'reason': f"Product {data['product_id']} is {status}"}
+            ids[table][row_id] = self.insert(table, data)
+            return {'status': 'applied'}
+
+        row_id = ids[table].get(row_id, row_id)
+        base = change.get('base_version', cursor)
+        if not isinstance(base, int) or isinstance(base, bool) or base < 0:
+            raise ValueError("base_version must be a positive number")
+        base = max(base, pushed.get((table, row_id), 0))
+        if op == 'update':
+            return self.update_product(row_id, data, base)
+        return self.delete_product(row_id, base)
+
+    def resolve_references(self, data, ids):
+        """Replace the negative ids of rows created in this push by their server ids"""
+        resolved = dict(data)
+        for field, table in REFERENCES.items():
+            value = resolved.get(field)
+            if isinstance(value, int) and value < 0:
+                if value not in ids[table]:
+                    raise ValueError(f"{field} {value} is not a row created earlier in this push")
+                resolved[field] = ids[table][value]
+        return resolved
+
+    def insert(self, table, data):
+        """Insert a new (cleaned) row through the repositories, returns its id"""
+        if table == 'products':
+            if not data.get('name'):
+                raise ValueError("Product name is required")
+            # Missing fields get the values the product form and imports store
+            product = dict.fromkeys(PRICE_FIELDS, 0.0)
+            product.update(data)
+            product.setdefault('status', 'In Stock')
+            product['arrival_date'] = product.get('arrival_date') or datetime.now().strftime("%Y-%m-%d")
+            return self.products.add(product)
+
+        if table == 'credit_transactions':
+            # A credit sale, so the product is reserved (or sold when nothing remains) as in the app
+            return self.credits.create_sale(data['product_id'], data['customer_name'],
+                                            data['amount_paid'] + data['amount_remaining'], data['amount_paid'],
+                                            data['transaction_date'])
+
+        return self.credits.add_payment(data['credit_id'], data['amount'], data['payment_date'])
+
+    def update_product(self, product_id, data, base):
+        """Apply an update made on top of version base, merging with the server's changes since"""
+        current = self.products.get(product_id)
+        if current is None:
+            return {'status': 'conflict', 'reason': f"Product {product_id} no longer exists"}
+        current = dict(zip(PRODUCT_ROW_FIELDS, current))
+
+        kept = []
+        if self.change_log.row_version('products', product_id) > base:
+            # Changed on both sides: a field the server changed since base keeps the
+            # server's value. Without the row as of base, every field counts as changed.
+            original = self.change_log.row_at('products', product_id, base) or {}
+            changed = {field for field in data if field not in original or original[field] != current[field]}
+            kept = sorted(field for field in changed if data[field] != current[field])
+            data = {field: value for field, value in data.items() if field not in changed}
+            if not data and kept:
+                return {'status': 'conflict', 'reason': "Every field was changed on the server",
+                        'kept': kept}
+            if not data:
+                # The server already has the client's values
+                return {'status': 'applied'}
+
+        current.update(data)
+        self.products.update(product_id, current)
+        if kept:
+            return {'status': 'merged', 'kept': kept}
+        return {'status': 'applied'}
+
+    def delete_product(self, product_id, base):
+        """Delete a product the server has not changed since version base"""
+        if self.products.get(product_id) is None:
+            # Already gone: the client and server agree
+            return {'status': 'applied'}
+        if self.change_log.row_version('products', product_id) > base:
+            return {'status': 'conflict', 'reason': "The product was changed on the server"}
+        # Foreign keys refuse to delete a product that has credits (IntegrityError)
+        self.products.delete(product_id)
+        return {'status': 'applied'}
+
+
+def clean_product(data):
+    """Return pushed product fields checked and converted as product_import.validate_row does"""
+    product = {}
+    for field, value in data.items():
+        if field in PRICE_FIELDS:
+            product[field] = parse_number(value, field)
+            if product[field] < 0:
+                raise ValueError(f"{field} cannot be negative")
+        elif field in DATE_FIELDS:
+            product[field] = parse_date(value, field)
+        elif field == 'status':
+            product[field] = STATUS_LOOKUP.get(str(value or '').strip().lower())
+            if product[field] is None:
+                raise ValueError(f"status must be one of {', '.join(PRODUCT_STATUSES)}: {value!r}")
+        else:
+            product[field] = str(value).strip() if value is not None else ''
+    if 'name' in product and not product['name']:
+        raise ValueError("Product name is required")
+    return product
+
+
+def clean_credit(data):
+    """Return a pushed credit checked and converted, every field being required but the date"""
+    credit = {'product_id': require_id(data, 'product_id'),
+              'customer_name': str(data.get('customer_name') or '').strip(),
+              'transaction_date': parse_time(data.get('transaction_date'), 'transaction_date')}
+    if not credit['customer_name']:
+        raise ValueError("customer_name is required")
+    for field in ('amount_paid', 'amount_remaining'):
+        credit[field] = require_amount(data, field)
+    return credit
+
+
+def clean_payment(data):
+    """Return a pushed payment checked and converted"""
+    payment = {'credit_id': require_id(data, 'credit_id'), 'amount': require_amount(data, 'amount'),
+               'payment_date': parse_time(data.get('payment_date'), 'payment_date')}
+    if payment['amount'] <= 0:
+        raise ValueError("Payment amount must be positive")
+    return payment
+
+
+def require_id(data, field):
+    """Return the id of another row given by a field"""
+    value = data.get(field)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"{field} must be a row id")
+    return value
+
+
+def require_amount(data, field):
+    """Return a money amount that must be given and cannot be negative"""
+    if data.get(field) is None or data.get(field) == '':
+        raise ValueError(f"{field} is required")
+    amount = parse_number(data[field], field)
+    if amount < 0:
+        raise ValueError(f"{field} cannot be negative")
+    return amount
+
+
+def parse_time(value, field):
+    """Return a time as stored for credits and payments, or None (now) when not given"""
+    if value is None or value == '':
+        return None
+    try:
+        return datetime.fromisoformat(str(value).strip()).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise ValueError(f"{field} must be a 'YYYY-MM-DD HH:MM:SS' time: {value!r}")
+
+
+# Checks and conversions of the pushed fields of each table
+CLEANERS = {'products': clean_product, 'credit_transactions': clean_credit, 'credit_payments': clean_payment}
+
+
+def decode(data):
+    """Return a change log row image as a dict (None for a deleted row)"""
+    return None if data is None else json.loads(data)
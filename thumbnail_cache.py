@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Thumbnail Cache for Product Manager
+Keeps resized product and package images on disk, named by a hash of the
+image content, with a small in-memory LRU tier in front of it
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Size of the thumbnails shown in the product details window
+THUMBNAIL_SIZE = (300, 300)
+
+# Directory holding the cached thumbnails, next to the product databases
+CACHE_DIR = '.thumbnails'
+
+# Oldest thumbnails are removed once the cache directory grows past this size
+MAX_DISK_BYTES = 50 * 1024 * 1024
+
+# Number of decoded thumbnails kept in memory
+MAX_MEMORY_ITEMS = 64
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir=CACHE_DIR, size=THUMBNAIL_SIZE,
+                 max_disk_bytes=MAX_DISK_BYTES, max_memory_items=MAX_MEMORY_ITEMS):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_items = max_memory_items
+
+        # Both maps are keyed by (path, mtime, file size), so an edited image
+        # gets a new key and is hashed and resized again
+        self.memory = OrderedDict()
+        self.digests = {}
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """Return the thumbnail for the image at path as a PIL image"""
+        key = self.file_key(path)
+
+        with self.lock:
+            image = self.memory.get(key)
+            if image is not None:
+                self.memory.move_to_end(key)
+                return image
+
+        thumbnail_path = self.thumbnail_path(self.content_digest(key))
+        if os.path.exists(thumbnail_path):
+            # PIL is imported on first use, it is the slowest import of the app's startup
+            from PIL import Image
+            image = Image.open(thumbnail_path)
+            image.load()
+            # Touch the file so disk pruning removes the least recently used first
+            os.utime(thumbnail_path)
+        else:
+            image = self.create_thumbnail(path, thumbnail_path)
+
+        with self.lock:
+            self.memory[key] = image
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_memory_items:
+                self.memory.popitem(last=False)
+
+        return image
+
+    def file_key(self, path):
+        """Return the cache key for an image file: its path, mtime and size"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    def content_digest(self, key):
+        """Return the SHA-256 of the image file, computed once per file version"""
+        with self.lock:
+            digest = self.digests.get(key)
+        if digest is not None:
+            return digest
+
+        sha = hashlib.sha256()
+        with open(key[0], 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        with self.lock:
+            self.digests[key] = digest
+        return digest
+
+    def thumbnail_path(self, digest):
+        """Return the on-disk location of the thumbnail for a content digest"""
+        width, height = self.size
+        return os.path.join(self.cache_dir, f"{digest}_{width}x{height}.png")
+
+    def create_thumbnail(self, path, thumbnail_path):
+        """Decode and resize the original image and store the result on disk"""
+        from PIL import Image
+        image = Image.open(path)
+        image.thumbnail(self.size, Image.Resampling.LANCZOS)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'P'):
+            image = image.convert('RGB')
+
+        # Write to a temporary name first so readers never see a partial file
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f"{thumbnail_path}.{threading.get_ident()}.tmp"
+        image.save(temp_path, 'PNG')
+        os.replace(temp_path, thumbnail_path)
+
+        self.prune()
+        return image
+
+    def prune(self):
+        """Delete the least recently used thumbnails while the cache is over its size cap"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.png'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    # Removed by another worker pruning at the same time
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            total -= size
@@ -7,11 +7,42 @@ Handles multiple users with separate data
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import sqlite3
+from db_connection import connect
+from repository import product_db_filename
+from shared_storage import (SHARED_DB_FILENAME, delete_user_data, open_shared_database,
+                            shared_storage_enabled)
 import json
 import os
 from datetime import datetime
 
+# Users fetched per page when scrolling the user list
+USER_PAGE_SIZE = 50
+
+# Delay after the last keystroke before the user filter runs (ms)
+FILTER_DELAY_MS = 150
+
 class UserManager:
+    # Most recent logins first, users who never logged in last, read in that order
+    # from idx_users_last_login. ?1 is a LIKE pattern matched against the user's
+    # names and location ('' shows everyone); later pages continue after the
+    # (last login, id) of the last user shown.
+    FIRST_PAGE_SQL = '''
+        SELECT id, username, full_name, location, business_name, IFNULL(last_login, '')
+        FROM users
+        WHERE (?1 = '' OR username LIKE ?1 ESCAPE '\\' OR full_name LIKE ?1 ESCAPE '\\'
+               OR location LIKE ?1 ESCAPE '\\' OR business_name LIKE ?1 ESCAPE '\\')
+        ORDER BY IFNULL(last_login, '') DESC, id DESC LIMIT ?2
+    '''
+    PAGE_SQL = '''
+        SELECT id, username, full_name, location, business_name, IFNULL(last_login, '')
+        FROM users
+        WHERE (?1 = '' OR username LIKE ?1 ESCAPE '\\' OR full_name LIKE ?1 ESCAPE '\\'
+               OR location LIKE ?1 ESCAPE '\\' OR business_name LIKE ?1 ESCAPE '\\')
+          AND (IFNULL(last_login, ''), id) < (?2, ?3)
+        ORDER BY IFNULL(last_login, '') DESC, id DESC LIMIT ?4
+    '''
+    GET_SQL = 'SELECT * FROM users WHERE id=?'
+    
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Product Manager - User Selection")
@@ -39,7 +70,7 @@ class UserManager:
     
     def init_users_db(self):
         """Initialize users database"""
-        self.conn = sqlite3.connect('users.db')
+        self.conn = connect('users.db')
         self.cursor = self.conn.cursor()
         
         self.cursor.execute('''
@@ -54,6 +85,8 @@ class UserManager:
                 last_login TEXT
             )
         ''')
+        # Serves the user list, which is ordered by last login
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_last_login ON users (IFNULL(last_login, ''))")
         
         self.conn.commit()
     
@@ -79,14 +112,32 @@ class UserManager:
         selection_frame = ttk.LabelFrame(main_frame, text="Select User", padding=20)
         selection_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Users listbox
-        self.users_listbox = tk.Listbox(selection_frame, height=8, font=("Arial", 11))
-        self.users_listbox.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
-        self.users_listbox.bind('<Double-1>', self.login_user)
+        # Filter box (matches usernames, names, locations and businesses as you type)
+        filter_frame = ttk.Frame(selection_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="Find:").pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar()
+        filter_entry = ttk.Entry(filter_frame, textvariable=self.filter_var)
+        filter_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        filter_entry.bind('<KeyRelease>', self.on_filter_key)
+        self.filter_job = None
         
         # Buttons frame
         buttons_frame = ttk.Frame(selection_frame)
-        buttons_frame.pack(fill=tk.X)
+        buttons_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # Users listbox; user_ids[i] is the id of the user on line i
+        self.user_ids = []
+        list_frame = ttk.Frame(selection_frame)
+        list_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        self.users_listbox = tk.Listbox(list_frame, height=8, font=("Arial", 11))
+        self.users_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.users_listbox.bind('<Double-1>', self.login_user)
+        
+        # Scrollbar (fetches the next page when the end of the list comes into view)
+        self.users_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.users_listbox.yview)
+        self.users_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.users_listbox.configure(yscrollcommand=self.on_users_scroll)
         
         ttk.Button(buttons_frame, text="Login", command=self.login_user).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(buttons_frame, text="New User", command=self.create_new_user).pack(side=tk.LEFT, padx=5)
@@ -103,23 +154,88 @@ class UserManager:
         info_label.pack()
     
     def load_users(self):
-        """Load users into the listbox"""
+        """Load the first page of users into the listbox"""
         self.users_listbox.delete(0, tk.END)
+        self.user_ids = []
+        
+        # Keyset pagination state: users are loaded after the last one shown
+        self.last_user = None
+        self.users_exhausted = False
+        self.users_page_pending = False
+        
+        self.load_more_users()
+    
+    def load_more_users(self):
+        """Fetch the next page of users matching the filter"""
+        self.users_page_pending = False
+        if self.users_exhausted:
+            return
         
-        self.cursor.execute('SELECT username, full_name, location, business_name, last_login FROM users ORDER BY last_login DESC')
-        users = self.cursor.fetchall()
+        text = self.filter_var.get().strip()
+        pattern = ''
+        if text:
+            # Match anywhere, with LIKE's wildcards taken literally
+            pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        
+        if self.last_user is None:
+            users = self.conn.execute(self.FIRST_PAGE_SQL, (pattern, USER_PAGE_SIZE)).fetchall()
+        else:
+            users = self.conn.execute(self.PAGE_SQL, (pattern, self.last_user[5], self.last_user[0],
+                                                      USER_PAGE_SIZE)).fetchall()
         
         for user in users:
-            username, full_name, location, business_name, last_login = user
-            display_name = f"{username}"
-            if full_name:
-                display_name += f" ({full_name})"
-            if location:
-                display_name += f" - {location}"
-            if business_name:
-                display_name += f" | {business_name}"
-            
-            self.users_listbox.insert(tk.END, display_name)
+            self.users_listbox.insert(tk.END, self.display_name(user))
+            self.user_ids.append(user[0])
+        
+        if users:
+            self.last_user = users[-1]
+        if len(users) < USER_PAGE_SIZE:
+            self.users_exhausted = True
+    
+    def on_users_scroll(self, first, last):
+        """Keep the scrollbar in sync and load another page near the end of the list"""
+        self.users_scrollbar.set(first, last)
+        if float(last) >= 0.9 and not self.users_exhausted and not self.users_page_pending:
+            # Defer the fetch so we don't insert lines from inside the scroll callback
+            self.users_page_pending = True
+            self.root.after_idle(self.load_more_users)
+    
+    def on_filter_key(self, event=None):
+        """Reload the user list once typing pauses"""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(FILTER_DELAY_MS, self.filter_users)
+    
+    def filter_users(self):
+        """Show the users matching the filter box"""
+        self.filter_job = None
+        self.load_users()
+    
+    def display_name(self, user):
+        """Return the listbox line for an (id, username, full_name, location, business_name, ...) row"""
+        user_id, username, full_name, location, business_name = user[:5]
+        display_name = f"{username}"
+        if full_name:
+            display_name += f" ({full_name})"
+        if location:
+            display_name += f" - {location}"
+        if business_name:
+            display_name += f" | {business_name}"
+        return display_name
+    
+    def selected_user(self, action):
+        """Return the users row of the selected user, or None after telling the user why not"""
+        selection = self.users_listbox.curselection()
+        if not selection:
+            messagebox.showerror("Error", f"Please select a user to {action}!")
+            return None
+        
+        # Looked up by id, so the row is right even if the list order changed since it was loaded
+        user = self.conn.execute(self.GET_SQL, (self.user_ids[selection[0]],)).fetchone()
+        if user is None:
+            messagebox.showerror("Error", "This user no longer exists!")
+            self.load_users()
+        return user
     
     def create_new_user(self):
         """Create a new user"""
@@ -150,15 +266,10 @@ class UserManager:
     
     def edit_user(self):
         """Edit selected user"""
-        selection = self.users_listbox.curselection()
-        if not selection:
-            messagebox.showerror("Error", "Please select a user to edit!")
-            return
-        
         # Get user data
-        self.cursor.execute('SELECT * FROM users ORDER BY last_login DESC')
-        users = self.cursor.fetchall()
-        user = users[selection[0]]
+        user = self.selected_user("edit")
+        if user is None:
+            return
         
         # Create edit dialog with existing data
         dialog = UserDialog(self.root, "Edit User", user)
@@ -185,25 +296,30 @@ class UserManager:
     
     def delete_user(self):
         """Delete selected user"""
-        selection = self.users_listbox.curselection()
-        if not selection:
-            messagebox.showerror("Error", "Please select a user to delete!")
+        user = self.selected_user("delete")
+        if user is None:
             return
-        
-        self.cursor.execute('SELECT username FROM users ORDER BY last_login DESC')
-        users = self.cursor.fetchall()
-        username = users[selection[0]][0]
+        username = user[1]
         
         if messagebox.askyesno("Confirm Delete", 
-                              f"Are you sure you want to delete user '{username}'?\n\nThis will also delete all their product data!"):
+                              f"Are you sure you want to delete user '{username}'?\n\nThis will also delete all their products, credits and payments!"):
             try:
-                # Delete user data file
-                db_file = f"products_{username}.db"
-                if os.path.exists(db_file):
-                    os.remove(db_file)
+                if shared_storage_enabled():
+                    # Delete the user's rows of the shared database
+                    if os.path.exists(SHARED_DB_FILENAME):
+                        conn = open_shared_database()
+                        try:
+                            delete_user_data(conn, user[0])
+                        finally:
+                            conn.close()
+                else:
+                    # Delete user data file
+                    db_file = product_db_filename(username)
+                    if os.path.exists(db_file):
+                        os.remove(db_file)
                 
                 # Delete user from users table
-                self.cursor.execute('DELETE FROM users WHERE username=?', (username,))
+                self.cursor.execute('DELETE FROM users WHERE id=?', (user[0],))
                 self.conn.commit()
                 
                 messagebox.showinfo("Success", f"User '{username}' deleted successfully!")
@@ -214,15 +330,10 @@ class UserManager:
     
     def login_user(self, event=None):
         """Login selected user"""
-        selection = self.users_listbox.curselection()
-        if not selection:
-            messagebox.showerror("Error", "Please select a user to login!")
+        user = self.selected_user("login")
+        if user is None:
             return
         
-        self.cursor.execute('SELECT * FROM users ORDER BY last_login DESC')
-        users = self.cursor.fetchall()
-        user = users[selection[0]]
-        
         # Update last login
         self.cursor.execute('UPDATE users SET last_login=? WHERE id=?', 
                            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user[0]))